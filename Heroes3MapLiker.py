@@ -1,10 +1,18 @@
 # /Heroes3MapLiker.py
 
+import sys
+import time
+startup_marks: list = [("start", time.perf_counter())] # (step, time) for the startup timing report
+
 import tkinter as tk
-from PIL import Image, ImageTk
+from PIL import ImageTk
 from typing import Dict
 import os
 from display_gui import display_gui
+from icon_atlas import IconAtlas
+from image_decode import decode_resized
+import perf_trace
+startup_marks.append(("imports", time.perf_counter()))
 
 SCREEN_WIDTH: int = 1100
 SCREEN_HEIGHT: int = 720
@@ -13,53 +21,51 @@ IMAGE_WIDTH: int = 300
 IMAGE_HEIGHT: int = 300
 SPACING_X: int = 20
 SPACING_Y: int = 20
-root = tk.Tk()
-root.title("Heroes 3 Map Liker")
 assets_directory = "assets"
 map_images_dir = os.path.join(assets_directory, "map_images")
 
-def set_window_icon():
+def set_window_icon(root):
     """
     Set the icon for the Tkinter GUI window.
 
-    Opens an image file specified by `icon_path`, resizes it to (32, 32) if necessary, 
+    Decodes the icon image straight to (32, 32), closing the file once done,
     and sets it as the window icon.
 
     Args:
-        icon_path (str): The file path to the icon image.
+        root (Tk): the GUI Window
 
     Returns:
         None
     """
-    icon_path = Image.open("assets/view_earth.png")  # Open the image
-    icon_path = icon_path.resize((32, 32))  # Resize the image if required
-    icon = ImageTk.PhotoImage(icon_path)  # Convert the image to a PhotoImage
+    with decode_resized("assets/view_earth.png", 32, 32) as icon_image:
+        icon = ImageTk.PhotoImage(icon_image)  # Convert the image to a PhotoImage
     root.iconphoto(False, icon) # set as software window icon
 
 def load_asset_images(directory: str) -> Dict[str, ImageTk.PhotoImage]:
     """
-    Load all asset images from a directory, resize them to (32, 32), and return a dictionary of PhotoImage objects.
+    Icons of a directory at (32, 32) by filename (without extension). They come from one sprite atlas
+    of all the icons, built the first time, and each becomes a PhotoImage only when it is first used.
 
     Args:
         directory (str): The directory path containing the images.
 
     Returns:
-        dict: A dictionary containing PhotoImage objects with filenames (without extension) as keys.
+        dict: icon name -> PhotoImage, an IconAtlas
+    """
+    return IconAtlas(directory)
+
+def report_startup():
+    """
+    Print how long each startup step took, from the start of the program to the window being painted
+
+    Returns:
+        None
     """
-    photo_images = {}
-    for filename in os.listdir(directory):
-        if filename.endswith(('.png', '.gif', '.jpg', '.jpeg')):
-            path = os.path.join(directory, filename)
-            try:
-                name = os.path.splitext(filename)[0]  # Extract filename without extension
-                image = Image.open(path)  # Load the image
-                image = image.resize((32, 32))  # Resize the image
-                photo_images[name] = ImageTk.PhotoImage(image)  # Load image and store it in the dictionary
-            except Exception as e:
-                print(f"Error loading image {path}: {e}")
-    return photo_images
-
-photo_images: Dict[str, ImageTk.PhotoImage] = load_asset_images(assets_directory)
+    startup_marks.append(("first paint", time.perf_counter()))
+    for (_, previous), (step, mark) in zip(startup_marks, startup_marks[1:]):
+        perf_trace.record(f"startup.{step}", previous, mark - previous)
+    steps = ", ".join(f"{step} {(mark - previous) * 1000:.0f} ms" for (_, previous), (step, mark) in zip(startup_marks, startup_marks[1:]))
+    print(f"Startup {(startup_marks[-1][1] - startup_marks[0][1]) * 1000:.0f} ms: {steps}")
 
 def create_directories_if_missing():
     """
@@ -71,8 +77,26 @@ def create_directories_if_missing():
     if not os.path.exists(map_images_dir):
         os.makedirs(map_images_dir)
 
-set_window_icon()
-create_directories_if_missing()
-display_gui(root, SCREEN_WIDTH, SCREEN_HEIGHT, COLS, IMAGE_WIDTH, IMAGE_HEIGHT, SPACING_X, SPACING_Y, map_images_dir, photo_images)
+def main():
+    """
+    Open the GUI window, the window is only created here so importing this module needs no display,
+    batch jobs without a display use map_cli.py. Run with --trace trace.json to write a Chrome trace on exit.
+
+    Returns:
+        None
+    """
+    if "--trace" in sys.argv[1:-1]:
+        perf_trace.enable(sys.argv[sys.argv.index("--trace") + 1])
+    root = tk.Tk()
+    root.title("Heroes 3 Map Liker")
+    photo_images: Dict[str, ImageTk.PhotoImage] = load_asset_images(assets_directory)
+    startup_marks.append(("icons", time.perf_counter()))
+    set_window_icon(root)
+    create_directories_if_missing()
+    display_gui(root, SCREEN_WIDTH, SCREEN_HEIGHT, COLS, IMAGE_WIDTH, IMAGE_HEIGHT, SPACING_X, SPACING_Y, map_images_dir, photo_images)
+    startup_marks.append(("gui", time.perf_counter()))
+    root.after_idle(report_startup) # idle callbacks run after Tk has drawn the window
+    root.mainloop()
 
-root.mainloop()
+if __name__ == '__main__':
+    main()
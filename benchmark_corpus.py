@@ -0,0 +1,208 @@
+# /benchmark_corpus.py
+
+import os
+import json
+import random
+import threading
+import urllib.parse
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image, ImageDraw
+from map_catalogue import catalogue_key
+
+# synthetic map corpora for benchmarks.py: map images at Heroes 3 map resolutions and a List_of_maps page
+# in the wiki's layout, served by CorpusServer so rescans can be timed without the real site
+
+TILE_PIXELS: int = 4 # image pixels per map tile
+MAP_TILES: dict = {"S": 36, "M": 72, "L": 108, "XL": 144, "H": 180, "XH": 216, "G": 252} # map width in tiles per map size
+SIZE_ICONS: dict = {"S": "sz0_s", "M": "sz1_m", "L": "sz2_l", "XL": "sz3_xl", "H": "sz4_h", "XH": "sz5_xh", "G": "sz6_g"}
+SIZE_WEIGHTS: dict = {"S": 15, "M": 30, "L": 25, "XL": 18, "H": 6, "XH": 4, "G": 2} # roughly how common each size is
+EXPANSIONS: list = ["roe", "ab", "sod", "hota"]
+DIFFICULTIES: list = ["easy", "normal", "hard", "expert", "impossible"]
+VICTORIES: list = ["standard", "artifact", "monster", "survivetime", "buildgrail", "allmonsters", "transport", "creatures",
+                   "capturecity", "flagdwellings", "buildcity", "resources", "hero", "flagmines"]
+LOSSES: list = ["standard", "hero", "town", "timeexpires"]
+TERRAINS: list = [(0, 64, 160), (0, 112, 0), (128, 96, 48), (208, 192, 128), (200, 40, 0), (232, 232, 240),
+                  (64, 80, 48), (96, 96, 96), (48, 48, 48)] # water, grass, dirt, sand, lava, snow, swamp, rough, rock
+NAME_WORDS: list = ["Dragon", "Treasure", "Isle", "Islands", "Kingdom", "War", "Lords", "Titans", "Winter", "Orb", "Crypt",
+                    "Valley", "Desert", "Frontier", "Empire", "Shadow", "Golden", "Lost", "Crown", "Storm", "Pandora",
+                    "Arrogance", "Hunt", "Realm", "Peaks", "Swamp", "Rebellion", "Alliance", "Legacy", "Dungeon"]
+CORPUS_FILENAME: str = "corpus.json"
+
+def corpus_maps(count: int, seed: int = 0) -> dict:
+    """
+    Catalogue of a synthetic corpus, the same for the same count and seed
+
+    Args:
+        count (int): number of maps
+        seed (int): random seed
+
+    Returns:
+        dict: map name -> catalogue entry without page_url, see map_catalogue.parse_map_row
+    """
+    rng = random.Random(seed)
+    maps: dict = {}
+    while len(maps) < count:
+        name = " ".join(rng.sample(NAME_WORDS, rng.randint(1, 3))) + f" {len(maps) + 1}"
+        maps[name] = {"size": rng.choices(list(SIZE_WEIGHTS), weights=list(SIZE_WEIGHTS.values()))[0],
+                      "expansion": rng.choice(EXPANSIONS), "difficulty": rng.choice(DIFFICULTIES),
+                      "victory": sorted(set(["standard"] + rng.sample(VICTORIES, rng.randint(0, 2)))),
+                      "loss": rng.sample(LOSSES, rng.randint(1, 2)), "players": f"{rng.randint(2, 8)}/{rng.randint(0, 4)}",
+                      "subterranean": rng.random() < 0.4}
+    return maps
+
+def image_filename(map_name: str) -> str:
+    """
+    Returns:
+        str: file name the rescan saves a map's image under e.g. Dragon_Isle_3_map_auto.png
+    """
+    return map_name.replace(" ", "_") + "_map_auto.png"
+
+def draw_map(map_name: str, entry: dict, path: str):
+    """
+    Draw a map image, terrain patches on a base terrain at the resolution of the map's size
+
+    Returns:
+        None
+    """
+    rng = random.Random(map_name)
+    side = MAP_TILES[entry["size"]] * TILE_PIXELS
+    image = Image.new("RGB", (side, side), rng.choice(TERRAINS))
+    draw = ImageDraw.Draw(image)
+    for _ in range(24 + side // 16):
+        x, y = rng.randrange(side), rng.randrange(side)
+        radius = rng.randint(side // 40 + 1, side // 6 + 2)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=rng.choice(TERRAINS))
+    image.save(path, format="PNG")
+
+def generate_corpus(directory: str, count: int, seed: int = 0, progress_callback=None) -> dict:
+    """
+    Write the map images of a synthetic corpus to a folder, images already there are kept so a
+    corpus folder can be re-used between benchmark runs
+
+    Args:
+        directory (str): corpus folder, created if missing
+        count (int): number of maps
+        seed (int): random seed
+        progress_callback: called with a status text every 100 maps
+
+    Returns:
+        dict: map name -> catalogue entry, also saved as CORPUS_FILENAME in the folder
+    """
+    os.makedirs(directory, exist_ok=True)
+    maps = corpus_maps(count, seed)
+    for i, (map_name, entry) in enumerate(maps.items(), 1):
+        path = os.path.join(directory, image_filename(map_name))
+        if not os.path.isfile(path):
+            draw_map(map_name, entry, path)
+        if progress_callback and (i % 100 == 0 or i == count):
+            progress_callback(f"Corpus progress: {i}/{count}")
+    with open(os.path.join(directory, CORPUS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(maps, f)
+    return maps
+
+def list_of_maps_html(maps: dict) -> str:
+    """
+    List_of_maps page for a corpus, in the table layout map_catalogue.parse_catalogue reads
+
+    Returns:
+        str: HTML
+    """
+    icon = lambda name: f'<img src="/images/thumb/0/00/{name.capitalize()}.gif/20px-{name.capitalize()}.gif">'
+    rows = ['<tr><th>Size</th><th>Map</th><th>Players</th><th>Levels</th><th>Victory</th><th>Loss</th><th>Difficulty</th><th>Version</th></tr>']
+    for map_name, entry in maps.items():
+        slug = urllib.parse.quote(map_name.replace(" ", "_"))
+        rows.append("<tr>"
+                    f'<td style="text-align:center;">{icon(SIZE_ICONS[entry["size"]])}</td>'
+                    f'<td style="text-align:center;"><a href="/index.php/{slug}" title="{escape(map_name)}">{escape(map_name)}</a></td>'
+                    f'<td>{entry["players"]}</td><td>{2 if entry["subterranean"] else 1}</td>'
+                    f'<td>{" ".join(icon("vc_" + victory) for victory in entry["victory"])}</td>'
+                    f'<td>{" ".join(icon("ls_" + loss) for loss in entry["loss"])}</td>'
+                    f'<td>{icon("dif_" + entry["difficulty"])}</td><td>{icon("v_" + entry["expansion"])}</td></tr>')
+    return '<table class="wikitable sortable">' + "".join(rows) + "</table>"
+
+class CorpusServer:
+    """
+    Local HTTP server standing in for the map website with a corpus: the List_of_maps page, the
+    imageinfo API, map pages and the images from the corpus folder, answering 304 to matching ETags.
+    Counts requests and bytes sent so benchmarks can report throughput.
+    """
+    def __init__(self, directory: str, maps: dict):
+        """
+        Args:
+            directory (str): corpus folder from generate_corpus
+            maps (dict): corpus catalogue from generate_corpus
+        """
+        self.directory = directory
+        self.list_page = list_of_maps_html(maps).encode()
+        self.files: dict = {catalogue_key(map_name): image_filename(map_name) for map_name in maps}
+        self.requests: int = 0
+        self.bytes_sent: int = 0
+        self.lock = threading.Lock()
+        corpus = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real site
+
+            def do_GET(self):
+                status, headers, body = corpus.respond(self)
+                if status == 200 and headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with corpus.lock:
+                    corpus.requests += 1
+                    corpus.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def respond(self, request) -> tuple:
+        """
+        Returns:
+            tuple: (status, headers, body) for a request
+        """
+        parts = urllib.parse.urlsplit(request.path)
+        path = urllib.parse.unquote(parts.path)
+        if path == "/index.php/List_of_maps":
+            return 200, {"Content-Type": "text/html", "ETag": '"corpus"'}, self.list_page
+        if path == "/api.php":
+            titles = urllib.parse.parse_qs(parts.query)["titles"][0].split("|")
+            pages = []
+            for title in titles:
+                filename = self.files.get(catalogue_key(title[len("File:"):-len("_map_auto.png")]))
+                page = {"title": title.replace("_", " ")}
+                page.update({"imageinfo": [{"url": "/images/a/ab/" + urllib.parse.quote(filename)}]} if filename else {"missing": True})
+                pages.append(page)
+            normalized = [{"from": title, "to": title.replace("_", " ")} for title in titles]
+            return 200, {"Content-Type": "application/json"}, json.dumps({"query": {"normalized": normalized, "pages": pages}}).encode()
+        if path.startswith("/index.php/"):
+            filename = self.files.get(catalogue_key(path[len("/index.php/"):]))
+            if filename:
+                url = "/images/thumb/a/ab/" + urllib.parse.quote(filename) + "/300px-" + urllib.parse.quote(filename)
+                return 200, {"Content-Type": "text/html"}, f'<img alt="" src="{url}">'.encode()
+        if path.startswith("/images/a/ab/"):
+            filename = os.path.basename(path)
+            try:
+                with open(os.path.join(self.directory, filename), "rb") as f:
+                    return 200, {"Content-Type": "image/png", "ETag": f'"{filename}"'}, f.read()
+            except OSError:
+                pass
+        return 404, {}, b"not found"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
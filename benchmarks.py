@@ -0,0 +1,549 @@
+# /benchmarks.py
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import platform
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import unittest.mock
+from PIL import Image, ImageDraw
+import download_images
+from map_grid import MapGrid
+from icon_atlas import IconAtlas
+from map_filters import FilterIndex, FILTER_KEYS
+from map_search import SearchIndex
+from map_library import MapLibrary, list_map_paths
+from map_catalogue import parse_catalogue, map_name_from_filename
+import image_decode
+from benchmark_corpus import generate_corpus, list_of_maps_html, CorpusServer
+import perf_trace
+
+LAYOUT_SIZES: list = [100, 1000, 10000, 100000]
+CORPUS_SIZES: list = [100, 1000] # 10000 works too, generating it the first time takes a few minutes
+CELL_COUNTS: list = [100, 1000, 5000]
+CORPUS_SUITES: list = ["scan", "thumbs", "filters", "search"] # run on the synthetic corpora
+SUITES: list = ["layout", "cells", "startup", "memory"] + CORPUS_SUITES
+MEMORY_IMAGE_SIZES: list = [2048, 4096] # sides of the large map images decoded by the memory benchmark
+THUMBNAIL_SIZE: int = 300 # the grid's default image size
+REGRESSION_TOLERANCE: float = 1.25 # a time this many times the baseline's is a regression
+REGRESSION_MIN_MS: float = 1.0 # times below this are too noisy to compare
+STARTUP_ICONS: list = ["book_closed", "star", "name_descending", "name_ascending", "subterranean", "v_roe", "v_ab", "v_sod",
+                       "v_hota", "sz0_s", "dif_easy", "vc_artifact", "ls_standard"] # a few of the icons the window shows at start
+
+class HeadlessCanvas:
+    """
+    Just enough of a tk.Canvas for MapGrid to lay out maps without a display, counts the calls it gets
+    """
+    def __init__(self, width: int = 1100, height: int = 720):
+        self.width = width
+        self.height = height
+        self.top: float = 0.0
+        self.scrollregion: tuple = (0, 0, 0, 0)
+        self.items: int = 0
+        self.moves: int = 0
+        self.positions: dict = {} # item id -> (x, y)
+        self.bindings: dict = {} # (tag, event) -> handler
+        self.current: tuple = () # items under the mouse
+
+    def configure(self, scrollregion=None, **kwargs):
+        if scrollregion is not None:
+            self.scrollregion = scrollregion
+
+    def winfo_height(self) -> int:
+        return self.height
+
+    def cget(self, option: str):
+        return self.height
+
+    def canvasy(self, y: float) -> float:
+        return self.top + y
+
+    def yview_moveto(self, fraction: float):
+        self.top = fraction * self.scrollregion[3]
+
+    def create_image(self, x, y, **kwargs) -> int:
+        self.items += 1
+        self.positions[self.items] = (x, y)
+        return self.items
+
+    def coords(self, item, *coords):
+        self.moves += 1
+        self.positions[item] = coords
+
+    def itemconfigure(self, item, **kwargs):
+        pass
+
+    def tag_bind(self, tag: str, event: str, handler):
+        self.bindings[(tag, event)] = handler
+
+    def find_withtag(self, tag: str) -> tuple:
+        return self.current if tag == "current" else ()
+
+    def click(self, item: int):
+        """
+        Click on an item as Tk would, it becomes "current" and the tag's handler runs
+        """
+        self.current = (item,)
+        for handler in self.bindings.values():
+            handler(None)
+
+def legacy_layout(count: int, cols: int) -> list:
+    """
+    The layout load_images used before MapGrid: every image asked the frame for all its grid slaves twice
+    to find its row and column, grid_slaves builds a new list each time
+
+    Returns:
+        list[tuple]: (row, col) of every image
+    """
+    slaves: list = []
+    for _ in range(count):
+        row = len(list(slaves)) // cols
+        col = len(list(slaves)) % cols
+        slaves.append((row, col))
+    return slaves
+
+def benchmark_layout(sizes: list = LAYOUT_SIZES, legacy_limit: int = 10000) -> list:
+    """
+    Time laying out the grid with set_paths and changing the number of columns with set_columns, which
+    only moves the cells in view, for growing map counts
+
+    Args:
+        sizes (list[int]): map counts to time
+        legacy_limit (int): largest map count to time the old quadratic layout with
+
+    Returns:
+        list[dict]: one result per map count, times in milliseconds
+    """
+    results: list = []
+    for count in sizes:
+        canvas = HeadlessCanvas()
+        decodes: list = [] # load_photo calls, every one would be a decode or a photo cache lookup
+        grid = MapGrid(canvas, lambda path, width, height: decodes.append(path) or path, lambda path: None, 1, 300, 300, 20, 20)
+        paths = [f"map{i}_map_auto.png" for i in range(count)]
+
+        start = time.perf_counter()
+        grid.set_paths(paths)
+        layout_ms = (time.perf_counter() - start) * 1000
+
+        canvas.yview_moveto(0.5)
+        grid.refresh()
+        items_before, decodes_before = canvas.items, len(decodes)
+        set_columns_ms: list = []
+        for cols in range(2, 11):
+            start = time.perf_counter()
+            grid.set_columns(cols)
+            set_columns_ms.append((time.perf_counter() - start) * 1000)
+
+        result = {"maps": count, "layout_ms": layout_ms, "set_columns_ms": sum(set_columns_ms) / len(set_columns_ms),
+                  "cells": len(grid.cells) + len(grid.free_cells), "cells_created_by_set_columns": canvas.items - items_before,
+                  "loads_by_set_columns": len(decodes) - decodes_before}
+        if count <= legacy_limit:
+            start = time.perf_counter()
+            legacy_layout(count, 1)
+            result["legacy_layout_ms"] = (time.perf_counter() - start) * 1000
+        results.append(result)
+    return results
+
+def benchmark_cells(counts: list = CELL_COUNTS, size: int = 100) -> list:
+    """
+    Time creating, scrolling and moving grid cells on a real Tk canvas, as one Label widget per map like
+    the grid used to and as canvas image items like MapGrid, needs a display
+
+    Args:
+        counts (list[int]): cells to create
+        size (int): image size
+
+    Returns:
+        list[dict]: one result per cell count and kind, empty when there is no display
+    """
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("No display, skipping the cells benchmark", file=sys.stderr)
+        return []
+    results: list = []
+    try:
+        canvas = tk.Canvas(root, width=1100, height=720)
+        canvas.pack()
+        photo = tk.PhotoImage(width=size, height=size)
+        for count in counts:
+            for kind in ("label", "image item"):
+                start = time.perf_counter()
+                if kind == "label":
+                    items = []
+                    for i in range(count):
+                        label = tk.Label(canvas, image=photo, bd=0, highlightthickness=0)
+                        label.bind("<Button-1>", lambda event: None)
+                        items.append(canvas.create_window(i % 10 * size, i // 10 * size, window=label, anchor=tk.NW))
+                else:
+                    items = [canvas.create_image(i % 10 * size, i // 10 * size, image=photo, anchor=tk.NW, tags=("map_cell",)) for i in range(count)]
+                    canvas.tag_bind("map_cell", "<Button-1>", lambda event: None)
+                root.update()
+                create_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                for fraction in range(10):
+                    canvas.yview_moveto(fraction / 10)
+                    root.update()
+                scroll_ms = (time.perf_counter() - start) * 1000 / 10
+
+                start = time.perf_counter()
+                for i, item in enumerate(items):
+                    canvas.coords(item, i % 5 * size, i // 5 * size)
+                root.update()
+                relayout_ms = (time.perf_counter() - start) * 1000
+                results.append({"cells": count, "kind": kind, "create_ms": create_ms, "scroll_ms": scroll_ms, "relayout_ms": relayout_ms})
+                for child in canvas.winfo_children():
+                    child.destroy()
+                canvas.delete("all")
+    finally:
+        root.destroy()
+    return results
+
+def eager_asset_load(directory: str, screen_size: tuple = (1100, 720)) -> dict:
+    """
+    The icon loading the GUI did before the atlas: decode and resize every image in the folder,
+    plus the unused full window background
+
+    Returns:
+        dict: icon name -> resized image
+    """
+    images: dict = {}
+    for filename in os.listdir(directory):
+        if filename.endswith(('.png', '.gif', '.jpg', '.jpeg')):
+            images[os.path.splitext(filename)[0]] = Image.open(os.path.join(directory, filename)).resize((32, 32))
+    Image.open(os.path.join(directory, "page.png")).resize(screen_size)
+    return images
+
+def load_icons(icons: dict, names: list) -> list:
+    """
+    Returns:
+        list: the icons of names, as the window asks for them
+    """
+    return [icons[name] for name in names]
+
+def benchmark_startup(directory: str = "assets", runs: int = 20) -> list:
+    """
+    Time loading the icons at startup, eagerly as before and lazily from the atlas, without Tk so the
+    PhotoImage step of both is left out
+
+    Args:
+        directory (str): assets folder
+        runs (int): times to repeat each, the best time is kept
+
+    Returns:
+        list[dict]: one result per way of loading, times in milliseconds
+    """
+    IconAtlas(directory) # build the atlas if it is missing, not part of the timing
+    results: list = []
+    for name, load in (("eager", lambda: eager_asset_load(directory)),
+                       ("atlas", lambda: IconAtlas(directory, make_photo=lambda image: image)),
+                       ("atlas + startup icons", lambda: load_icons(IconAtlas(directory, make_photo=lambda image: image), STARTUP_ICONS))):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            load()
+            times.append((time.perf_counter() - start) * 1000)
+        results.append({"loading": name, "best_ms": min(times), "mean_ms": sum(times) / len(times)})
+    return results
+
+def peak_rss_mb() -> float:
+    """
+    Returns:
+        float: most memory this process has held so far in megabytes, None where neither /proc nor the resource module is there
+    """
+    try:
+        with open("/proc/self/status") as f: # Linux, unlike ru_maxrss not carried over from the parent process
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        pass
+    try:
+        import resource # Unix only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024 # bytes on macOS, kilobytes elsewhere
+
+def memory_probe(decode: str, paths: list, size: int, workers: int, limit: int) -> dict:
+    """
+    Make thumbnails of paths on a thread pool the way decode says and measure the memory it took,
+    runs in a fresh process so the peak is its own
+
+    Args:
+        decode (str): "full" to decode and resize every image whole like the grid used to, "budget" for image_decode
+        paths (list[str]): images
+        size (int): thumbnail size
+        workers (int): decode threads
+        limit (int): image_decode memory limit in bytes
+
+    Returns:
+        dict: {"decode_ms", "peak_mb" more than before decoding, "budget_mb" most bytes image_decode held at once, None for "full"}
+    """
+    def full(path):
+        with Image.open(path) as image:
+            return image.resize((size, size))
+
+    if decode == "full":
+        Image.core.set_blocks_max(0) # Pillow's default, without image_decode's block cache
+    else:
+        image_decode.set_memory_limit(limit)
+    decoder = full if decode == "full" else lambda path: image_decode.decode_resized(path, size, size)
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for thumbnail in executor.map(decoder, paths):
+            thumbnail.close()
+    return {"decode_ms": (time.perf_counter() - start) * 1000, "peak_mb": peak_rss_mb() - before,
+            "budget_mb": image_decode.budget.peak / 1024 / 1024 if decode == "budget" else None}
+
+def benchmark_memory(sides: list = MEMORY_IMAGE_SIZES, count: int = 8, workers: int = 4, size: int = THUMBNAIL_SIZE,
+                     limit: int = image_decode.DECODE_MEMORY_LIMIT) -> list:
+    """
+    Compare the peak memory of making thumbnails of large map images, decoding each whole on every worker
+    at once against image_decode's reduced decoding within its memory budget. Every measurement runs in
+    its own process, needs /proc or the resource module (not on Windows).
+
+    Args:
+        sides (list[int]): square image sides
+        count (int): images decoded per measurement
+        workers (int): decode threads
+        size (int): thumbnail size
+        limit (int): image_decode memory limit in bytes
+
+    Returns:
+        list[dict]: one result per image side and way of decoding, empty when the memory can not be measured
+    """
+    if peak_rss_mb() is None:
+        print("Can not measure memory, skipping the memory benchmark", file=sys.stderr)
+        return []
+    results: list = []
+    with tempfile.TemporaryDirectory() as directory:
+        for side in sides:
+            path = os.path.join(directory, f"Large_{side}_map_auto.png")
+            image = Image.new("RGB", (side, side), "green")
+            ImageDraw.Draw(image).ellipse((side // 4, side // 4, side * 3 // 4, side * 3 // 4), fill="blue")
+            image.save(path, format="PNG", compress_level=1)
+            image.close()
+            for decode in ("full", "budget"):
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as process:
+                    result = process.submit(memory_probe, decode, [path] * count, size, workers, limit).result()
+                results.append(dict({"side": side, "images": count, "workers": workers, "decode": decode}, **result))
+    return results
+
+def benchmark_scan(corpus_dir: str, maps: dict, workers: int = download_images.MAX_WORKERS) -> list:
+    """
+    Time a first rescan downloading every map of a corpus from a local stub of the site, and a second
+    rescan with nothing changed
+
+    Args:
+        corpus_dir (str): corpus folder from generate_corpus
+        maps (dict): corpus catalogue from generate_corpus
+        workers (int): concurrent downloads
+
+    Returns:
+        list[dict]: one result per rescan
+    """
+    results: list = []
+    with CorpusServer(corpus_dir, maps) as server, tempfile.TemporaryDirectory() as map_images_dir, \
+            unittest.mock.patch.object(download_images, "BASE_URL", server.url), unittest.mock.patch("builtins.print"):
+        for name in ("first", "unchanged"):
+            requests_before, bytes_before = server.requests, server.bytes_sent
+            start = time.perf_counter()
+            download_images.download_images(map_images_dir, max_workers=workers)
+            seconds = time.perf_counter() - start
+            results.append({"maps": len(maps), "rescan": name, "scan_ms": seconds * 1000, "maps_per_s": len(maps) / seconds,
+                            "mb_per_s": (server.bytes_sent - bytes_before) / seconds / 1e6, "requests": server.requests - requests_before})
+    return results
+
+def benchmark_thumbnails(corpus_dir: str, size: int = THUMBNAIL_SIZE) -> list:
+    """
+    Time making the thumbnails of every map of a corpus with an empty thumbnail cache, then again from the cache
+
+    Returns:
+        list[dict]: one result per cache state
+    """
+    results: list = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        library = MapLibrary(corpus_dir, cache_dir)
+        try:
+            paths = list_map_paths(corpus_dir)
+            for cache in ("cold", "warm"):
+                start = time.perf_counter()
+                done = library.make_thumbnails([size], paths)
+                seconds = time.perf_counter() - start
+                results.append({"maps": len(paths), "cache": cache, "thumbs_ms": seconds * 1000, "per_map_ms": seconds * 1000 / max(1, done)})
+        finally:
+            library.close()
+    return results
+
+def benchmark_filters(paths: list, catalogue: dict, queries: int = 200, seed: int = 0) -> dict:
+    """
+    Time indexing a corpus for the filters, random checkbox combinations and the live filter counts
+
+    Returns:
+        dict: result, times in milliseconds
+    """
+    rng = random.Random(seed)
+    catalogue_keys = [key for key in FILTER_KEYS if not key.startswith(("liked:", "status:"))]
+    start = time.perf_counter()
+    index = FilterIndex.build(paths, catalogue)
+    build_ms = (time.perf_counter() - start) * 1000
+    selections = [set(rng.sample(catalogue_keys, rng.randint(1, 4))) for _ in range(queries)]
+    start = time.perf_counter()
+    matched = sum(len(index.matching_paths(selected)) for selected in selections)
+    query_ms = (time.perf_counter() - start) * 1000 / queries
+    start = time.perf_counter()
+    for selected in selections[:20]:
+        index.counts(selected, FILTER_KEYS)
+    counts_ms = (time.perf_counter() - start) * 1000 / 20
+    return {"maps": len(paths), "build_ms": build_ms, "query_ms": query_ms, "counts_ms": counts_ms, "mean_matches": matched / queries}
+
+def benchmark_search(paths: list, typed: int = 20, seed: int = 0) -> dict:
+    """
+    Time indexing a corpus for the name search and typing map names into the search box one key at a time
+
+    Returns:
+        dict: result, times in milliseconds
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    index = SearchIndex.build(paths)
+    build_ms = (time.perf_counter() - start) * 1000
+    keystrokes = 0
+    start = time.perf_counter()
+    for path in rng.sample(paths, min(typed, len(paths))):
+        name = map_name_from_filename(path)
+        for end in range(1, len(name) + 1):
+            index.search(name[:end])
+            keystrokes += 1
+    keystroke_ms = (time.perf_counter() - start) * 1000 / max(1, keystrokes)
+    start = time.perf_counter()
+    for _ in range(20):
+        index.search("tresure isle") # typo, answered by the fuzzy match
+    fuzzy_ms = (time.perf_counter() - start) * 1000 / 20
+    return {"maps": len(paths), "build_ms": build_ms, "keystroke_ms": keystroke_ms, "fuzzy_ms": fuzzy_ms}
+
+def benchmark_corpus(size: int, corpus_root: str, suites: list, seed: int = 0) -> dict:
+    """
+    Run the corpus benchmarks on a synthetic corpus of size maps, generated first if missing
+
+    Returns:
+        dict: suite name -> list of results
+    """
+    corpus_dir = os.path.join(corpus_root, f"corpus_{size}_{seed}")
+    maps = generate_corpus(corpus_dir, size, seed, lambda status: print(status, file=sys.stderr))
+    results: dict = {}
+    if "scan" in suites:
+        results["scan"] = benchmark_scan(corpus_dir, maps)
+    if "thumbs" in suites:
+        results["thumbs"] = benchmark_thumbnails(corpus_dir)
+    if "filters" in suites or "search" in suites:
+        catalogue = parse_catalogue(list_of_maps_html(maps), "http://127.0.0.1") # as a rescan saves it
+        paths = list_map_paths(corpus_dir)
+        if "filters" in suites:
+            results["filters"] = [benchmark_filters(paths, catalogue, seed=seed)]
+        if "search" in suites:
+            results["search"] = [benchmark_search(paths, seed=seed)]
+    return results
+
+def compare_results(results: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """
+    Find times that got slower than in a baseline results file, results are matched on their
+    non-time fields e.g. maps and rescan
+
+    Args:
+        results (dict): suite name -> list of results, as written by main
+        baseline (dict): the same from an earlier run
+        tolerance (float): slowest allowed time as a multiple of the baseline's
+
+    Returns:
+        list[str]: one line per regression
+    """
+    regressions: list = []
+    for suite, suite_results in results.items():
+        for result in suite_results:
+            key = {name: value for name, value in result.items() if not isinstance(value, float)}
+            old = next((old for old in baseline.get(suite, []) if {name: old.get(name) for name in key} == key), None)
+            if old is None:
+                continue
+            for name, value in result.items():
+                if name.endswith("_ms") and old.get(name, 0) >= REGRESSION_MIN_MS and value > old[name] * tolerance:
+                    regressions.append(f"{suite} {key}: {name} {value:.3f} ms, was {old[name]:.3f} ms")
+    return regressions
+
+def print_results(title: str, results: list):
+    """
+    Print benchmark results as a table
+
+    Returns:
+        None
+    """
+    print(title)
+    columns = list(dict.fromkeys(key for result in results for key in result))
+    print("  ".join(f"{column:>18}" for column in columns))
+    for result in results:
+        print("  ".join(f"{result[column]:>18.3f}" if isinstance(result.get(column), float) else f"{str(result.get(column, '-')):>18}" for column in columns))
+
+def main(argv: list = None) -> int:
+    """
+    Run benchmarks from the command line: python benchmarks.py --output results.json
+
+    Returns:
+        int: exit code, 1 when a time regressed against --baseline
+    """
+    parser = argparse.ArgumentParser(description="Heroes 3 Map Liker benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=LAYOUT_SIZES, help="map counts to benchmark the grid layout with")
+    parser.add_argument("--assets", default="assets", help="assets folder for the startup benchmark")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=CORPUS_SIZES, help="synthetic corpus map counts")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "heroes3_benchmark_corpus"), help="where corpora are generated and kept")
+    parser.add_argument("--seed", type=int, default=0, help="corpus random seed")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES, help="benchmarks to run")
+    parser.add_argument("--decode-memory", type=int, default=image_decode.DECODE_MEMORY_LIMIT // 1024 // 1024,
+                        help="image_decode memory limit of the memory benchmark in megabytes")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="slowest allowed time as a multiple of the baseline's")
+    parser.add_argument("--trace", help="write a Chrome trace of the benchmarks to this file")
+    args = parser.parse_args(argv)
+    if args.trace:
+        perf_trace.enable(args.trace)
+
+    results: dict = {}
+    if "layout" in args.suites:
+        results["layout"] = benchmark_layout(args.sizes)
+    if "cells" in args.suites:
+        cells = benchmark_cells()
+        if cells:
+            results["cells"] = cells
+    if "startup" in args.suites:
+        results["startup"] = benchmark_startup(args.assets)
+    if "memory" in args.suites:
+        memory = benchmark_memory(limit=args.decode_memory * 1024 * 1024)
+        if memory:
+            results["memory"] = memory
+    for size in args.corpus_sizes if set(args.suites) & set(CORPUS_SUITES) else []:
+        for suite, suite_results in benchmark_corpus(size, args.corpus_dir, args.suites, args.seed).items():
+            results.setdefault(suite, []).extend(suite_results)
+    for suite, suite_results in results.items():
+        print_results(suite, suite_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"python": platform.python_version(), "platform": platform.platform(), "time": time.time(),
+                                "seed": args.seed, "corpus_sizes": args.corpus_sizes}, "results": results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_results(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,117 @@
+# /decode_pipeline.py
+
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from PIL import ImageTk
+import perf_trace
+
+BATCH_SIZE: int = 8 # decoded images turned into PhotoImages per Tk loop tick, keeps every tick short
+POLL_MS: int = 10 # how often the Tk loop picks up decoded images while any are pending
+
+class DecodePipeline:
+    """
+    Decode and resize map images on a pool of worker threads (Pillow releases the GIL while it decodes
+    and resamples, so the workers run on all cores) and hand the results back to the Tk thread in small
+    batches per root.after tick. Only the Tk thread creates PhotoImages or calls on_ready.
+    """
+    def __init__(self, root, decode, on_ready, max_workers: int = None):
+        """
+        Args:
+            root (Tk): the GUI Window, used to schedule batches
+            decode: function (path, width, height) -> PIL Image, runs on the workers
+            on_ready: function (path, width, height, PhotoImage) called on the Tk thread, with None instead
+                of the PhotoImage when the image could not be decoded
+            max_workers (int): decode threads, one per core if not given
+        """
+        self.root = root
+        self.decode = decode
+        self.on_ready = on_ready
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, thread_name_prefix="decode")
+        self.pending: dict = {} # (path, width, height) -> Future
+        self.results: queue.Queue = queue.Queue() # (key, PIL Image or exception) from the workers
+        self.polling: bool = False
+
+    def request(self, path: str, width: int, height: int):
+        """
+        Start decoding an image unless it is already on its way, on_ready is called once it is done
+
+        Returns:
+            None
+        """
+        key = (path, width, height)
+        if key in self.pending:
+            return
+        self.pending[key] = self.executor.submit(self.decode_job, key)
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_MS, self.drain)
+
+    def decode_job(self, key: tuple):
+        """
+        Runs on a worker thread, never touches Tk
+
+        Returns:
+            None
+        """
+        try:
+            self.results.put((key, self.decode(*key)))
+        except Exception as e:
+            self.results.put((key, e))
+
+    def cancel(self, path: str, width: int, height: int):
+        """
+        Drop a request nobody is waiting for anymore e.g. its cell scrolled out of view, a decode
+        that has already started still finishes
+
+        Returns:
+            None
+        """
+        future = self.pending.get((path, width, height))
+        if future is not None and future.cancel():
+            del self.pending[(path, width, height)]
+
+    def cancel_all(self):
+        """
+        Drop every request that has not started, e.g. after the image size changed
+
+        Returns:
+            None
+        """
+        for key, future in list(self.pending.items()):
+            if future.cancel():
+                del self.pending[key]
+
+    def drain(self):
+        """
+        Turn up to BATCH_SIZE decoded images into PhotoImages, then give the Tk loop back and come again
+
+        Returns:
+            None
+        """
+        for _ in range(BATCH_SIZE):
+            try:
+                key, image = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.pop(key, None)
+            if isinstance(image, Exception):
+                print(f"Error loading image {key[0]}: {image}")
+                self.on_ready(*key, None) # the cell stops waiting, it is asked for again when it next scrolls into view
+                continue
+            with perf_trace.span("photo.create"):
+                photo = ImageTk.PhotoImage(image)
+            self.on_ready(*key, photo)
+        if self.pending or not self.results.empty():
+            self.root.after(POLL_MS, self.drain)
+        else:
+            self.polling = False
+
+    def shutdown(self):
+        """
+        Stop the workers, called when the window closes
+
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,27 @@
 # /display_gui.py
 
 import tkinter as tk
-from PIL import Image, ImageTk
+from tkinter import filedialog
+from PIL import ImageTk
 from typing import Dict
 import os
-import urllib.parse
 import platform
-from download_images import download_images
+import queue
+import threading
+from map_catalogue import map_name_from_filename, CATALOGUE_FILENAME
+from map_filters import FILTER_KEYS
+from map_journal import STATUSES
+from map_library import MapLibrary
+from map_grid import MapGrid
+from map_watcher import MapWatcher
+from image_cache import ImageCache
+from decode_pipeline import DecodePipeline
+from render_scheduler import RenderScheduler
+import perf_trace
+
+RESCAN_POLL_MS: int = 100 # how often the Tk loop picks up progress from a running rescan
+WATCH_POLL_MS: int = 250 # how often the Tk loop picks up changes to the map images folder
+PHOTO_CACHE_BYTES: int = 256 * 1024 * 1024 # memory budget for map images kept between renders
 
 def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WIDTH: int, IMAGE_HEIGHT: int, SPACING_X: int, SPACING_Y: int, map_image_dir: str, photo_images: Dict[str, ImageTk.PhotoImage]):
     """
@@ -28,7 +43,29 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     """
 
     progress_label = None
+    progress_status = "" # progress text without the stats line
     map_name_label = None
+    rescan_thread = None
+    rescan_queue = queue.Queue() # (event, value) posted by the rescan thread
+    cancel_rescan = threading.Event()
+    library = MapLibrary(map_image_dir) # maps, filters, search and journal, see map_library.py
+    journal = library.journal
+    photo_cache = ImageCache(PHOTO_CACHE_BYTES)
+    filter_vars = {key: tk.BooleanVar(root) for key in FILTER_KEYS} # checked state of the filter checkboxes
+    filter_checkboxes = {} # filter key -> (checkbox, text)
+    name_ascending_var = tk.BooleanVar(root)
+    name_descending_var = tk.BooleanVar(root)
+    search_var = tk.StringVar(root) # search box text
+    selected_map = None # path of the map clicked last
+    feature_index = None # image_similarity.FeatureIndex, loaded on the first similarity search
+    similarity_thread = None
+    similarity_queue = queue.Queue() # (event, value) posted by the similarity thread
+    similar_ranks = None # map image path -> rank by similarity to the chosen map, None when not searching by similarity
+    export_thread = None
+    export_queue = queue.Queue() # (event, value) posted by the export thread
+    watch_queue = queue.Queue() # lists of (kind, path) posted by the map watcher thread
+    status_var = tk.StringVar(root, value=STATUSES[0]) # played status of the selected map
+    notes_var = tk.StringVar(root) # notes of the selected map
 
     def toggle_control_panel():
         """
@@ -47,25 +84,95 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     
     def update_images():
         """
-        rescan images button progress label
+        rescan images button, starts downloading new images on a background thread so the window stays
+        responsive, clicking it again while a rescan runs cancels the rescan
 
         Returns:
             None
         """
+        nonlocal rescan_thread
+        if rescan_thread is not None and rescan_thread.is_alive():
+            cancel_rescan.set()
+            progress_label.config(text="Cancelling rescan...")
+            return
+        cancel_rescan.clear()
         progress_label.config(text="Rescanning images...")
-        root.update()  # Force update of the GUI
-        download_images(map_image_dir, update_progress)
-        load_images()
+        load_button.config(text="Cancel Rescan")
+        rescan_thread = threading.Thread(target=rescan_worker, daemon=True)
+        rescan_thread.start()
+        root.after(RESCAN_POLL_MS, drain_rescan_queue)
+
+    def rescan_worker():
+        """
+        runs the library rescan on the rescan thread, never touches Tk widgets, only posts
+        events to rescan_queue for drain_rescan_queue to handle on the Tk thread
+
+        Returns:
+            None
+        """
+        try: # new images are reported through the map watcher right away, the catalogue when the watcher sees it
+            library.rescan(lambda status: rescan_queue.put(("progress", status)), image_callback=map_watcher.notice, cancel_event=cancel_rescan)
+        except Exception as e:
+            rescan_queue.put(("progress", f"Rescan failed: {str(e)}"))
+        finally:
+            rescan_queue.put(("done", None))
+
+    def drain_rescan_queue():
+        """
+        handle rescan events on the Tk thread, called with root.after while a rescan runs
+
+        Returns:
+            None
+        """
+        while True:
+            try:
+                event, value = rescan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event == "progress":
+                update_progress(value)
+            elif event == "done":
+                load_button.config(text="Rescan Images")
+                return
+        root.after(RESCAN_POLL_MS, drain_rescan_queue)
+
+    def drain_watch_queue():
+        """
+        patch the library and the grid with the changes to the map images folder, on the Tk thread,
+        called with root.after for as long as the window is open
+
+        Returns:
+            None
+        """
+        changes = []
+        while True:
+            try:
+                changes += watch_queue.get_nowait()
+            except queue.Empty:
+                break
+        if changes:
+            apply_changes(changes)
+        root.after(WATCH_POLL_MS, drain_watch_queue)
 
     def update_progress(status):
         """
-        rescan images button progress label
+        rescan images button progress label, followed by a stats line from perf_trace when tracing
 
         Returns:
             None
         """
+        nonlocal progress_status
+        progress_status = status
+        if perf_trace.tracer.enabled:
+            stats = perf_trace.tracer.stats_line()
+            photo_stats = photo_cache.stats()
+            if photo_stats["hits"] + photo_stats["misses"]:
+                stats += f"{' | ' if stats else ''}images {photo_stats['hit_rate']:.0%} in memory"
+            latency_ms = render_scheduler.stats()["latency_ms"]
+            if latency_ms is not None:
+                stats += f"{' | ' if stats else ''}input to paint {latency_ms:.0f} ms"
+            status = f"{status} [{stats}]" if status else stats
         progress_label.config(text=status)
-        root.update()
 
     def show_map_name(event, map_name):
         """
@@ -74,44 +181,296 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
         Returns:
             None
         """
-        cleaned_name = map_name.replace('_', ' ').replace(' map auto', '')
-        cleaned_name = urllib.parse.unquote(cleaned_name)
-        map_name_label.config(text=f"Map: {cleaned_name}")
+        nonlocal selected_map
+        selected_map = map_name
+        cleaned_name = map_name_from_filename(map_name)
+        entry = journal.entry(map_name)
+        map_name_label.config(text=f"Map: {cleaned_name}" + (f" - played {entry['plays']} times" if entry["plays"] else ""))
+        like_button.config(text="unlike" if entry["liked"] else "like")
+        status_var.set(entry["status"])
+        notes_var.set(entry["notes"])
+
+    def find_similar():
+        """
+        similar maps button, orders the grid by how much the maps look like the clicked map, the map
+        features are indexed on a background thread, clicking it again goes back to the normal order
+
+        Returns:
+            None
+        """
+        nonlocal similarity_thread, similar_ranks
+        if similar_ranks is not None:
+            similar_ranks = None
+            similar_button.config(text="Similar maps")
+            request_filter()
+            return
+        if similarity_thread is not None and similarity_thread.is_alive():
+            return
+        if selected_map is None:
+            update_progress("Click a map to find maps similar to it")
+            return
+        try:
+            import image_similarity # needs numpy, the rest of the GUI works without it
+        except ImportError:
+            update_progress("Similar maps needs numpy: pip install numpy")
+            return
+        update_progress(f"Finding maps similar to {map_name_from_filename(selected_map)}...")
+        similarity_thread = threading.Thread(target=similarity_worker, args=(image_similarity, selected_map), daemon=True)
+        similarity_thread.start()
+        root.after(RESCAN_POLL_MS, drain_similarity_queue)
+
+    def similarity_worker(image_similarity, path):
+        """
+        index new map images and rank every map by similarity to path, runs on the similarity thread
+        and only posts events to similarity_queue
+
+        Returns:
+            None
+        """
+        nonlocal feature_index
+        try:
+            if feature_index is None:
+                feature_index = image_similarity.FeatureIndex(map_image_dir)
+            feature_index.update(lambda status: similarity_queue.put(("progress", status)))
+            similarity_queue.put(("done", feature_index.similar_to(os.path.basename(path))))
+        except Exception as e:
+            similarity_queue.put(("progress", f"Similar maps failed: {str(e)}"))
+            similarity_queue.put(("done", []))
+
+    def drain_similarity_queue():
+        """
+        handle similarity events on the Tk thread, called with root.after while the similarity thread runs
+
+        Returns:
+            None
+        """
+        nonlocal similar_ranks
+        while True:
+            try:
+                event, value = similarity_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event == "progress":
+                update_progress(value)
+            elif event == "done":
+                if value:
+                    similar_ranks = {os.path.join(map_image_dir, filename): rank for rank, filename in enumerate(value)}
+                    similar_button.config(text="All maps")
+                    update_progress(f"Maps similar to {map_name_from_filename(selected_map)}")
+                    request_filter()
+                return
+        root.after(RESCAN_POLL_MS, drain_similarity_queue)
+
+    def export_liked():
+        """
+        export liked maps button, streams the liked maps into a zip archive and renders a contact sheet
+        PDF next to it on a background thread
+
+        Returns:
+            None
+        """
+        nonlocal export_thread
+        if export_thread is not None and export_thread.is_alive():
+            return
+        paths = library.query({"liked:yes"}, sort="ascending")
+        if not paths:
+            update_progress("Like some maps to export them")
+            return
+        zip_path = filedialog.asksaveasfilename(parent=root, title="Export liked maps", initialfile="liked_maps.zip",
+                                                defaultextension=".zip", filetypes=[("Zip archive", "*.zip")])
+        if not zip_path:
+            return
+        update_progress(f"Exporting {len(paths)} liked maps...")
+        export_thread = threading.Thread(target=export_worker, args=(paths, zip_path, os.path.splitext(zip_path)[0] + ".pdf"), daemon=True)
+        export_thread.start()
+        root.after(RESCAN_POLL_MS, drain_export_queue)
+
+    def export_worker(paths, zip_path, sheet_path):
+        """
+        runs the export on the export thread and only posts events to export_queue
+
+        Returns:
+            None
+        """
+        try:
+            library.export(paths, zip_path, sheet_path, lambda status: export_queue.put(("progress", status)))
+        except Exception as e:
+            export_queue.put(("progress", f"Export failed: {str(e)}"))
+        finally:
+            export_queue.put(("done", None))
+
+    def drain_export_queue():
+        """
+        handle export events on the Tk thread, called with root.after while the export thread runs
+
+        Returns:
+            None
+        """
+        while True:
+            try:
+                event, value = export_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event == "progress":
+                update_progress(value)
+            elif event == "done":
+                return
+        root.after(RESCAN_POLL_MS, drain_export_queue)
 
     def load_images():
         """
-        load all images again, called usually after every gui change e.g. changing columns, load new state
+        load all images again, lists map_images_dir and indexes every map by its catalogue attributes
+        for the filters, called on start, later changes to the folder come from the map watcher. The maps
+        are shown from the folder listing first and verified on a background thread after.
+
+        Returns:
+            None
+        """
+        library.load(verify=False)
+        show_images()
+        threading.Thread(target=verify_worker, daemon=True).start()
+
+    def verify_worker():
+        """
+        quarantine broken map images and delete duplicates on a background thread, the files it takes
+        away are posted to watch_queue and patched out of the grid like any other change
+
+        Returns:
+            None
+        """
+        try:
+            result = library.verify()
+        except Exception as e:
+            print(f"Verifying map images failed: {str(e)}")
+            return
+        gone = result["quarantined"] + result["duplicates"]
+        if gone:
+            watch_queue.put([("removed", os.path.join(map_image_dir, filename)) for filename in gone])
+
+    def show_images():
+        """
+        show the maps matching the checked filters at the current image size, answered from the library
+        indexes without reading the folder, the grid only decodes the ones scrolled into view
+
+        Returns:
+            None
+        """
+        selected = checked_filters()
+        paths = library.query(selected, search_var.get(), similar_ranks, current_sort())
+        decode_pipeline.cancel_all()
+        map_grid.set_paths(paths, COLS, IMAGE_WIDTH, IMAGE_HEIGHT) # one clear and one fill of the cells in view
+        update_filter_counts(selected)
+
+    def checked_filters():
+        """
+        Returns:
+            set[str]: filter keys of the checked filter checkboxes
+        """
+        return {key for key, variable in filter_vars.items() if variable.get()}
+
+    def update_filter_counts(selected=None):
+        """
+        show next to every filter checkbox how many maps it would match
+
+        Returns:
+            None
+        """
+        counts = library.counts(checked_filters() if selected is None else selected, list(filter_checkboxes))
+        for key, (checkbox, text) in filter_checkboxes.items():
+            checkbox.config(text=f"{text} ({counts[key]})")
+
+    def current_sort():
+        """
+        Returns:
+            str: "ascending" or "descending" when a name sort is checked, None otherwise
+        """
+        return "descending" if name_descending_var.get() else "ascending" if name_ascending_var.get() else None
+
+    def sorted_position(path, sort):
+        """
+        Returns:
+            int: where a map goes in the grid, its place by name when sorted, the end otherwise
+        """
+        if sort is None:
+            return len(map_grid.paths)
+        name = map_name_from_filename(path).lower()
+        for index, other in enumerate(map_grid.paths):
+            other_name = map_name_from_filename(other).lower()
+            if (other_name < name) if sort == "descending" else (other_name > name):
+                return index
+        return len(map_grid.paths)
+
+    def apply_changes(changes):
+        """
+        index the map images added, changed or removed in the folder and patch only their grid cells:
+        a changed map is shown again from the new file wherever it is, a new one is inserted at its
+        place in the sort order, a removed one or one no longer matching the filters is taken out.
+        A search is asked for again when maps are added, a new catalogue re-filters when filters are checked.
 
         Returns:
             None
         """
-        for widget in frame.winfo_children():
-            widget.destroy()
+        selected = checked_filters()
+        sort = current_sort()
+        requery = any(os.path.basename(path) == CATALOGUE_FILENAME for kind, path in changes) and bool(selected)
+        for kind, path in library.update(changes):
+            photo_cache.invalidate(path)
+            if kind == "removed" or not library.matches(path, selected):
+                map_grid.remove(path)
+            elif path in map_grid.indexes:
+                map_grid.reload(path)
+            elif search_var.get().strip():
+                requery = True # only the search ranks a new map
+            elif similar_ranks is None: # the similar maps view only shows ranked maps
+                map_grid.insert(sorted_position(path, sort), path)
+        if requery:
+            render_scheduler.request(filters=True)
+        else:
+            update_filter_counts(selected)
+
+    def load_photo(path, width, height):
+        """
+        thumbnail of a map image for the grid, re-used from photo_cache when it was shown at this size before,
+        otherwise it is decoded in the background and arrives in photo_ready
+
+        Returns:
+            PhotoImage, None while it is decoded
+        """
+        photo = photo_cache.get(path, width, height)
+        if photo is None:
+            decode_pipeline.request(path, width, height)
+        return photo
+
+    def decode_thumbnail(path, width, height):
+        """
+        decode a thumbnail of a map image, runs on a decode worker thread
+
+        Returns:
+            Image
+        """
+        return library.thumbnail(path, width, height)
 
-        # Load images from map_images_dir
-        for entry in os.listdir(map_image_dir):
-            path = os.path.join(map_image_dir, entry)
-            if os.path.isfile(path) and path.endswith('.png'):
-                image = Image.open(path)
-                image = image.resize((IMAGE_WIDTH, IMAGE_HEIGHT))
-                photo = ImageTk.PhotoImage(image)
-                label = tk.Label(frame, image=photo)
-                label.image = photo
-                label.bind("<Button-1>", lambda event, map_name=os.path.splitext(entry)[0]: show_map_name(event, map_name))
-                row = len(frame.grid_slaves()) // COLS
-                col = len(frame.grid_slaves()) % COLS
-                label.grid(row=row, column=col, padx=SPACING_X, pady=SPACING_Y)
+    def photo_ready(path, width, height, photo):
+        """
+        a thumbnail finished decoding, cache it and show it if its cell is still in view, a failed
+        one (photo None) is not cached and its cell shows the error placeholder
 
-        update_scroll_region()
+        Returns:
+            None
+        """
+        if photo is not None:
+            photo_cache.put(path, width, height, photo)
+        map_grid.set_photo(path, width, height, photo)
 
-    def update_scroll_region(event=None):
+    def on_canvas_scroll(first, last):
         """
-        bind scroll bar GUI element to canvas
+        canvas view changed, move the scroll bar and fill in the grid rows scrolled into view
 
         Returns:
             None
         """
-        canvas.configure(scrollregion=canvas.bbox("all"))
+        scrollbar.set(first, last)
+        map_grid.refresh()
 
     def update_cols(value):
         """
@@ -123,7 +482,7 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
         nonlocal COLS
         COLS = int(value)
         cols_label.config(text=f"Columns: {COLS}")
-        load_images()
+        render_scheduler.request(cols=COLS)
 
     def update_image_sizes(value):
         """
@@ -137,17 +496,105 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
         IMAGE_WIDTH = size
         IMAGE_HEIGHT = size
         image_size_label.config(text=f"Image size: {IMAGE_WIDTH}x{IMAGE_HEIGHT}")
-        load_images()
+        render_scheduler.request(image_size=size)
+
+    def request_filter():
+        """
+        filter and sort checkboxes, show the matching maps once clicking has settled
+
+        Returns:
+            None
+        """
+        render_scheduler.request(filters=True)
+
+    def render(changes):
+        """
+        render the grid for the merged slider/filter changes from render_scheduler, a reload lists
+        the images again, a new image size or filter shows the matching maps from the filter index,
+        a column change only moves the cells
+
+        Returns:
+            None
+        """
+        if "reload" in changes:
+            load_images()
+        elif "image_size" in changes or "filters" in changes:
+            show_images()
+        elif "cols" in changes:
+            map_grid.set_columns(COLS)
+
+    def render_painted(latency_ms):
+        """
+        the rendered grid is drawn, show a fresh stats line with its input to paint latency when tracing
+
+        Returns:
+            None
+        """
+        if perf_trace.tracer.enabled:
+            update_progress(progress_status)
+
+    def cancel_stale_decodes(changes):
+        """
+        images being decoded for the old size or filters are useless once they change
+
+        Returns:
+            None
+        """
+        if "image_size" in changes or "filters" in changes or "reload" in changes:
+            decode_pipeline.cancel_all()
+
+    def journal_changed(path):
+        """
+        a journal entry changed, update the filter flags and counts and re-filter when a journal filter is checked
+
+        Returns:
+            None
+        """
+        library.index_journal_entry(path)
+        selected = checked_filters()
+        if any(key.startswith(("liked:", "status:")) for key in selected):
+            request_filter()
+        else:
+            update_filter_counts(selected)
 
     def like_image():
         """
-        like image button to save liked images to be able to filter from.
+        like image button to save liked images to be able to filter from, clicking it again unlikes the map
 
         Returns:
             None
         """
-        print("Liked image: ")
-    
+        if selected_map is None:
+            update_progress("Click a map to like it")
+            return
+        liked = not journal.entry(selected_map)["liked"]
+        journal.set_liked(selected_map, liked)
+        like_button.config(text="unlike" if liked else "like")
+        journal_changed(selected_map)
+
+    def set_status(status):
+        """
+        played status menu, won/unfinished/unplayed of the selected map
+
+        Returns:
+            None
+        """
+        if selected_map is None:
+            status_var.set(STATUSES[0])
+            return
+        journal.set_status(selected_map, status)
+        journal_changed(selected_map)
+
+    def save_notes(event=None):
+        """
+        notes box, saved when pressing Return or leaving the box
+
+        Returns:
+            None
+        """
+        if selected_map is not None and notes_var.get() != journal.entry(selected_map)["notes"]:
+            journal.set_notes(selected_map, notes_var.get())
+
     def play_map():
         """
         Button for open Heroes 3 launcher, start game and navigate to chosen map settings
@@ -155,7 +602,13 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
         Returns:
             None
         """
-        print("Starting map: ")
+        if selected_map is None:
+            update_progress("Click a map to play it")
+            return
+        print(f"Starting map: {map_name_from_filename(selected_map)}")
+        journal.record_play(selected_map)
+        show_map_name(None, selected_map) # shows the new play count and status
+        journal_changed(selected_map)
 
     def reset_settings():
         """
@@ -164,9 +617,20 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
         Returns:
             None
         """
+        nonlocal COLS, IMAGE_WIDTH, IMAGE_HEIGHT, similar_ranks
         COLS = 1
         IMAGE_WIDTH = 300
         IMAGE_HEIGHT = 300
+        for variable in (*filter_vars.values(), name_ascending_var, name_descending_var):
+            variable.set(False)
+        search_var.set("")
+        similar_ranks = None
+        similar_button.config(text="Similar maps")
+        cols_slider.set(COLS)
+        image_size_slider.set(IMAGE_WIDTH)
+        cols_label.config(text=f"Columns: {COLS}")
+        image_size_label.config(text=f"Image size: {IMAGE_WIDTH}x{IMAGE_HEIGHT}")
+        render_scheduler.request(filters=True)
 
     def on_key_press(event):
         """
@@ -175,6 +639,8 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
         Returns:
             None
         """
+        if isinstance(event.widget, tk.Entry):
+            return # arrow keys move the cursor in the search box
         if event.keysym == "Up":
             canvas.yview_scroll(-1, "units")
         if event.keysym == "Down":
@@ -187,12 +653,12 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     canvas = tk.Canvas(root, width=SCREEN_WIDTH, height=SCREEN_HEIGHT)
     canvas.grid(row=0, column=0, columnspan=2, sticky="nsew")
 
-    background_photo = ImageTk.PhotoImage(Image.open("assets/page.png").resize((SCREEN_WIDTH, SCREEN_HEIGHT)))
-    # canvas.create_image(0, 0, image=background_photo, anchor=tk.NW) - NOT SETTING BACKGROUND IMAGE NEEDS FIX
+    # background image assets/page.png is not decoded until it is set - NOT SETTING BACKGROUND IMAGE NEEDS FIX
+    # canvas.create_image(0, 0, image=ImageTk.PhotoImage(Image.open("assets/page.png").resize((SCREEN_WIDTH, SCREEN_HEIGHT))), anchor=tk.NW)
 
     scrollbar = tk.Scrollbar(root, orient=tk.VERTICAL, command=canvas.yview)
     scrollbar.grid(row=0, column=2, sticky="ns")
-    canvas.configure(yscrollcommand=scrollbar.set)
+    canvas.configure(yscrollcommand=on_canvas_scroll)
     
     def on_mouse_wheel(event):
         """
@@ -208,12 +674,16 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
             canvas.yview_scroll(int(-1*(event.delta/120)), "units")  # For other platforms, use the original scrolling behavior
     canvas.bind_all("<MouseWheel>", lambda event: on_mouse_wheel(event)) # bind event MouseWheel to function on_mouse_wheel
 
-    frame = tk.Frame(canvas)
-    canvas.create_window((0, 0), window=frame, anchor=tk.NW) # by embedding a frame in the canvas window it becomes scrollable
+    decode_pipeline = DecodePipeline(root, decode_thumbnail, photo_ready)
+    map_grid = MapGrid(canvas, load_photo, lambda path: show_map_name(None, path), COLS, IMAGE_WIDTH, IMAGE_HEIGHT, SPACING_X, SPACING_Y,
+                       cancel_photo=decode_pipeline.cancel)
+    render_scheduler = RenderScheduler(root, render, cancel_stale_decodes, on_painted=render_painted)
+    map_watcher = MapWatcher(map_image_dir, lambda changes: watch_queue.put(library.check(changes))) # files are read on the watcher thread
+    root.bind("<Destroy>", lambda event: (map_watcher.stop(wait=False), decode_pipeline.shutdown(), library.close()) if event.widget is root else None)
 
     load_images()
-
-    frame.bind("<Configure>", update_scroll_region)
+    map_watcher.start()
+    root.after(WATCH_POLL_MS, drain_watch_queue)
 
     # Bind all key presses to the on_key_press function
     canvas.bind_all("<KeyPress>", on_key_press)
@@ -230,9 +700,24 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     map_name_label = tk.Label(root, text="", bd=1, relief=tk.SUNKEN, anchor=tk.W, font=("Arial", 14))
     map_name_label.grid(row=1, column=0, sticky="ne", padx=2, pady=2)
 
-    # row 1 - Like map button
+    # row 0 - Search box, refines the grid as you type
+    search_label = tk.Label(control_frame, text="Search", font=("Arial", 12))
+    search_label.grid(row=0, column=0, padx=2, pady=2, sticky="w")
+    search_entry = tk.Entry(control_frame, textvariable=search_var)
+    search_entry.grid(row=0, column=1, padx=2, pady=2, sticky="ew", columnspan=4)
+    search_var.trace_add("write", lambda *args: request_filter())
+    similar_button = tk.Button(control_frame, text="Similar maps", command=find_similar)
+    similar_button.grid(row=0, column=5, padx=2, pady=2, sticky="ew")
+
+    # row 1 - Like map button, played status and notes of the selected map
     like_button = tk.Button(control_frame, text="like", command=like_image)
-    like_button.grid(row=1, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    like_button.grid(row=1, column=0, padx=2, pady=2, sticky="ew")
+    status_menu = tk.OptionMenu(control_frame, status_var, *STATUSES, command=set_status)
+    status_menu.grid(row=1, column=1, padx=2, pady=2, sticky="ew")
+    notes_entry = tk.Entry(control_frame, textvariable=notes_var)
+    notes_entry.grid(row=1, column=2, padx=2, pady=2, sticky="ew", columnspan=3)
+    notes_entry.bind("<Return>", save_notes)
+    notes_entry.bind("<FocusOut>", save_notes)
 
     # row 2 - Play map button
     play_button = tk.Button(control_frame, text="Play map", command=play_map)
@@ -241,6 +726,8 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     # row 3 - Rescan Images button
     load_button = tk.Button(control_frame, text="Rescan Images", command=update_images)
     load_button.grid(row=3, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    export_button = tk.Button(control_frame, text="Export liked maps", command=export_liked)
+    export_button.grid(row=3, column=5, padx=2, pady=2, sticky="ew")
 
     # row 4 - sort
     sort_label = tk.Label(control_frame, text="Filter", font=("Arial", 12))
@@ -248,28 +735,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
 
     liked_frame = tk.Frame(control_frame) # Create frame hold checkbox, text and star image, in same column
     liked_frame.grid(row=4, column=1, padx=2, pady=2, sticky="w")
-    liked_checkbox = tk.Checkbutton(liked_frame, text="Liked", command=load_images) # Create the liked checkbox
+    liked_checkbox = tk.Checkbutton(liked_frame, text="Liked", variable=filter_vars["liked:yes"], command=request_filter) # Create the liked checkbox
     liked_checkbox.pack(side=tk.LEFT)
     liked_label = tk.Label(liked_frame, image=photo_images["star"]) # Create a label for the star image
     liked_label.pack(side=tk.LEFT)
 
     name_descending_frame = tk.Frame(control_frame)
     name_descending_frame.grid(row=4, column=2, padx=2, pady=2, sticky="w")
-    name_descending_checkbox = tk.Checkbutton(name_descending_frame, text="Name descending", command=load_images)
+    name_descending_checkbox = tk.Checkbutton(name_descending_frame, text="Name descending", variable=name_descending_var, command=request_filter)
     name_descending_checkbox.pack(side=tk.LEFT)
     name_descending_label = tk.Label(name_descending_frame, image=photo_images["name_descending"])
     name_descending_label.pack(side=tk.LEFT)
 
     name_ascending_frame = tk.Frame(control_frame)
     name_ascending_frame.grid(row=4, column=3, padx=2, pady=2, sticky="w")
-    name_ascending_checkbox = tk.Checkbutton(name_ascending_frame, text="Name ascending", command=load_images)
+    name_ascending_checkbox = tk.Checkbutton(name_ascending_frame, text="Name ascending", variable=name_ascending_var, command=request_filter)
     name_ascending_checkbox.pack(side=tk.LEFT)
     name_ascending_label = tk.Label(name_ascending_frame, image=photo_images["name_ascending"])
     name_ascending_label.pack(side=tk.LEFT)
 
     subterranean_frame = tk.Frame(control_frame)
     subterranean_frame.grid(row=4, column=4, padx=2, pady=2, sticky="w")
-    subterranean_checkbox = tk.Checkbutton(subterranean_frame, text="subterranean", command=load_images)
+    subterranean_checkbox = tk.Checkbutton(subterranean_frame, text="subterranean", variable=filter_vars["subterranean:yes"], command=request_filter)
     subterranean_checkbox.pack(side=tk.LEFT)
     subterranean_label = tk.Label(subterranean_frame, image=photo_images["subterranean"])
     subterranean_label.pack(side=tk.LEFT)
@@ -280,28 +767,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
 
     roe_frame = tk.Frame(control_frame)
     roe_frame.grid(row=5, column=1, padx=2, pady=2, sticky="w")
-    roe_checkbox = tk.Checkbutton(roe_frame, text="Restoration of Erathia", command=load_images)
+    roe_checkbox = tk.Checkbutton(roe_frame, text="Restoration of Erathia", variable=filter_vars["expansion:roe"], command=request_filter)
     roe_checkbox.pack(side=tk.LEFT)
     roe_label = tk.Label(roe_frame, image=photo_images["v_roe"])
     roe_label.pack(side=tk.LEFT)
 
     ab_frame = tk.Frame(control_frame)
     ab_frame.grid(row=5, column=2, padx=2, pady=2, sticky="w")
-    ab_checkbox = tk.Checkbutton(ab_frame, text="Armageddons Blade", command=load_images)
+    ab_checkbox = tk.Checkbutton(ab_frame, text="Armageddons Blade", variable=filter_vars["expansion:ab"], command=request_filter)
     ab_checkbox.pack(side=tk.LEFT)
     ab_label = tk.Label(ab_frame, image=photo_images["v_ab"])
     ab_label.pack(side=tk.LEFT)
 
     sod_frame = tk.Frame(control_frame)
     sod_frame.grid(row=5, column=3, padx=2, pady=2, sticky="w")
-    sod_checkbox = tk.Checkbutton(sod_frame, text="Shadow of Death", command=load_images)
+    sod_checkbox = tk.Checkbutton(sod_frame, text="Shadow of Death", variable=filter_vars["expansion:sod"], command=request_filter)
     sod_checkbox.pack(side=tk.LEFT)
     sod_label = tk.Label(sod_frame, image=photo_images["v_sod"])
     sod_label.pack(side=tk.LEFT)
 
     hota_frame = tk.Frame(control_frame)
     hota_frame.grid(row=5, column=4, padx=2, pady=2, sticky="w")
-    hota_checkbox = tk.Checkbutton(hota_frame, text="Horn of the Abyss", command=load_images)
+    hota_checkbox = tk.Checkbutton(hota_frame, text="Horn of the Abyss", variable=filter_vars["expansion:hota"], command=request_filter)
     hota_checkbox.pack(side=tk.LEFT)
     hota_label = tk.Label(hota_frame, image=photo_images["v_hota"])
     hota_label.pack(side=tk.LEFT)
@@ -312,28 +799,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
 
     small_map_frame = tk.Frame(control_frame)
     small_map_frame.grid(row=6, column=1, padx=2, pady=2, sticky="w")
-    small_map_checkbox = tk.Checkbutton(small_map_frame, text="S", command=load_images)
+    small_map_checkbox = tk.Checkbutton(small_map_frame, text="S", variable=filter_vars["size:S"], command=request_filter)
     small_map_checkbox.pack(side=tk.LEFT)
     small_map_label = tk.Label(small_map_frame, image=photo_images["sz0_s"])
     small_map_label.pack(side=tk.LEFT)
 
     medium_map_frame = tk.Frame(control_frame)
     medium_map_frame.grid(row=6, column=2, padx=2, pady=2, sticky="w")
-    medium_map_checkbox = tk.Checkbutton(medium_map_frame, text="M", command=load_images)
+    medium_map_checkbox = tk.Checkbutton(medium_map_frame, text="M", variable=filter_vars["size:M"], command=request_filter)
     medium_map_checkbox.pack(side=tk.LEFT)
     medium_map_label = tk.Label(medium_map_frame, image=photo_images["sz1_m"])
     medium_map_label.pack(side=tk.LEFT)
 
     large_map_frame = tk.Frame(control_frame)
     large_map_frame.grid(row=6, column=3, padx=2, pady=2, sticky="w")
-    large_map_checkbox = tk.Checkbutton(large_map_frame, text="L", command=load_images)
+    large_map_checkbox = tk.Checkbutton(large_map_frame, text="L", variable=filter_vars["size:L"], command=request_filter)
     large_map_checkbox.pack(side=tk.LEFT)
     large_map_label = tk.Label(large_map_frame, image=photo_images["sz2_l"])
     large_map_label.pack(side=tk.LEFT)
 
     extra_large_map_frame = tk.Frame(control_frame)
     extra_large_map_frame.grid(row=6, column=4, padx=2, pady=2, sticky="w")
-    extra_large_map_checkbox = tk.Checkbutton(extra_large_map_frame, text="XL", command=load_images)
+    extra_large_map_checkbox = tk.Checkbutton(extra_large_map_frame, text="XL", variable=filter_vars["size:XL"], command=request_filter)
     extra_large_map_checkbox.pack(side=tk.LEFT)
     extra_large_map_label = tk.Label(extra_large_map_frame, image=photo_images["sz3_xl"])
     extra_large_map_label.pack(side=tk.LEFT)
@@ -341,21 +828,21 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     # row 7 - map size continued
     huge_map_frame = tk.Frame(control_frame)
     huge_map_frame.grid(row=7, column=0, padx=2, pady=2, sticky="w")
-    huge_map_checkbox = tk.Checkbutton(huge_map_frame, text="H", command=load_images)
+    huge_map_checkbox = tk.Checkbutton(huge_map_frame, text="H", variable=filter_vars["size:H"], command=request_filter)
     huge_map_checkbox.pack(side=tk.LEFT)
     huge_map_label = tk.Label(huge_map_frame, image=photo_images["sz4_h"])
     huge_map_label.pack(side=tk.LEFT)
 
     extra_huge_map_frame = tk.Frame(control_frame)
     extra_huge_map_frame.grid(row=7, column=1, padx=2, pady=2, sticky="w")
-    extra_huge_map_checkbox = tk.Checkbutton(extra_huge_map_frame, text="XH", command=load_images)
+    extra_huge_map_checkbox = tk.Checkbutton(extra_huge_map_frame, text="XH", variable=filter_vars["size:XH"], command=request_filter)
     extra_huge_map_checkbox.pack(side=tk.LEFT)
     extra_huge_map_label = tk.Label(extra_huge_map_frame, image=photo_images["sz5_xh"])
     extra_huge_map_label.pack(side=tk.LEFT)
 
     giant_map_frame = tk.Frame(control_frame)
     giant_map_frame.grid(row=7, column=2, padx=2, pady=2, sticky="w")
-    giant_map_checkbox = tk.Checkbutton(giant_map_frame, text="G", command=load_images)
+    giant_map_checkbox = tk.Checkbutton(giant_map_frame, text="G", variable=filter_vars["size:G"], command=request_filter)
     giant_map_checkbox.pack(side=tk.LEFT)
     giant_map_label = tk.Label(giant_map_frame, image=photo_images["sz6_g"])
     giant_map_label.pack(side=tk.LEFT)
@@ -367,28 +854,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
 
     easy_map_frame = tk.Frame(control_frame)
     easy_map_frame.grid(row=8, column=1, padx=2, pady=2, sticky="w")
-    easy_map_checkbox = tk.Checkbutton(easy_map_frame, text="Easy", command=load_images)
+    easy_map_checkbox = tk.Checkbutton(easy_map_frame, text="Easy", variable=filter_vars["difficulty:easy"], command=request_filter)
     easy_map_checkbox.pack(side=tk.LEFT)
     easy_map_label = tk.Label(easy_map_frame, image=photo_images["dif_easy"])
     easy_map_label.pack(side=tk.LEFT)
 
     normal_map_frame = tk.Frame(control_frame)
     normal_map_frame.grid(row=8, column=2, padx=2, pady=2, sticky="w")
-    normal_map_checkbox = tk.Checkbutton(normal_map_frame, text="Normal", command=load_images)
+    normal_map_checkbox = tk.Checkbutton(normal_map_frame, text="Normal", variable=filter_vars["difficulty:normal"], command=request_filter)
     normal_map_checkbox.pack(side=tk.LEFT)
     normal_map_label = tk.Label(normal_map_frame, image=photo_images["dif_normal"])
     normal_map_label.pack(side=tk.LEFT)
 
     hard_map_frame = tk.Frame(control_frame)
     hard_map_frame.grid(row=8, column=3, padx=2, pady=2, sticky="w")
-    hard_map_checkbox = tk.Checkbutton(hard_map_frame, text="Hard", command=load_images)
+    hard_map_checkbox = tk.Checkbutton(hard_map_frame, text="Hard", variable=filter_vars["difficulty:hard"], command=request_filter)
     hard_map_checkbox.pack(side=tk.LEFT)
     hard_map_label = tk.Label(hard_map_frame, image=photo_images["dif_hard"])
     hard_map_label.pack(side=tk.LEFT)
 
     expert_map_frame = tk.Frame(control_frame)
     expert_map_frame.grid(row=8, column=4, padx=2, pady=2, sticky="w")
-    expert_map_checkbox = tk.Checkbutton(expert_map_frame, text="Expert", command=load_images)
+    expert_map_checkbox = tk.Checkbutton(expert_map_frame, text="Expert", variable=filter_vars["difficulty:expert"], command=request_filter)
     expert_map_checkbox.pack(side=tk.LEFT)
     expert_map_label = tk.Label(expert_map_frame, image=photo_images["dif_expert"])
     expert_map_label.pack(side=tk.LEFT)
@@ -396,7 +883,7 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     # row 9 - difficulty continued
     impossible_map_frame = tk.Frame(control_frame)
     impossible_map_frame.grid(row=9, column=0, padx=2, pady=2, sticky="w")
-    impossible_map_checkbox = tk.Checkbutton(impossible_map_frame, text="Impossible", command=load_images)
+    impossible_map_checkbox = tk.Checkbutton(impossible_map_frame, text="Impossible", variable=filter_vars["difficulty:impossible"], command=request_filter)
     impossible_map_checkbox.pack(side=tk.LEFT)
     impossible_map_label = tk.Label(impossible_map_frame, image=photo_images["dif_impossible"])
     impossible_map_label.pack(side=tk.LEFT)
@@ -408,28 +895,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
 
     acquire_artifact_frame = tk.Frame(control_frame)
     acquire_artifact_frame.grid(row=10, column=1, padx=2, pady=2, sticky="w")
-    acquire_artifact_checkbox = tk.Checkbutton(acquire_artifact_frame, text="Acquire specific Artifact", command=load_images)
+    acquire_artifact_checkbox = tk.Checkbutton(acquire_artifact_frame, text="Acquire specific Artifact", variable=filter_vars["victory:artifact"], command=request_filter)
     acquire_artifact_checkbox.pack(side=tk.LEFT)
     acquire_artifact_label = tk.Label(acquire_artifact_frame, image=photo_images["vc_artifact"])
     acquire_artifact_label.pack(side=tk.LEFT)
 
     defeat_monster_frame = tk.Frame(control_frame)
     defeat_monster_frame.grid(row=10, column=2, padx=2, pady=2, sticky="w")
-    defeat_monster_checkbox = tk.Checkbutton(defeat_monster_frame, text="Defeat specific Monster", command=load_images)
+    defeat_monster_checkbox = tk.Checkbutton(defeat_monster_frame, text="Defeat specific Monster", variable=filter_vars["victory:monster"], command=request_filter)
     defeat_monster_checkbox.pack(side=tk.LEFT)
     defeat_monster_label = tk.Label(defeat_monster_frame, image=photo_images["vc_monster"])
     defeat_monster_label.pack(side=tk.LEFT)
 
     survive_frame = tk.Frame(control_frame)
     survive_frame.grid(row=10, column=3, padx=2, pady=2, sticky="w")
-    survive_checkbox = tk.Checkbutton(survive_frame, text="Survive certain time", command=load_images)
+    survive_checkbox = tk.Checkbutton(survive_frame, text="Survive certain time", variable=filter_vars["victory:survivetime"], command=request_filter)
     survive_checkbox.pack(side=tk.LEFT)
     survive_label = tk.Label(survive_frame, image=photo_images["vc_survivetime"])
     survive_label.pack(side=tk.LEFT)
 
     standard_frame = tk.Frame(control_frame)
     standard_frame.grid(row=10, column=4, padx=2, pady=2, sticky="w")
-    standard_checkbox = tk.Checkbutton(standard_frame, text="Standard", command=load_images)
+    standard_checkbox = tk.Checkbutton(standard_frame, text="Standard", variable=filter_vars["victory:standard"], command=request_filter)
     standard_checkbox.pack(side=tk.LEFT)
     standard_label = tk.Label(standard_frame, image=photo_images["vc_standard"])
     standard_label.pack(side=tk.LEFT)
@@ -438,28 +925,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     # row 11 - win conditions
     build_grail_frame = tk.Frame(control_frame)
     build_grail_frame.grid(row=11, column=0, padx=2, pady=2, sticky="w")
-    build_grail_checkbox = tk.Checkbutton(build_grail_frame, text="Build Grail structure", command=load_images)
+    build_grail_checkbox = tk.Checkbutton(build_grail_frame, text="Build Grail structure", variable=filter_vars["victory:buildgrail"], command=request_filter)
     build_grail_checkbox.pack(side=tk.LEFT)
     build_grail_label = tk.Label(build_grail_frame, image=photo_images["vc_buildgrail"])
     build_grail_label.pack(side=tk.LEFT)
 
     eliminate_monsters_frame = tk.Frame(control_frame)
     eliminate_monsters_frame.grid(row=11, column=1, padx=2, pady=2, sticky="w")
-    eliminate_monsters_checkbox = tk.Checkbutton(eliminate_monsters_frame, text="Eliminiate all Monsters", command=load_images)
+    eliminate_monsters_checkbox = tk.Checkbutton(eliminate_monsters_frame, text="Eliminiate all Monsters", variable=filter_vars["victory:allmonsters"], command=request_filter)
     eliminate_monsters_checkbox.pack(side=tk.LEFT)
     eliminate_monsters_label = tk.Label(eliminate_monsters_frame, image=photo_images["vc_allmonsters"])
     eliminate_monsters_label.pack(side=tk.LEFT)
 
     transport_artifact_frame = tk.Frame(control_frame)
     transport_artifact_frame.grid(row=11, column=2, padx=2, pady=2, sticky="w")
-    transport_artifact_checkbox = tk.Checkbutton(transport_artifact_frame, text="Transport specific Artifact", command=load_images)
+    transport_artifact_checkbox = tk.Checkbutton(transport_artifact_frame, text="Transport specific Artifact", variable=filter_vars["victory:transport"], command=request_filter)
     transport_artifact_checkbox.pack(side=tk.LEFT)
     transport_artifact_label = tk.Label(transport_artifact_frame, image=photo_images["vc_transport"])
     transport_artifact_label.pack(side=tk.LEFT)
     
     accumuulate_creatures_frame = tk.Frame(control_frame)
     accumuulate_creatures_frame.grid(row=11, column=3, padx=2, pady=2, sticky="w")
-    accumuulate_creatures_checkbox = tk.Checkbutton(accumuulate_creatures_frame, text="Accumulate Creatures", command=load_images)
+    accumuulate_creatures_checkbox = tk.Checkbutton(accumuulate_creatures_frame, text="Accumulate Creatures", variable=filter_vars["victory:creatures"], command=request_filter)
     accumuulate_creatures_checkbox.pack(side=tk.LEFT)
     accumuulate_creatures_label = tk.Label(accumuulate_creatures_frame, image=photo_images["vc_creatures"])
     accumuulate_creatures_label.pack(side=tk.LEFT)
@@ -467,28 +954,28 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     # row 12 - win conditions continued
     capture_town_frame = tk.Frame(control_frame)
     capture_town_frame.grid(row=12, column=0, padx=2, pady=2, sticky="w")
-    capture_town_checkbox = tk.Checkbutton(capture_town_frame, text="Capture specific Town", command=load_images)
+    capture_town_checkbox = tk.Checkbutton(capture_town_frame, text="Capture specific Town", variable=filter_vars["victory:capturecity"], command=request_filter)
     capture_town_checkbox.pack(side=tk.LEFT)
     capture_town_label = tk.Label(capture_town_frame, image=photo_images["vc_capturecity"])
     capture_town_label.pack(side=tk.LEFT)
 
     flag_dwellings_frame = tk.Frame(control_frame)
     flag_dwellings_frame.grid(row=12, column=1, padx=2, pady=2, sticky="w")
-    flag_dwellings_checkbox = tk.Checkbutton(flag_dwellings_frame, text="Flag all creature Dwellings", command=load_images)
+    flag_dwellings_checkbox = tk.Checkbutton(flag_dwellings_frame, text="Flag all creature Dwellings", variable=filter_vars["victory:flagdwellings"], command=request_filter)
     flag_dwellings_checkbox.pack(side=tk.LEFT)
     flag_dwellings_label = tk.Label(flag_dwellings_frame, image=photo_images["vc_flagdwellings"])
     flag_dwellings_label.pack(side=tk.LEFT)
 
     upgrade_town_frame = tk.Frame(control_frame)
     upgrade_town_frame.grid(row=12, column=2, padx=2, pady=2, sticky="w")
-    upgrade_town_checkbox = tk.Checkbutton(upgrade_town_frame, text="Upgrade specific Town", command=load_images)
+    upgrade_town_checkbox = tk.Checkbutton(upgrade_town_frame, text="Upgrade specific Town", variable=filter_vars["victory:buildcity"], command=request_filter)
     upgrade_town_checkbox.pack(side=tk.LEFT)
     upgrade_town_label = tk.Label(upgrade_town_frame, image=photo_images["vc_buildcity"])
     upgrade_town_label.pack(side=tk.LEFT)
 
     accumuulate_resources_frame = tk.Frame(control_frame)
     accumuulate_resources_frame.grid(row=12, column=3, padx=2, pady=2, sticky="w")
-    accumuulate_resources_checkbox = tk.Checkbutton(accumuulate_resources_frame, text="Accumulate resources", command=load_images)
+    accumuulate_resources_checkbox = tk.Checkbutton(accumuulate_resources_frame, text="Accumulate resources", variable=filter_vars["victory:resources"], command=request_filter)
     accumuulate_resources_checkbox.pack(side=tk.LEFT)
     accumuulate_resources_label = tk.Label(accumuulate_resources_frame, image=photo_images["vc_resources"])
     accumuulate_resources_label.pack(side=tk.LEFT)
@@ -497,14 +984,14 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
     # row 13 - win conditions continued
     defeat_hero_frame = tk.Frame(control_frame)
     defeat_hero_frame.grid(row=13, column=0, padx=2, pady=2, sticky="w")
-    defeat_hero_checkbox = tk.Checkbutton(defeat_hero_frame, text="Defeat specific Hero", command=load_images)
+    defeat_hero_checkbox = tk.Checkbutton(defeat_hero_frame, text="Defeat specific Hero", variable=filter_vars["victory:hero"], command=request_filter)
     defeat_hero_checkbox.pack(side=tk.LEFT)
     defeat_hero_label = tk.Label(defeat_hero_frame, image=photo_images["vc_hero"])
     defeat_hero_label.pack(side=tk.LEFT)
 
     flag_mines_frame = tk.Frame(control_frame)
     flag_mines_frame.grid(row=13, column=1, padx=2, pady=2, sticky="w")
-    flag_mines_checkbox = tk.Checkbutton(flag_mines_frame, text="Flag all mines", command=load_images)
+    flag_mines_checkbox = tk.Checkbutton(flag_mines_frame, text="Flag all mines", variable=filter_vars["victory:flagmines"], command=request_filter)
     flag_mines_checkbox.pack(side=tk.LEFT)
     flag_mines_label = tk.Label(flag_mines_frame, image=photo_images["vc_flagmines"])
     flag_mines_label.pack(side=tk.LEFT)
@@ -516,51 +1003,105 @@ def display_gui(root, SCREEN_WIDTH: int, SCREEN_HEIGHT: int, COLS: int, IMAGE_WI
 
     no_conditions_frame = tk.Frame(control_frame)
     no_conditions_frame.grid(row=14, column=1, padx=2, pady=2, sticky="w")
-    no_conditions_checkbox = tk.Checkbutton(no_conditions_frame, text="None", command=load_images)
+    no_conditions_checkbox = tk.Checkbutton(no_conditions_frame, text="None", variable=filter_vars["loss:standard"], command=request_filter)
     no_conditions_checkbox.pack(side=tk.LEFT)
     no_conditions_label = tk.Label(no_conditions_frame, image=photo_images["ls_standard"])
     no_conditions_label.pack(side=tk.LEFT)
 
     lose_hero_frame = tk.Frame(control_frame)
     lose_hero_frame.grid(row=14, column=2, padx=2, pady=2, sticky="w")
-    lose_hero_checkbox = tk.Checkbutton(lose_hero_frame, text="Lose specific Hero", command=load_images)
+    lose_hero_checkbox = tk.Checkbutton(lose_hero_frame, text="Lose specific Hero", variable=filter_vars["loss:hero"], command=request_filter)
     lose_hero_checkbox.pack(side=tk.LEFT)
     lose_hero_label = tk.Label(lose_hero_frame, image=photo_images["ls_hero"])
     lose_hero_label.pack(side=tk.LEFT)
 
     lose_town_frame = tk.Frame(control_frame)
     lose_town_frame.grid(row=14, column=3, padx=2, pady=2, sticky="w")
-    lose_town_checkbox = tk.Checkbutton(lose_town_frame, text="Lose specific Town", command=load_images)
+    lose_town_checkbox = tk.Checkbutton(lose_town_frame, text="Lose specific Town", variable=filter_vars["loss:town"], command=request_filter)
     lose_town_checkbox.pack(side=tk.LEFT)
     lose_town_label = tk.Label(lose_town_frame, image=photo_images["ls_town"])
     lose_town_label.pack(side=tk.LEFT)
 
     time_expire_frame = tk.Frame(control_frame)
     time_expire_frame.grid(row=14, column=4, padx=2, pady=2, sticky="w")
-    time_expire_checkbox = tk.Checkbutton(time_expire_frame, text="Time Expires", command=load_images)
+    time_expire_checkbox = tk.Checkbutton(time_expire_frame, text="Time Expires", variable=filter_vars["loss:timeexpires"], command=request_filter)
     time_expire_checkbox.pack(side=tk.LEFT)
     time_expire_label = tk.Label(time_expire_frame, image=photo_images["ls_timeexpires"])
     time_expire_label.pack(side=tk.LEFT)
 
-    # row 15 - 16 - Slider for adjusting the number of columns
+    # row 15 - played status, from the map journal
+    status_label = tk.Label(control_frame, text="Played", font=("Arial", 12))
+    status_label.grid(row=15, column=0, padx=2, pady=2, sticky="w")
+    unplayed_checkbox = tk.Checkbutton(control_frame, text="Unplayed", variable=filter_vars["status:unplayed"], command=request_filter)
+    unplayed_checkbox.grid(row=15, column=1, padx=2, pady=2, sticky="w")
+    unfinished_checkbox = tk.Checkbutton(control_frame, text="Unfinished", variable=filter_vars["status:unfinished"], command=request_filter)
+    unfinished_checkbox.grid(row=15, column=2, padx=2, pady=2, sticky="w")
+    won_checkbox = tk.Checkbutton(control_frame, text="Won", variable=filter_vars["status:won"], command=request_filter)
+    won_checkbox.grid(row=15, column=3, padx=2, pady=2, sticky="w")
+
+    # checkbox widgets and their text per filter key, for the live map counts
+    filter_checkboxes.update({
+        "liked:yes": (liked_checkbox, liked_checkbox.cget("text")),
+        "subterranean:yes": (subterranean_checkbox, subterranean_checkbox.cget("text")),
+        "status:unplayed": (unplayed_checkbox, unplayed_checkbox.cget("text")),
+        "status:unfinished": (unfinished_checkbox, unfinished_checkbox.cget("text")),
+        "status:won": (won_checkbox, won_checkbox.cget("text")),
+        "expansion:roe": (roe_checkbox, roe_checkbox.cget("text")),
+        "expansion:ab": (ab_checkbox, ab_checkbox.cget("text")),
+        "expansion:sod": (sod_checkbox, sod_checkbox.cget("text")),
+        "expansion:hota": (hota_checkbox, hota_checkbox.cget("text")),
+        "size:S": (small_map_checkbox, small_map_checkbox.cget("text")),
+        "size:M": (medium_map_checkbox, medium_map_checkbox.cget("text")),
+        "size:L": (large_map_checkbox, large_map_checkbox.cget("text")),
+        "size:XL": (extra_large_map_checkbox, extra_large_map_checkbox.cget("text")),
+        "size:H": (huge_map_checkbox, huge_map_checkbox.cget("text")),
+        "size:XH": (extra_huge_map_checkbox, extra_huge_map_checkbox.cget("text")),
+        "size:G": (giant_map_checkbox, giant_map_checkbox.cget("text")),
+        "difficulty:easy": (easy_map_checkbox, easy_map_checkbox.cget("text")),
+        "difficulty:normal": (normal_map_checkbox, normal_map_checkbox.cget("text")),
+        "difficulty:hard": (hard_map_checkbox, hard_map_checkbox.cget("text")),
+        "difficulty:expert": (expert_map_checkbox, expert_map_checkbox.cget("text")),
+        "difficulty:impossible": (impossible_map_checkbox, impossible_map_checkbox.cget("text")),
+        "victory:artifact": (acquire_artifact_checkbox, acquire_artifact_checkbox.cget("text")),
+        "victory:monster": (defeat_monster_checkbox, defeat_monster_checkbox.cget("text")),
+        "victory:survivetime": (survive_checkbox, survive_checkbox.cget("text")),
+        "victory:standard": (standard_checkbox, standard_checkbox.cget("text")),
+        "victory:buildgrail": (build_grail_checkbox, build_grail_checkbox.cget("text")),
+        "victory:allmonsters": (eliminate_monsters_checkbox, eliminate_monsters_checkbox.cget("text")),
+        "victory:transport": (transport_artifact_checkbox, transport_artifact_checkbox.cget("text")),
+        "victory:creatures": (accumuulate_creatures_checkbox, accumuulate_creatures_checkbox.cget("text")),
+        "victory:capturecity": (capture_town_checkbox, capture_town_checkbox.cget("text")),
+        "victory:flagdwellings": (flag_dwellings_checkbox, flag_dwellings_checkbox.cget("text")),
+        "victory:buildcity": (upgrade_town_checkbox, upgrade_town_checkbox.cget("text")),
+        "victory:resources": (accumuulate_resources_checkbox, accumuulate_resources_checkbox.cget("text")),
+        "victory:hero": (defeat_hero_checkbox, defeat_hero_checkbox.cget("text")),
+        "victory:flagmines": (flag_mines_checkbox, flag_mines_checkbox.cget("text")),
+        "loss:standard": (no_conditions_checkbox, no_conditions_checkbox.cget("text")),
+        "loss:hero": (lose_hero_checkbox, lose_hero_checkbox.cget("text")),
+        "loss:town": (lose_town_checkbox, lose_town_checkbox.cget("text")),
+        "loss:timeexpires": (time_expire_checkbox, time_expire_checkbox.cget("text")),
+    })
+    update_filter_counts()
+
+    # row 16 - 17 - Slider for adjusting the number of columns
     cols_slider = tk.Scale(control_frame, from_=1, to=10, orient=tk.HORIZONTAL, label="", command=update_cols, showvalue=False)
-    cols_slider.grid(row=15, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    cols_slider.grid(row=16, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
     cols_label = tk.Label(control_frame, text=f"Columns: {COLS}", font=("Arial", 12))
-    cols_label.grid(row=16, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    cols_label.grid(row=17, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
 
-    # row 17 - 18 - Slider for adjusting the image size
+    # row 18 - 19 - Slider for adjusting the image size
     image_size_slider = tk.Scale(control_frame, from_=100, to=1000, orient=tk.HORIZONTAL, label="", command=update_image_sizes, showvalue=False)
-    image_size_slider.grid(row=17, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    image_size_slider.grid(row=18, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
     image_size_label = tk.Label(control_frame, text=f"Image size: {IMAGE_WIDTH}x{IMAGE_HEIGHT}", font=("Arial", 12))
-    image_size_label.grid(row=18, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    image_size_label.grid(row=19, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
 
-    # row 19 - Reset settings button
+    # row 20 - Reset settings button
     reset_button = tk.Button(control_frame, text="Reset settings", command=reset_settings)
-    reset_button.grid(row=19, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    reset_button.grid(row=20, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
 
-    # row 20 - Progress label
+    # row 21 - Progress label
     progress_label = tk.Label(control_frame, text="", bd=1, relief=tk.SUNKEN, anchor=tk.W, font=("Arial", 12))
-    progress_label.grid(row=20, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
+    progress_label.grid(row=21, column=0, padx=2, pady=2, sticky="ew", columnspan=5)
 
     # Configure column resizing behavior for the control frame
     # if there are 7 checkboxes across 7 columns in a single row
@@ -2,17 +2,227 @@ import os
 import requests
 import urllib.parse # for converting special characters when download e.g. Tovar%27s to Tovar's
 import re
+import json
+import hashlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from map_catalogue import parse_catalogue, save_catalogue, load_catalogue
+from map_verify import check_png, quarantine, note_verified, save_noted
+import perf_trace
 
-def download_images(map_images_dir: str, progress_callback=None):
+BASE_URL: str = "https://heroes.thelazy.net"
+MAX_WORKERS: int = 8 # concurrent map downloads, raise for fast connections, lower to be kinder to the site
+MANIFEST_FILENAME: str = "map_manifest.json"
+CHUNK_SIZE: int = 64 * 1024 # bytes written per streamed chunk
+TIMEOUT: int = 30 # seconds to wait on a stalled connection before giving up on a download
+RESOLVE_MODE: str = "api" # "api" asks the wiki API for many image URLs at once, "scrape" reads every map page
+API_BATCH_SIZE: int = 50 # most titles MediaWiki accepts in one query
+
+def create_session(max_workers: int = MAX_WORKERS) -> requests.Session:
+    """
+    Create one HTTP session shared by all download workers, so every request re-uses
+    a keep-alive connection from the same pool instead of opening a new connection per map
+
+    Args
+
+        max_workers (int): number of worker threads that will share the session, sizes the connection pool
+
+    Returns:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(trace_response)
+    return session
+
+def trace_response(response: requests.Response, *args, **kwargs):
+    """
+    Session response hook recording every request's latency, until its headers arrived, and size for perf_trace
+
+    Returns:
+        None
+    """
+    if not perf_trace.tracer.enabled:
+        return
+    seconds: float = response.elapsed.total_seconds()
+    size: int = int(response.headers.get("Content-Length") or 0)
+    perf_trace.record("http.request", time.perf_counter() - seconds, seconds, url=response.url, status=response.status_code, bytes=size)
+    perf_trace.count("http.bytes", size)
+
+def load_manifest(map_images_dir: str) -> dict:
+    """
+    Load the rescan manifest saved by the last rescan, which remembers for every map its page URL,
+    image URL, ETag/Last-Modified validators, byte size and content hash
+
+    Args
+
+        map_images_dir (str): folder path for map images
+
+    Returns:
+        dict: {"list_page": {...}, "maps": {map name: {...}}}, empty sections if there is no manifest yet
+    """
+    manifest: dict = {"list_page": {}, "maps": {}}
+    try:
+        with open(os.path.join(map_images_dir, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+            manifest.update(json.load(f))
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring unreadable manifest: {str(e)}")
+    return manifest
+
+def save_manifest(map_images_dir: str, manifest: dict):
+    """
+    Save the rescan manifest, written to a temp file then renamed so a crash never leaves half a manifest
+
+    Args
+
+        map_images_dir (str): folder path for map images
+        manifest (dict): manifest from load_manifest
+
+    Returns:
+        None
+    """
+    path: str = os.path.join(map_images_dir, MANIFEST_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def conditional_headers(entry: dict) -> dict:
+    """
+    HTTP headers asking the server to only send a resource if it changed since entry was saved
+
+    Args
+
+        entry (dict): manifest entry holding "etag" and/or "last_modified"
+
+    Returns:
+        dict: request headers
+    """
+    headers: dict = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def image_is_current(map_images_dir: str, entry: dict) -> bool:
+    """
+    Check the image recorded in a manifest entry is still on disk with the size it was downloaded with
+
+    Args
+
+        map_images_dir (str): folder path for map images
+        entry (dict): manifest entry
+
+    Returns:
+        bool
+    """
+    if not entry or not entry.get("filename") or not entry.get("image_url"):
+        return False
+    path: str = os.path.join(map_images_dir, entry["filename"])
+    return os.path.isfile(path) and os.path.getsize(path) == entry.get("size")
+
+def file_sha256(path: str) -> str:
+    """
+    Content hash of a file, read in blocks
+
+    Args
+
+        path (str): file path
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def image_file_title(map_name: str) -> str:
+    """
+    Wiki file page title of a map's image
+
+    Args
+
+        map_name (str): map name from List_of_maps
+
+    Returns:
+        str: e.g. File:Tovar's_Treasure_map_auto.png
+    """
+    return "File:" + map_name.replace(" ", "_") + "_map_auto.png"
+
+def resolve_image_urls(map_names: list, session: requests.Session) -> dict:
+    """
+    Ask the wiki's MediaWiki API for the image URLs of many maps per request (imageinfo query),
+    instead of downloading every map page to find its image
+
+    Args
+
+        map_names (list[str]): map names from List_of_maps
+        session (requests.Session): shared session
+
+    Returns:
+        dict: map name -> image URL, maps the API did not know are left out so they can fall back to scraping
+    """
+    image_urls: dict = {}
+    for start in range(0, len(map_names), API_BATCH_SIZE):
+        titles: dict = {image_file_title(map_name): map_name for map_name in map_names[start:start + API_BATCH_SIZE]}
+        try:
+            response = session.get(BASE_URL + "/api.php", timeout=TIMEOUT, params={
+                "action": "query", "prop": "imageinfo", "iiprop": "url", "format": "json", "formatversion": "2",
+                "titles": "|".join(titles)})
+            response.raise_for_status()
+            query: dict = response.json().get("query", {})
+        except Exception as e:
+            print(f"Image URL lookup failed, falling back to map pages: {str(e)}")
+            return image_urls
+        for normalized in query.get("normalized", []):
+            if normalized["from"] in titles:
+                titles[normalized["to"]] = titles[normalized["from"]]
+        for page in query.get("pages", []):
+            image_info: list = page.get("imageinfo") or []
+            if page.get("title") in titles and image_info and image_info[0].get("url"):
+                image_urls[titles[page["title"]]] = urllib.parse.urljoin(BASE_URL + "/", image_info[0]["url"])
+    return image_urls
+
+def download_images(map_images_dir: str, progress_callback=None, max_workers: int = MAX_WORKERS, session: requests.Session = None, resolve_mode: str = RESOLVE_MODE,
+                    image_callback=None, cancel_event: threading.Event = None):
     """
     Scrap and download all map images, can be targeted to any new repo holding
     Heroes 3 map data/images. So that if any site goes down, this can be tweaked
     to point to the newest online repo to always pull images when rescan button is clicked
 
+    Maps are downloaded concurrently by a bounded pool of worker threads sharing one
+    keep-alive session. progress_callback is always called from the calling thread,
+    with the map count increasing by one per call.
+
+    Rescans are incremental: the List_of_maps page and images are requested with the
+    validators saved in the manifest, so unchanged ones answer 304 without a body. When
+    List_of_maps is unchanged its maps come from the saved catalogue, so maps missing from
+    the manifest or from the folder (failed, cancelled or quarantined) are downloaded again.
+
+    The map table is saved as the map catalogue (see map_catalogue.py) on the way.
+
+    Image URLs of new or changed maps are looked up in batches through the wiki API,
+    maps it cannot resolve fall back to scraping their map page.
+
+    Setting cancel_event stops the rescan after the maps already being downloaded,
+    everything downloaded so far is kept in the manifest.
+
     Args
-    
+
         map_images_dir (str): folder path for map images
         progress_callback - for GUI widget label to callback progress data on how many maps scanned/remaining
+        max_workers (int): number of maps downloaded at the same time
+        session (requests.Session): optional session to re-use, one is created if not given
+        resolve_mode (str): "api" to batch image URL lookups, "scrape" to read every map page
+        image_callback - called from the calling thread with the path of every new or changed image
+        cancel_event (threading.Event): set from another thread to cancel the rescan
 
     Returns:
         None
@@ -20,74 +230,257 @@ def download_images(map_images_dir: str, progress_callback=None):
     if not os.path.exists(map_images_dir):
         os.makedirs(map_images_dir)
 
-    url: str = "https://heroes.thelazy.net/index.php/List_of_maps"
-    response = requests.get(url)
-
-    map_info: dict = {}
-    map_name_tags: list[str] = response.text.split('<td style="text-align:center;">')[1:]
-
-    total_maps: int = len(map_name_tags) // 2
-    current_map: int = 0
-
-    for i in range(0, len(map_name_tags), 2):
-        map_name_tag: str = map_name_tags[i + 1]
-        map_name_match = re.search(r'title="(.*?)"', map_name_tag)
-        map_link_match = re.search(r'href="(.*?)"', map_name_tag)
-        if map_name_match and map_link_match:
-            map_name: str = map_name_match.group(1)
-            map_link: str = "https://heroes.thelazy.net" + map_link_match.group(1)
-            map_info[map_name] = map_link
-
-    for map_name, map_link in map_info.items():
-        current_map += 1
-        progress: str = f"Downloading new images progress: {current_map}/{total_maps}"
-        print(progress)
-        
-        if progress_callback:
-            progress_callback(progress)
-        
-        print(f"Map page URL: {map_link}")  # Print the map page URL
-        image_url: str = map_link + "#/media/File:" + map_name.replace(" ", "_") + "_map_auto.png"
-        print(f"Processing image URL: {image_url}")
-
-        image_response = requests.get(image_url)
-        img_tags = re.findall(r'<img.+?src="([^"]+)"', image_response.text)
-        if img_tags:
-            for img_tag in img_tags:
-                match = re.search(r'/images/(.*?)map_auto.png', img_tag)
-                if match:
-                    download_link: str = "https://heroes.thelazy.net/images/" + match.group(1) + "map_auto.png"
-                    download_link = download_link.replace("/thumb", "")
-                    filename: str = os.path.basename(urllib.parse.unquote(download_link))
-                    download_image(download_link, map_images_dir, filename)
+    max_workers = max(1, max_workers)
+    owns_session = session is None
+    if owns_session:
+        session = create_session(max_workers)
+
+    manifest: dict = load_manifest(map_images_dir)
+    rescan_start: float = time.perf_counter()
+    try:
+        url: str = BASE_URL + "/index.php/List_of_maps"
+        saved_catalogue: dict = load_catalogue(map_images_dir)
+        # without a saved catalogue a 304 would leave nothing to rescan, so the page is asked for in full
+        list_page: dict = manifest["list_page"] if manifest["list_page"].get("url") == url and saved_catalogue else {}
+        response = session.get(url, headers=conditional_headers(list_page), timeout=TIMEOUT)
+
+        if response.status_code == 304:
+            print("List of maps unchanged since last rescan")
+            map_info: dict = {map_name: entry["page_url"] for map_name, entry in saved_catalogue.items()}
         else:
-            print("No download link found.")
+            response.raise_for_status()
+            catalogue: dict = parse_catalogue(response.text, BASE_URL)
+            save_catalogue(map_images_dir, catalogue) # map metadata comes with the same fetch, no per-map requests
+            map_info: dict = {map_name: entry["page_url"] for map_name, entry in catalogue.items()}
+            manifest["list_page"] = {"url": url, "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        total_maps: int = len(map_info)
+        current_map: int = 0
+
+        image_urls: dict = {}
+        if resolve_mode == "api":
+            unresolved: list = [map_name for map_name, map_link in map_info.items()
+                                if not map_is_current(map_images_dir, manifest["maps"].get(map_name), map_link)]
+            image_urls = resolve_image_urls(unresolved, session)
+
+        def record(future):
+            """
+            Add a finished download to the manifest, on the calling thread
+            """
+            nonlocal current_map
+            handled.add(future)
+            try:
+                entry = future.result()
+                if entry:
+                    old_entry: dict = manifest["maps"].get(futures[future]) or {}
+                    path: str = os.path.join(map_images_dir, entry["filename"])
+                    if entry.get("sha256") != old_entry.get("sha256") and path.endswith(".png"):
+                        problem, sha256 = check_png(path)
+                        if problem: # never reaches the grid, downloaded again on the next rescan
+                            quarantine(path, map_images_dir, problem)
+                            manifest["maps"].pop(futures[future], None)
+                            entry = None
+                        else: # the map watcher does not read it again
+                            note_verified(path, sha256)
+                if entry:
+                    manifest["maps"][futures[future]] = entry
+                    if image_callback and entry.get("sha256") != old_entry.get("sha256"):
+                        image_callback(path)
+            except Exception as e:
+                print(f"Failed to process map: {str(e)}")
+            current_map += 1
+            progress: str = f"Downloading new images progress: {current_map}/{total_maps}"
+            print(progress)
+
+            if progress_callback:
+                progress_callback(progress)
+
+        handled: set = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(download_map, map_name, map_link, map_images_dir, session,
+                                       manifest["maps"].get(map_name), image_urls.get(map_name)): map_name
+                       for map_name, map_link in map_info.items()}
+            for future in as_completed(futures):
+                if cancel_event is not None and cancel_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                record(future)
+        # downloads that finished or were already running when the rescan was cancelled are on disk, keep them
+        for future in futures:
+            if future not in handled and not future.cancelled():
+                record(future)
+    finally:
+        save_manifest(map_images_dir, manifest)
+        save_noted(map_images_dir)
+        if owns_session:
+            session.close()
+        perf_trace.record("rescan", rescan_start, time.perf_counter() - rescan_start)
+
+    if cancel_event is not None and cancel_event.is_set():
+        print("Rescanning cancelled.")
+        if progress_callback:
+            progress_callback("Rescanning cancelled")
+        return
 
     print("Completed processing for all maps.")
     if progress_callback:
         progress_callback("Rescanning complete!")
 
-def download_image(image_url: str, save_path: str, filename: str):
+def map_is_current(map_images_dir: str, entry: dict, map_link: str) -> bool:
+    """
+    Check a map's manifest entry still matches its List_of_maps link and image on disk
+
+    Args
+
+        map_images_dir (str): folder path for map images
+        entry (dict): this map's manifest entry from the last rescan, if any
+        map_link (str): map page URL
+
+    Returns:
+        bool
+    """
+    return bool(entry) and entry.get("page_url") == map_link and image_is_current(map_images_dir, entry)
+
+def download_map(map_name: str, map_link: str, map_images_dir: str, session: requests.Session, entry: dict = None, resolved_url: str = None) -> dict:
+    """
+    Find the map image on a map page and download it, runs on a download worker thread
+
+    Args
+
+        map_name (str): map name from List_of_maps
+        map_link (str): map page URL
+        map_images_dir (str): folder path for map images
+        session (requests.Session): shared session
+        entry (dict): this map's manifest entry from the last rescan, if any
+        resolved_url (str): image URL found by resolve_image_urls, the map page is scraped if not given
+
+    Returns:
+        dict: new manifest entry, None if no image was found
+    """
+    new_entry: dict = None
+    if map_is_current(map_images_dir, entry, map_link):
+        if not conditional_headers(entry):
+            return entry # no validators to ask the site with, the image on disk is kept
+        new_entry = download_image(entry["image_url"], map_images_dir, entry["filename"], session, entry)
+        if new_entry:
+            new_entry["page_url"] = map_link
+        return new_entry
+
+    if resolved_url:
+        download_links: list = [resolved_url]
+    else:
+        download_links: list = scrape_image_urls(map_name, map_link, session)
+
+    for download_link in download_links:
+        filename: str = os.path.basename(urllib.parse.unquote(download_link))
+        old_entry: dict = entry if entry and entry.get("image_url") == download_link else None
+        new_entry = download_image(download_link, map_images_dir, filename, session, old_entry) or new_entry
+    if new_entry:
+        new_entry["page_url"] = map_link
+    return new_entry
+
+def scrape_image_urls(map_name: str, map_link: str, session: requests.Session) -> list:
+    """
+    Find a map's image URLs by reading its map page, used for maps the wiki API could not resolve
+
+    Args
+
+        map_name (str): map name from List_of_maps
+        map_link (str): map page URL
+        session (requests.Session): shared session
+
+    Returns:
+        list[str]: image URLs
+    """
+    print(f"Map page URL: {map_link}")  # Print the map page URL
+    image_url: str = map_link + "#/media/" + image_file_title(map_name)
+    print(f"Processing image URL: {image_url}")
+
+    download_links: list = []
+    image_response = session.get(image_url, timeout=TIMEOUT)
+    img_tags = re.findall(r'<img.+?src="([^"]+)"', image_response.text)
+    if img_tags:
+        for img_tag in img_tags:
+            match = re.search(r'/images/(.*?)map_auto.png', img_tag)
+            if match:
+                download_link: str = BASE_URL + "/images/" + match.group(1) + "map_auto.png"
+                download_links.append(download_link.replace("/thumb", ""))
+    else:
+        print("No download link found.")
+    return download_links
+
+def download_image(image_url: str, save_path: str, filename: str, session: requests.Session = None, entry: dict = None) -> dict:
     """
     Download an image from the given URL and save it to the specified path with the given filename.
 
+    If entry holds ETag/Last-Modified validators for an image already on disk, the image is
+    requested conditionally and only downloaded again if the server has a newer one.
+
+    The image is streamed in chunks to filename + ".part" and only renamed to filename once
+    it is complete, so an interrupted download or an error page never looks like an image.
+    A leftover .part file is resumed with a Range request on the next rescan.
+
     Args
-    
+
         image_url (str): URL of the image to download
         save_path (str): Path where the image should be saved
         filename (str): Name of the file to save as
+        session (requests.Session): optional shared session to download with
+        entry (dict): manifest entry from the last download of this image, if any
 
     Returns:
-        None
+        dict: manifest entry for the image, None if the download failed
     """
-    if os.path.exists(os.path.join(save_path, filename)):
-        print(f"Image already exists: {os.path.join(save_path, filename)}")
-    else:
-        try:
-            response = requests.get(image_url)
-            with open(os.path.join(save_path, filename), 'wb') as f:
-                f.write(response.content)
-            print(f"Image downloaded: {os.path.join(save_path, filename)}")
-        except Exception as e:
-            print(f"Failed to download image from {image_url}: {str(e)}")
+    path: str = os.path.join(save_path, filename)
+    part_path: str = path + ".part"
+    headers: dict = {}
+    if os.path.exists(path):
+        if not entry or not (entry.get("etag") or entry.get("last_modified")):
+            print(f"Image already exists: {path}")
+            return {"image_url": image_url, "filename": filename, "etag": None, "last_modified": None,
+                    "size": os.path.getsize(path), "sha256": file_sha256(path)}
+        headers = conditional_headers(entry)
+    elif os.path.exists(part_path) and os.path.getsize(part_path) > 0:
+        headers = {"Range": f"bytes={os.path.getsize(part_path)}-"}
+    try:
+        with (session or requests).get(image_url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 304:
+                print(f"Image unchanged: {path}")
+                return entry
+            if response.status_code == 416: # .part is stale or already longer than the image, start again
+                os.remove(part_path)
+                return download_image(image_url, save_path, filename, session, entry)
+            if response.status_code not in (200, 206):
+                raise ValueError(f"unexpected status code {response.status_code}")
+            content_type: str = response.headers.get("Content-Type", "")
+            if not content_type.startswith("image/"):
+                raise ValueError(f"unexpected content type {content_type or 'missing'}")
+
+            digest = hashlib.sha256()
+            resume_from: int = 0
+            if response.status_code == 206:
+                resume_from = int(re.match(r"bytes (\d+)-", response.headers.get("Content-Range", "")).group(1))
+                if resume_from != os.path.getsize(part_path):
+                    raise ValueError("server resumed from the wrong offset")
+                with open(part_path, "rb") as f:
+                    for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        digest.update(block)
+            expected_size: int = resume_from + int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+
+            size: int = resume_from
+            with open(part_path, "ab" if resume_from else "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            if expected_size is not None and size != expected_size:
+                raise ValueError(f"connection closed after {size} of {expected_size} bytes, will resume on next rescan")
 
+            os.replace(part_path, path)
+            print(f"Image downloaded: {path}")
+            return {"image_url": image_url, "filename": filename, "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "size": size, "sha256": digest.hexdigest()}
+    except Exception as e:
+        print(f"Failed to download image from {image_url}: {str(e)}")
+        return None
@@ -0,0 +1,146 @@
+# /icon_atlas.py
+
+import os
+import sys
+import json
+import math
+from PIL import Image
+from image_decode import decode_resized
+
+ICON_SIZE: int = 32 # icons are shown at ICON_SIZE x ICON_SIZE
+ICON_EXTENSIONS: tuple = (".png", ".gif", ".jpg", ".jpeg")
+ATLAS_FILENAME: str = "icon_atlas.png"
+ATLAS_INDEX_FILENAME: str = "icon_atlas.json"
+NON_ICON_ASSETS: set = {"animation.gif", "page.png", ATLAS_FILENAME} # animations and backgrounds are not packed as icons
+
+def icon_sources(directory: str) -> dict:
+    """
+    Icon image files of an assets folder
+
+    Args:
+        directory (str): assets folder
+
+    Returns:
+        dict: icon name (file name without extension) -> file name
+    """
+    sources: dict = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(ICON_EXTENSIONS) and filename not in NON_ICON_ASSETS:
+            sources[os.path.splitext(filename)[0]] = filename
+    return sources
+
+def source_signature(directory: str, sources: dict) -> dict:
+    """
+    Returns:
+        dict: file name -> file size, the atlas is rebuilt when this changes
+    """
+    return {filename: os.path.getsize(os.path.join(directory, filename)) for filename in sources.values()}
+
+def build_atlas(directory: str, size: int = ICON_SIZE) -> dict:
+    """
+    Pack every icon of an assets folder, resized to size x size, into one sprite sheet image
+    ATLAS_FILENAME with the position of every icon in ATLAS_INDEX_FILENAME
+
+    Args:
+        directory (str): assets folder
+        size (int): icon size
+
+    Returns:
+        dict: atlas index {"size", "icons": {name: [x, y]}, "sources": {file name: file size}}
+    """
+    sources = icon_sources(directory)
+    cols = max(1, math.ceil(math.sqrt(len(sources))))
+    rows = max(1, math.ceil(len(sources) / cols))
+    atlas = Image.new("RGBA", (cols * size, rows * size))
+    icons: dict = {}
+    for i, (name, filename) in enumerate(sources.items()):
+        path = os.path.join(directory, filename)
+        try:
+            with decode_resized(path, size, size) as resized:
+                icon = resized.convert("RGBA")
+        except Exception as e:
+            print(f"Error loading image {path}: {e}")
+            continue
+        x, y = i % cols * size, i // cols * size
+        atlas.paste(icon, (x, y))
+        icons[name] = [x, y]
+
+    index = {"size": size, "icons": icons, "sources": source_signature(directory, sources)}
+    atlas.save(os.path.join(directory, ATLAS_FILENAME) + ".tmp", format="PNG", optimize=True)
+    with open(os.path.join(directory, ATLAS_INDEX_FILENAME) + ".tmp", "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(os.path.join(directory, ATLAS_FILENAME) + ".tmp", os.path.join(directory, ATLAS_FILENAME))
+    os.replace(os.path.join(directory, ATLAS_INDEX_FILENAME) + ".tmp", os.path.join(directory, ATLAS_INDEX_FILENAME))
+    return index
+
+def load_atlas_index(directory: str, size: int = ICON_SIZE) -> dict:
+    """
+    Read the atlas index, building the atlas first when it is missing, at another size or older
+    than the icons in the folder
+
+    Returns:
+        dict: atlas index, see build_atlas
+    """
+    try:
+        with open(os.path.join(directory, ATLAS_INDEX_FILENAME)) as f:
+            index = json.load(f)
+        if (index["size"] == size and os.path.isfile(os.path.join(directory, ATLAS_FILENAME))
+                and index["sources"] == source_signature(directory, icon_sources(directory))):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_atlas(directory, size)
+
+class IconAtlas(dict):
+    """
+    Icons by name, used like the dict of PhotoImages it replaces. Only the atlas index is read on
+    start, the atlas image is decoded on the first icon asked for and every icon becomes a
+    PhotoImage on its first use.
+    """
+    def __init__(self, directory: str, size: int = ICON_SIZE, make_photo=None):
+        """
+        Args:
+            directory (str): assets folder
+            size (int): icon size
+            make_photo: function (PIL Image) -> PhotoImage, ImageTk.PhotoImage if not given
+        """
+        super().__init__()
+        self.directory = directory
+        self.index = load_atlas_index(directory, size)
+        self.make_photo = make_photo
+        self.atlas = None # decoded sprite sheet, loaded on first use
+
+    def __missing__(self, name: str):
+        """
+        Cut an icon out of the atlas the first time it is used
+
+        Returns:
+            PhotoImage
+        """
+        if name not in self.index["icons"]:
+            raise KeyError(name)
+        if self.atlas is None:
+            with Image.open(os.path.join(self.directory, ATLAS_FILENAME)) as atlas:
+                self.atlas = atlas.convert("RGBA")
+        if self.make_photo is None:
+            from PIL import ImageTk # needs Tk, imported when the first icon is shown
+            self.make_photo = ImageTk.PhotoImage
+        x, y = self.index["icons"][name]
+        size = self.index["size"]
+        photo = self.make_photo(self.atlas.crop((x, y, x + size, y + size)))
+        self[name] = photo
+        return photo
+
+    def __contains__(self, name) -> bool:
+        return name in self.index["icons"]
+
+    def names(self) -> list:
+        """
+        Returns:
+            list[str]: every icon name in the atlas
+        """
+        return list(self.index["icons"])
+
+if __name__ == '__main__':
+    index = build_atlas(sys.argv[1] if len(sys.argv) > 1 else "assets")
+    print(f"Packed {len(index['icons'])} icons")
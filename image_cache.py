@@ -0,0 +1,106 @@
+# /image_cache.py
+
+from collections import OrderedDict
+
+DEFAULT_BUDGET_BYTES: int = 256 * 1024 * 1024 # decoded map images kept in memory between renders
+
+class ImageCache:
+    """
+    Least recently used cache of decoded, resized map images keyed by (path, width, height),
+    limited to a byte budget. Going back to a size or filter that was shown before re-uses the
+    images instead of decoding them again. Only used from the Tk thread, so there is no locking.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_BUDGET_BYTES):
+        """
+        Args:
+            max_bytes (int): memory budget, least recently used images are evicted above it
+        """
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict() # (path, width, height) -> (image, size in bytes)
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, path: str, width: int, height: int):
+        """
+        Returns:
+            cached image, None if it is not cached
+        """
+        key = (path, width, height)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, path: str, width: int, height: int, image, nbytes: int = None):
+        """
+        Cache an image and evict the least recently used ones until the cache fits its budget
+
+        Args:
+            path (str): map image path
+            width (int): image width
+            height (int): image height
+            image: decoded image e.g. a PhotoImage
+            nbytes (int): memory used by image, estimated as 4 bytes per pixel if not given
+
+        Returns:
+            None
+        """
+        key = (path, width, height)
+        if nbytes is None:
+            nbytes = width * height * 4
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (image, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_bytes) = self.entries.popitem(last=False)
+            self.bytes -= evicted_bytes
+            self.evictions += 1
+
+    def get_or_load(self, path: str, width: int, height: int, load):
+        """
+        Cached image, loaded with load(path, width, height) and cached on a miss
+
+        Returns:
+            image
+        """
+        image = self.get(path, width, height)
+        if image is None:
+            image = load(path, width, height)
+            self.put(path, width, height, image)
+        return image
+
+    def invalidate(self, path: str):
+        """
+        Drop every cached size of a map image, e.g. after a rescan replaced it
+
+        Returns:
+            None
+        """
+        for key in [key for key in self.entries if key[0] == path]:
+            self.bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Drop everything
+
+        Returns:
+            None
+        """
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: hits, misses, evictions, hit rate, cached images and bytes used
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "images": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,116 @@
+# /image_decode.py
+
+import os
+import threading
+from contextlib import contextmanager
+from PIL import Image
+import perf_trace
+
+# low memory decoding of map images to a small size, used for thumbnails, similarity features and icons
+# every decode reserves the memory of its full size bitmap from one budget shared by all threads, so however
+# many workers decode at once the decoded bitmaps together stay under DECODE_MEMORY_LIMIT. Pillow keeps that much
+# of freed bitmap memory in its own block cache shared by all threads, otherwise the C allocator holds on to the
+# freed bitmaps of every worker thread separately and the process grows with the number of workers anyway
+DECODE_MEMORY_ENV: str = "HEROES3_DECODE_MEMORY_MB" # set to change the limit without code, in megabytes
+DECODE_MEMORY_LIMIT: int = int(os.environ.get(DECODE_MEMORY_ENV, 96)) * 1024 * 1024 # bytes of full size bitmaps decoded at once
+REDUCING_GAP: float = 2.0 # reduce by whole factors down to this many times the target size, then resample
+
+class MemoryBudget:
+    """
+    Bytes that decodes in progress may hold, shared between threads. A decode waits until its bytes fit,
+    one larger than the whole limit waits until it is alone and then runs anyway.
+    """
+    def __init__(self, limit: int):
+        self.limit: int = limit
+        self.used: int = 0
+        self.peak: int = 0 # most bytes held at once, for benchmarks
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        """
+        Hold nbytes of the budget for a with block, waiting until they fit
+
+        Returns:
+            None
+        """
+        with self.condition:
+            while self.used and self.used + nbytes > self.limit:
+                self.condition.wait()
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.used -= nbytes
+                self.condition.notify_all()
+
+budget = MemoryBudget(DECODE_MEMORY_LIMIT) # the program's decode budget
+
+def set_memory_limit(limit: int):
+    """
+    Change the bytes of full size bitmaps decoded at once, e.g. from a --decode-memory flag, and size
+    Pillow's block cache to match
+
+    Returns:
+        None
+    """
+    with budget.condition:
+        budget.limit = limit
+        budget.condition.notify_all()
+    Image.core.set_blocks_max(limit // Image.core.get_block_size())
+
+def bitmap_bytes(image: Image.Image) -> int:
+    """
+    Returns:
+        int: memory of the decoded bitmap of an opened image, Pillow keeps 4 bytes per pixel for every multi band
+        mode, palette images also need an RGB copy to be reduced
+    """
+    pixels: int = image.width * image.height
+    if image.mode in ("P", "1"):
+        return pixels * 5
+    return pixels * (4 if len(image.getbands()) > 1 else 1)
+
+def reduce_factor(size: tuple, target: tuple) -> tuple:
+    """
+    Returns:
+        tuple: whole (x, y) factors to reduce an image of size by that keep it at least REDUCING_GAP times target
+    """
+    return tuple(max(1, int(source / (wanted * REDUCING_GAP))) for source, wanted in zip(size, target))
+
+def decode_resized(path: str, width: int, height: int, resample: int = Image.BICUBIC) -> Image.Image:
+    """
+    Decode an image straight to width x height with as little memory as the format allows: formats that can
+    decode at a lower resolution (JPEG) do, others are decoded once and box reduced by whole factors before
+    the final resample filter. The file and the full size bitmap are released before returning.
+
+    Args:
+        path (str): image path
+        width (int): target width
+        height (int): target height
+        resample (int): final filter, e.g. Image.BICUBIC or Image.BOX
+
+    Returns:
+        Image: the resized image, the only bitmap still held
+    """
+    with Image.open(path) as source:
+        source.draft(source.mode, (int(width * REDUCING_GAP), int(height * REDUCING_GAP)))
+        with budget.reserve(bitmap_bytes(source)):
+            with perf_trace.span("image.decode", path=os.path.basename(path)):
+                source.load()
+            image = source
+            if source.mode in ("P", "1"): # palette images can not be reduced and would resize with nearest neighbour
+                image = source.convert("RGBA" if "transparency" in source.info else "RGB")
+                source.close()
+            try:
+                factor = reduce_factor(image.size, (width, height))
+                if factor == (1, 1):
+                    return image.resize((width, height), resample)
+                with image.reduce(factor) as reduced:
+                    image.close() # frees the full size bitmap before the final filter runs
+                    return reduced.resize((width, height), resample)
+            finally:
+                image.close()
+
+set_memory_limit(DECODE_MEMORY_LIMIT)
@@ -0,0 +1,192 @@
+# /image_similarity.py
+
+import os
+import numpy as np
+from PIL import Image
+from image_decode import decode_resized
+
+FEATURES_FILENAME: str = "map_features.npz"
+FEATURE_SIZE: int = 64 # maps are scaled down to FEATURE_SIZE x FEATURE_SIZE before their features are taken
+HASH_SIZE: int = 8 # perceptual hash is HASH_SIZE x HASH_SIZE bits
+
+# Heroes 3 minimap colours of every terrain, map images are classified pixel by pixel to the nearest one
+TERRAIN_COLOURS: dict = {
+    "dirt": (82, 56, 8), "sand": (222, 207, 140), "grass": (0, 65, 0), "snow": (181, 199, 198),
+    "swamp": (74, 134, 107), "rough": (132, 113, 49), "subterranean": (132, 48, 0), "lava": (74, 73, 74),
+    "water": (8, 81, 148), "rock": (0, 0, 0),
+}
+TERRAINS: list = list(TERRAIN_COLOURS)
+PALETTE = np.array([TERRAIN_COLOURS[terrain] for terrain in TERRAINS], dtype=np.int32)
+
+def dct_matrix(size: int) -> np.ndarray:
+    """
+    Returns:
+        ndarray: size x size DCT-II basis, so D @ block @ D.T is the 2D DCT of block
+    """
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+DCT_32 = dct_matrix(32)
+
+def image_features(path: str) -> tuple:
+    """
+    Compute the features of one map image from a small copy of it
+
+    Args:
+        path (str): map image path
+
+    Returns:
+        tuple: (perceptual hash as HASH_SIZE bytes, terrain histogram as fractions per TERRAINS)
+    """
+    with decode_resized(path, FEATURE_SIZE, FEATURE_SIZE, Image.BOX) as resized:
+        small = resized.convert("RGB")
+
+    grey = np.asarray(small.convert("L").resize((32, 32), Image.BOX), dtype=np.float64)
+    low_frequencies = (DCT_32 @ grey @ DCT_32.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    phash = np.packbits(low_frequencies > np.median(low_frequencies[1:])) # the DC term is left out of the median
+
+    pixels = np.asarray(small, dtype=np.int32).reshape(-1, 3)
+    nearest = ((pixels[:, None, :] - PALETTE[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    histogram = np.bincount(nearest, minlength=len(TERRAINS)) / len(pixels)
+    return phash, histogram.astype(np.float32)
+
+class FeatureIndex:
+    """
+    Per map feature vectors (perceptual hash, terrain colour histogram) kept in one NumPy .npz file
+    next to the map images. Every query is a vectorized distance over all maps at once.
+    """
+    def __init__(self, map_images_dir: str):
+        """
+        Args:
+            map_images_dir (str): folder path for map images
+        """
+        self.map_images_dir = map_images_dir
+        self.path = os.path.join(map_images_dir, FEATURES_FILENAME)
+        self.filenames = np.array([], dtype=str)
+        self.versions = np.zeros((0, 2), dtype=np.int64) # (mtime_ns, size) the features were taken from
+        self.hashes = np.zeros((0, HASH_SIZE), dtype=np.uint8)
+        self.histograms = np.zeros((0, len(TERRAINS)), dtype=np.float32)
+        self.load()
+
+    def load(self):
+        """
+        Load the saved features, starts empty if there are none or they are unreadable
+
+        Returns:
+            None
+        """
+        try:
+            with np.load(self.path) as saved:
+                self.filenames, self.versions = saved["filenames"], saved["versions"]
+                self.hashes, self.histograms = saved["hashes"], saved["histograms"]
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def save(self):
+        """
+        Save the features, written to a temp file then renamed
+
+        Returns:
+            None
+        """
+        with open(self.path + ".tmp", "wb") as f:
+            np.savez(f, filenames=self.filenames, versions=self.versions, hashes=self.hashes, histograms=self.histograms)
+        os.replace(self.path + ".tmp", self.path)
+
+    def update(self, progress_callback=None) -> int:
+        """
+        Index new and changed map images and forget deleted ones, images already indexed are not opened
+
+        Args:
+            progress_callback - called with a status text every few images
+
+        Returns:
+            int: number of images indexed
+        """
+        current: dict = {}
+        for entry in os.listdir(self.map_images_dir):
+            path = os.path.join(self.map_images_dir, entry)
+            if entry.endswith(".png") and os.path.isfile(path):
+                stat = os.stat(path)
+                current[entry] = (stat.st_mtime_ns, stat.st_size)
+
+        keep = [i for i, filename in enumerate(self.filenames)
+                if filename in current and tuple(self.versions[i]) == current[filename]]
+        known = {str(self.filenames[i]) for i in keep}
+        new = sorted(filename for filename in current if filename not in known)
+
+        hashes, histograms, indexed = [], [], []
+        for count, filename in enumerate(new, 1):
+            try:
+                phash, histogram = image_features(os.path.join(self.map_images_dir, filename))
+            except Exception as e:
+                print(f"Error indexing image {filename}: {e}")
+                continue
+            hashes.append(phash)
+            histograms.append(histogram)
+            indexed.append(filename)
+            if progress_callback and count % 25 == 0:
+                progress_callback(f"Indexing map images: {count}/{len(new)}")
+
+        if indexed or len(keep) != len(self.filenames):
+            self.filenames = np.concatenate([self.filenames[keep], np.array(indexed, dtype=str)])
+            self.versions = np.concatenate([self.versions[keep], np.array([current[f] for f in indexed], dtype=np.int64).reshape(-1, 2)])
+            self.hashes = np.concatenate([self.hashes[keep], np.array(hashes, dtype=np.uint8).reshape(-1, HASH_SIZE)])
+            self.histograms = np.concatenate([self.histograms[keep], np.array(histograms, dtype=np.float32).reshape(-1, len(TERRAINS))])
+            self.save()
+        return len(indexed)
+
+    def similar_to(self, filename: str, limit: int = None) -> list:
+        """
+        Maps that look like a map: perceptual hash distance and terrain histogram distance, equally weighted
+
+        Args:
+            filename (str): file name of the map image in map_images_dir
+            limit (int): most results to return, all if not given
+
+        Returns:
+            list[str]: map image file names, most similar first, the map itself included first
+        """
+        matches = np.flatnonzero(self.filenames == filename)
+        if not len(matches):
+            return []
+        i = matches[0]
+        hash_distance = np.unpackbits(self.hashes ^ self.hashes[i], axis=1).sum(axis=1) / (HASH_SIZE * 8)
+        histogram_distance = np.abs(self.histograms - self.histograms[i]).sum(axis=1) / 2
+        return self.ranked((hash_distance + histogram_distance) / 2, limit)
+
+    def terrain_query(self, terrains: dict, limit: int = None) -> list:
+        """
+        Maps with the most of the given terrains e.g. {"water": 1, "lava": 0.5} for mostly water, lots of lava
+
+        Args:
+            terrains (dict): terrain name from TERRAINS -> weight
+            limit (int): most results to return, all if not given
+
+        Returns:
+            list[str]: map image file names, best match first
+        """
+        weights = np.array([terrains.get(terrain, 0) for terrain in TERRAINS], dtype=np.float32)
+        return self.ranked(-(self.histograms @ weights), limit)
+
+    def ratios(self, filename: str) -> dict:
+        """
+        Returns:
+            dict: terrain -> share of the map image, empty if it is not indexed
+        """
+        matches = np.flatnonzero(self.filenames == filename)
+        if not len(matches):
+            return {}
+        return {terrain: float(share) for terrain, share in zip(TERRAINS, self.histograms[matches[0]])}
+
+    def ranked(self, distances: np.ndarray, limit: int = None) -> list:
+        """
+        Returns:
+            list[str]: file names ordered by ascending distance
+        """
+        order = np.argsort(distances, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [str(filename) for filename in self.filenames[order]]
@@ -0,0 +1,192 @@
+# /map_catalogue.py
+
+import os
+import re
+import json
+import urllib.parse
+from html.parser import HTMLParser
+
+CATALOGUE_FILENAME: str = "map_catalogue.json"
+
+# List_of_maps shows size, expansion, difficulty and conditions as icons, the same icons as in assets/
+MAP_SIZES: dict = {"sz0_s": "S", "sz1_m": "M", "sz2_l": "L", "sz3_xl": "XL", "sz4_h": "H", "sz5_xh": "XH", "sz6_g": "G"}
+ICON_FIELDS: dict = {"sz": "size", "v": "expansion", "dif": "difficulty", "vc": "victory", "ls": "loss"}
+ICON_PATTERN = re.compile(r'(?:^|/|-)((sz\d|v|dif|vc|ls)_[a-z]+)\.(?:gif|png)', re.IGNORECASE)
+
+def map_name_from_filename(filename: str) -> str:
+    """
+    Map name shown in the GUI for a map image file, e.g. Tovar%27s_Treasure_map_auto.png -> Tovar's Treasure
+
+    Args:
+        filename (str): map image file name or path
+
+    Returns:
+        str: map name
+    """
+    map_name = os.path.splitext(os.path.basename(filename))[0]
+    cleaned_name = map_name.replace('_', ' ').replace(' map auto', '')
+    return urllib.parse.unquote(cleaned_name)
+
+def catalogue_key(map_name: str) -> str:
+    """
+    Catalogue key for a map title from the wiki, matching map_name_from_filename for the map's image
+
+    Args:
+        map_name (str): map title
+
+    Returns:
+        str: catalogue key
+    """
+    return urllib.parse.unquote(map_name.replace('_', ' ')).strip()
+
+class MapTableParser(HTMLParser):
+    """
+    Collect the rows of every table in the List_of_maps page, each cell as its text, icons and links
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows: list = []
+        self.headers: list = []
+        self.row: list = None
+        self.cell: dict = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "tr":
+            self.row = []
+        elif tag in ("td", "th") and self.row is not None:
+            self.cell = {"header": tag == "th", "text": "", "icons": [], "links": []}
+            self.row.append(self.cell)
+        elif tag == "img" and self.cell is not None:
+            self.cell["icons"].append(urllib.parse.unquote(attrs.get("src") or ""))
+        elif tag == "a" and self.cell is not None and attrs.get("href"):
+            self.cell["links"].append((attrs["href"], attrs.get("title") or ""))
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th"):
+            self.cell = None
+        elif tag == "tr" and self.row is not None:
+            if self.row and all(cell["header"] for cell in self.row):
+                self.headers = [cell["text"].strip().lower() for cell in self.row]
+            elif self.row:
+                self.rows.append((self.headers, self.row))
+            self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell["text"] += data
+
+def parse_map_row(headers: list, row: list, base_url: str) -> tuple:
+    """
+    Turn one List_of_maps table row into a catalogue entry
+
+    Args:
+        headers (list[str]): lower case column headers of the row's table, may be empty
+        row (list[dict]): cells from MapTableParser
+        base_url (str): site URL map page links are relative to
+
+    Returns:
+        tuple: (catalogue key, entry dict), (None, None) if the row is not a map
+    """
+    entry: dict = {"page_url": None, "size": None, "expansion": None, "difficulty": None,
+                   "victory": [], "loss": [], "players": None, "subterranean": False}
+    map_name: str = None
+    for index, cell in enumerate(row):
+        header: str = headers[index] if index < len(headers) else ""
+        text: str = " ".join(cell["text"].split())
+
+        for icon in cell["icons"]:
+            match = ICON_PATTERN.search(icon)
+            if not match:
+                continue
+            icon_name, prefix = match.group(1).lower(), match.group(2).lower()
+            field: str = "size" if prefix.startswith("sz") else ICON_FIELDS[prefix]
+            value: str = MAP_SIZES.get(icon_name) or icon_name.split("_", 1)[1]
+            if field in ("victory", "loss"):
+                entry[field].append(value)
+            else:
+                entry[field] = value
+
+        page_links = [(href, title) for href, title in cell["links"] if title and "File:" not in href and "/images/" not in href]
+        if map_name is None and page_links and header in ("", "map", "name", "map name", "title"):
+            href, title = page_links[0]
+            map_name = title
+            entry["page_url"] = urllib.parse.urljoin(base_url, href)
+        elif "player" in header and text:
+            entry["players"] = text
+        elif "size" in header and text and not entry["size"]:
+            entry["size"] = text.split()[0].upper()
+        elif ("level" in header or "underground" in header or "subterranean" in header) and text:
+            entry["subterranean"] = text.lower() not in ("no", "1", "-", "none")
+
+    if map_name is None:
+        return None, None
+    return catalogue_key(map_name), entry
+
+def parse_catalogue(html: str, base_url: str) -> dict:
+    """
+    Parse every map in the List_of_maps page with its size, expansion, difficulty, victory and loss conditions,
+    players and levels, so the GUI filters never need a map page request or an image decode
+
+    Args:
+        html (str): List_of_maps page HTML
+        base_url (str): site URL map page links are relative to
+
+    Returns:
+        dict: catalogue key -> entry
+    """
+    parser = MapTableParser()
+    parser.feed(html)
+    parser.close()
+
+    catalogue: dict = {}
+    for headers, row in parser.rows:
+        key, entry = parse_map_row(headers, row, base_url)
+        if key and key not in catalogue:
+            catalogue[key] = entry
+    return catalogue
+
+def load_catalogue(map_images_dir: str) -> dict:
+    """
+    Load the map catalogue saved by the last rescan
+
+    Args:
+        map_images_dir (str): folder path for map images
+
+    Returns:
+        dict: catalogue key -> entry, empty if no rescan has saved one yet
+    """
+    try:
+        with open(os.path.join(map_images_dir, CATALOGUE_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_catalogue(map_images_dir: str, catalogue: dict):
+    """
+    Save the map catalogue as compact JSON, written to a temp file then renamed
+
+    Args:
+        map_images_dir (str): folder path for map images
+        catalogue (dict): catalogue from parse_catalogue
+
+    Returns:
+        None
+    """
+    path: str = os.path.join(map_images_dir, CATALOGUE_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(catalogue, f, separators=(",", ":"), sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def catalogue_entry(catalogue: dict, filename: str) -> dict:
+    """
+    Catalogue entry for a map image file
+
+    Args:
+        catalogue (dict): catalogue from load_catalogue
+        filename (str): map image file name or path
+
+    Returns:
+        dict: entry, None if the map is not in the catalogue
+    """
+    return catalogue.get(map_name_from_filename(filename))
@@ -0,0 +1,186 @@
+# /map_cli.py
+
+import os
+import sys
+import json
+import queue
+import time
+import argparse
+from download_images import MAX_WORKERS, RESOLVE_MODE
+from map_filters import FILTER_KEYS
+from map_library import MapLibrary
+from map_watcher import MapWatcher, POLL_SECONDS
+import image_decode
+import perf_trace
+
+DEFAULT_MAPS_DIR: str = "assets/map_images"
+DEFAULT_THUMBNAIL_SIZES: list = [300] # the grid's default image size
+
+def scan(library: MapLibrary, args) -> int:
+    """
+    Download new and changed map images
+
+    Returns:
+        int: exit code
+    """
+    library.rescan(max_workers=args.workers, resolve_mode=args.resolve)
+    return 0
+
+def index(library: MapLibrary, args) -> int:
+    """
+    Index the maps and print how many match every filter, then index the map images for the
+    similar maps search unless --no-similarity
+
+    Returns:
+        int: exit code
+    """
+    paths = library.load()
+    print(f"{len(paths)} maps")
+    for key, count in library.counts(set(), FILTER_KEYS).items():
+        print(f"{key:24} {count}")
+    if args.no_similarity:
+        return 0
+    try:
+        import image_similarity # needs numpy
+    except ImportError:
+        print("Similar maps index needs numpy: pip install numpy")
+        return 1
+    features = image_similarity.FeatureIndex(library.map_images_dir)
+    print(f"Indexed {features.update(print)} map images for similar maps")
+    return 0
+
+def verify(library: MapLibrary, args) -> int:
+    """
+    Quarantine broken map images and delete duplicates
+
+    Returns:
+        int: exit code
+    """
+    result = library.verify()
+    print(f"Checked {result['checked']} map images, quarantined {len(result['quarantined'])}, deleted {len(result['duplicates'])} duplicates")
+    return 0
+
+def thumbs(library: MapLibrary, args) -> int:
+    """
+    Fill the thumbnail cache at the given sizes
+
+    Returns:
+        int: exit code
+    """
+    done = library.make_thumbnails(args.sizes, max_workers=args.workers)
+    print(f"{done} thumbnails in {library.thumbnail_cache_dir}")
+    return 0
+
+def watch(library: MapLibrary, args) -> int:
+    """
+    Keep the thumbnail cache up to date: make the thumbnails of every map image added to or changed in
+    the folder as it happens, until Ctrl+C
+
+    Returns:
+        int: exit code
+    """
+    library.load()
+    changes = queue.Queue()
+    watcher = MapWatcher(library.map_images_dir, lambda batch: changes.put(library.check(batch)), poll_seconds=args.poll)
+    watcher.start()
+    print(f"Watching {library.map_images_dir} ({watcher.mode}), Ctrl+C to stop")
+    try:
+        while True:
+            for kind, path in library.update(changes.get()):
+                print(f"{kind} {os.path.basename(path)}")
+                if kind != "removed":
+                    library.make_thumbnails(args.sizes, [path])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+    return 0
+
+def export(library: MapLibrary, args) -> int:
+    """
+    Write the maps matching the filters and search, with their catalogue and journal entries, as JSON,
+    and with --zip and --contact-sheet as a zip archive of the images and a printable PDF
+
+    Returns:
+        int: exit code
+    """
+    library.load()
+    paths = library.query(set(args.filter), args.search, sort=args.sort)
+    if args.zip or args.contact_sheet:
+        library.export(paths, args.zip, args.contact_sheet)
+        if args.output is None:
+            return 0
+    maps = [library.describe(path) for path in paths]
+    if args.output in (None, "-"):
+        json.dump(maps, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(maps, f, indent=1)
+        print(f"Exported {len(maps)} maps to {args.output}")
+    return 0
+
+def main(argv: list = None) -> int:
+    """
+    Command line for batch jobs on the map images folder, runs without a display
+
+    Args:
+        argv (list[str]): arguments, sys.argv[1:] if not given
+
+    Returns:
+        int: exit code
+    """
+    parser = argparse.ArgumentParser(description="Heroes 3 Map Liker without the GUI")
+    parser.add_argument("--maps", default=DEFAULT_MAPS_DIR, help="map images folder")
+    parser.add_argument("--trace", help=f"write a Chrome trace of the run to this file, like setting {perf_trace.TRACE_ENV}")
+    parser.add_argument("--decode-memory", type=int, help=f"megabytes of full size map images decoded at once, like setting {image_decode.DECODE_MEMORY_ENV}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser("scan", help="download new and changed map images")
+    scan_parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="maps downloaded at the same time")
+    scan_parser.add_argument("--resolve", choices=["api", "scrape"], default=RESOLVE_MODE, help="how map image URLs are looked up")
+    scan_parser.set_defaults(run=scan)
+
+    index_parser = commands.add_parser("index", help="index the maps for the filters and the similar maps search")
+    index_parser.add_argument("--no-similarity", action="store_true", help="skip the similar maps index")
+    index_parser.set_defaults(run=index)
+
+    verify_parser = commands.add_parser("verify", help="quarantine broken map images and delete duplicates")
+    verify_parser.set_defaults(run=verify)
+
+    thumbs_parser = commands.add_parser("thumbs", help="fill the thumbnail cache")
+    thumbs_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_THUMBNAIL_SIZES, help="square thumbnail sizes")
+    thumbs_parser.add_argument("--workers", type=int, default=None, help="decode threads")
+    thumbs_parser.set_defaults(run=thumbs)
+
+    watch_parser = commands.add_parser("watch", help="make thumbnails of map images as they are added or changed")
+    watch_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_THUMBNAIL_SIZES, help="square thumbnail sizes")
+    watch_parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="seconds between folder listings where inotify is missing")
+    watch_parser.set_defaults(run=watch)
+
+    export_parser = commands.add_parser("export", help="export the matching maps as JSON")
+    export_parser.add_argument("--filter", action="append", choices=FILTER_KEYS, default=[], help="filter key, repeat for more")
+    export_parser.add_argument("--search", default="", help="map name search")
+    export_parser.add_argument("--sort", choices=["ascending", "descending"], help="order by map name")
+    export_parser.add_argument("-o", "--output", help="JSON file, - for stdout, the default without --zip or --contact-sheet")
+    export_parser.add_argument("--zip", help="zip archive of the map images with a manifest")
+    export_parser.add_argument("--contact-sheet", help="printable PDF of the map thumbnails")
+    export_parser.set_defaults(run=export)
+
+    args = parser.parse_args(argv)
+    if args.trace:
+        perf_trace.enable(args.trace)
+    if args.decode_memory:
+        image_decode.set_memory_limit(args.decode_memory * 1024 * 1024)
+    library = MapLibrary(args.maps)
+    start = time.perf_counter()
+    try:
+        return args.run(library, args)
+    finally:
+        library.close()
+        print(f"{args.command} took {time.perf_counter() - start:.2f} s", file=sys.stderr)
+        if perf_trace.tracer.enabled:
+            print(perf_trace.tracer.stats_line(), file=sys.stderr)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,151 @@
+# /map_export.py
+
+import os
+import json
+import queue
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from PIL import Image, ImageDraw
+from map_catalogue import map_name_from_filename
+
+EXPORT_CHUNK_SIZE: int = 64 * 1024 # bytes copied into the archive at a time, no map is ever held whole in memory
+MANIFEST_NAME: str = "manifest.json" # metadata of every exported map, the last entry of the archive
+SHEET_DPI: int = 150
+SHEET_PAGE_SIZE: tuple = (1240, 1754) # A4 portrait at SHEET_DPI
+SHEET_COLS: int = 4
+SHEET_MARGIN: int = 40 # page margin and gap between tiles in pixels
+SHEET_LABEL_HEIGHT: int = 20 # room for the map name under each tile
+POLL_SECONDS: float = 0.05 # how often the calling thread passes on progress while an export runs
+
+def write_zip(paths: list, zip_path: str, describe, progress_callback=None) -> int:
+    """
+    Stream map images into a zip archive in chunks, followed by a manifest of their metadata and hashes.
+    The archive is written to zip_path + ".part" and renamed once complete.
+
+    Args:
+        paths (list[str]): map image paths
+        zip_path (str): archive to write
+        describe: function (path) -> dict of map metadata for the manifest
+        progress_callback: called with a status text after every map
+
+    Returns:
+        int: maps in the archive
+    """
+    manifest: list = []
+    part_path: str = zip_path + ".part"
+    # map images are PNGs, already deflated, so they are stored as they are
+    with zipfile.ZipFile(part_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for i, path in enumerate(paths, 1):
+            digest = hashlib.sha256()
+            size: int = 0
+            arcname: str = "maps/" + os.path.basename(path)
+            with open(path, "rb") as source, archive.open(arcname, "w", force_zip64=True) as target:
+                for block in iter(lambda: source.read(EXPORT_CHUNK_SIZE), b""):
+                    target.write(block)
+                    digest.update(block)
+                    size += len(block)
+            manifest.append(dict(describe(path), file=arcname, size=size, sha256=digest.hexdigest()))
+            if progress_callback:
+                progress_callback(f"Export archive progress: {i}/{len(paths)}")
+        archive.writestr(MANIFEST_NAME, json.dumps({"maps": manifest}, indent=1))
+    os.replace(part_path, zip_path)
+    return len(manifest)
+
+def sheet_layout(cols: int = SHEET_COLS) -> tuple:
+    """
+    Returns:
+        tuple: (tile size, tiles per row, rows per page) of a contact sheet page
+    """
+    width, height = SHEET_PAGE_SIZE
+    tile_size: int = (width - SHEET_MARGIN * (cols + 1)) // cols
+    rows: int = max(1, (height - SHEET_MARGIN) // (tile_size + SHEET_LABEL_HEIGHT + SHEET_MARGIN))
+    return tile_size, cols, rows
+
+def render_contact_sheet(paths: list, sheet_path: str, load_tile, progress_callback=None, cols: int = SHEET_COLS, max_workers: int = None) -> int:
+    """
+    Render a printable PDF of map thumbnails with their names, one page at a time: the tiles of a page are
+    loaded on a worker pool, pasted, and the page is appended to the PDF before the next page is started,
+    so memory holds one page whatever the number of maps
+
+    Args:
+        paths (list[str]): map image paths
+        sheet_path (str): PDF to write
+        load_tile: function (path, width, height) -> Image, e.g. a thumbnail cache lookup
+        progress_callback: called with a status text after every page
+        cols (int): tiles per row
+        max_workers (int): tile loading threads, the pool's default if not given
+
+    Returns:
+        int: pages written
+    """
+    tile_size, cols, rows = sheet_layout(cols)
+    per_page: int = cols * rows
+    pages: int = max(1, -(-len(paths) // per_page))
+    part_path: str = sheet_path + ".part"
+
+    def tile(path):
+        try:
+            return load_tile(path, tile_size, tile_size).convert("RGB")
+        except Exception as e:
+            print(f"Error loading image {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page_number in range(pages):
+            page_paths: list = paths[page_number * per_page:(page_number + 1) * per_page]
+            page = Image.new("RGB", SHEET_PAGE_SIZE, "white")
+            draw = ImageDraw.Draw(page)
+            for i, (path, image) in enumerate(zip(page_paths, executor.map(tile, page_paths))):
+                row, col = divmod(i, cols)
+                x = SHEET_MARGIN + col * (tile_size + SHEET_MARGIN)
+                y = SHEET_MARGIN + row * (tile_size + SHEET_LABEL_HEIGHT + SHEET_MARGIN)
+                if image is not None:
+                    page.paste(image, (x, y))
+                    image.close()
+                draw.text((x, y + tile_size + 4), map_name_from_filename(path)[:tile_size // 7], fill="black")
+            page.save(part_path, format="PDF", resolution=SHEET_DPI, append=page_number > 0)
+            page.close()
+            if progress_callback:
+                progress_callback(f"Contact sheet progress: page {page_number + 1}/{pages}")
+    os.replace(part_path, sheet_path)
+    return pages
+
+def export_maps(paths: list, describe, load_tile, zip_path: str = None, sheet_path: str = None, progress_callback=None, max_workers: int = None):
+    """
+    Export maps to a zip archive and a contact sheet at the same time on a worker pool. Like
+    download_images, progress_callback is always called from the calling thread.
+
+    Args:
+        paths (list[str]): map image paths
+        describe: function (path) -> dict of map metadata for the archive manifest
+        load_tile: function (path, width, height) -> Image for the contact sheet
+        zip_path (str): archive to write, skipped if not given
+        sheet_path (str): contact sheet PDF to write, skipped if not given
+        progress_callback: for GUI widget label to callback progress
+        max_workers (int): contact sheet tile loading threads
+
+    Returns:
+        None
+    """
+    statuses = queue.Queue() # progress of the export jobs, passed on from the calling thread
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures: list = []
+        if zip_path:
+            futures.append(executor.submit(write_zip, paths, zip_path, describe, statuses.put))
+        if sheet_path:
+            futures.append(executor.submit(render_contact_sheet, paths, sheet_path, load_tile, statuses.put, max_workers=max_workers))
+        pending = futures
+        while pending or not statuses.empty():
+            if pending:
+                pending = list(wait(pending, timeout=POLL_SECONDS, return_when=FIRST_EXCEPTION).not_done)
+            while not statuses.empty():
+                status = statuses.get()
+                print(status)
+                if progress_callback:
+                    progress_callback(status)
+        for future in futures:
+            future.result() # re-raise a failed export
+    print("Export complete.")
+    if progress_callback:
+        progress_callback("Export complete!")
@@ -0,0 +1,185 @@
+# /map_filters.py
+
+from map_catalogue import catalogue_entry
+
+# filter keys are "group:value", values match the map catalogue, e.g. "size:XL", "victory:artifact"
+# a map matches when it matches any checked filter of a group, for every group with a checked filter
+# "liked" and "status" come from the map journal and are set with FilterIndex.set_flag
+SINGLE_VALUE_GROUPS: tuple = ("expansion", "size", "difficulty")
+MULTI_VALUE_GROUPS: tuple = ("victory", "loss")
+FILTER_KEYS: list = ["liked:yes", "subterranean:yes", "status:unplayed", "status:unfinished", "status:won",
+                     "expansion:roe", "expansion:ab", "expansion:sod", "expansion:hota",
+                     "size:S", "size:M", "size:L", "size:XL", "size:H", "size:XH", "size:G",
+                     "difficulty:easy", "difficulty:normal", "difficulty:hard", "difficulty:expert", "difficulty:impossible",
+                     "victory:artifact", "victory:monster", "victory:survivetime", "victory:standard", "victory:buildgrail",
+                     "victory:allmonsters", "victory:transport", "victory:creatures", "victory:capturecity",
+                     "victory:flagdwellings", "victory:buildcity", "victory:resources", "victory:hero", "victory:flagmines",
+                     "loss:standard", "loss:hero", "loss:town", "loss:timeexpires"]
+
+def entry_filter_keys(entry: dict) -> list:
+    """
+    Filter keys a catalogue entry matches
+
+    Args:
+        entry (dict): map catalogue entry, may be None for maps missing from the catalogue
+
+    Returns:
+        list[str]: filter keys
+    """
+    if not entry:
+        return []
+    keys: list = [f"{group}:{entry[group]}" for group in SINGLE_VALUE_GROUPS if entry.get(group)]
+    keys += [f"{group}:{value}" for group in MULTI_VALUE_GROUPS for value in entry.get(group) or []]
+    if entry.get("subterranean"):
+        keys.append("subterranean:yes")
+    return keys
+
+def popcount(bits: int) -> int:
+    """
+    Returns:
+        int: number of set bits
+    """
+    return bin(bits).count("1")
+
+class FilterIndex:
+    """
+    Every filter key maps to a bitset (a Python int) with bit i set when map i matches it, so applying
+    the checkboxes is a handful of whole-bitset ORs and ANDs, no file is read and no image decoded
+    """
+    def __init__(self):
+        self.paths: list = [] # map id -> map image path
+        self.ids: dict = {} # map image path -> map id
+        self.bits: dict = {} # filter key -> bitset of map ids
+        self.all_bits: int = 0
+
+    @classmethod
+    def build(cls, paths: list, catalogue: dict) -> "FilterIndex":
+        """
+        Index map images by their catalogue attributes
+
+        Args:
+            paths (list[str]): map image paths
+            catalogue (dict): map catalogue from map_catalogue.load_catalogue
+
+        Returns:
+            FilterIndex
+        """
+        index = cls()
+        for path in paths:
+            index.add(path, catalogue_entry(catalogue, path))
+        return index
+
+    def add(self, path: str, entry: dict) -> int:
+        """
+        Index one map image, does nothing if it is already indexed
+
+        Args:
+            path (str): map image path
+            entry (dict): its catalogue entry, None if it is not in the catalogue
+
+        Returns:
+            int: map id
+        """
+        if path in self.ids:
+            return self.ids[path]
+        map_id = len(self.paths)
+        self.paths.append(path)
+        self.ids[path] = map_id
+        bit = 1 << map_id
+        self.all_bits |= bit
+        for key in entry_filter_keys(entry):
+            self.bits[key] = self.bits.get(key, 0) | bit
+        return map_id
+
+    def remove(self, path: str):
+        """
+        Stop matching a map image e.g. one deleted from the folder, its id is not re-used
+
+        Returns:
+            None
+        """
+        map_id = self.ids.pop(path, None)
+        if map_id is None:
+            return
+        bit = 1 << map_id
+        self.all_bits &= ~bit
+        for key, bits in self.bits.items():
+            if bits & bit:
+                self.bits[key] = bits & ~bit
+
+    def set_flag(self, key: str, path: str, value: bool):
+        """
+        Set or clear a filter key that does not come from the catalogue e.g. "liked:yes"
+
+        Returns:
+            None
+        """
+        map_id = self.ids.get(path)
+        if map_id is None:
+            return
+        if value:
+            self.bits[key] = self.bits.get(key, 0) | (1 << map_id)
+        else:
+            self.bits[key] = self.bits.get(key, 0) & ~(1 << map_id)
+
+    def group_bits(self, keys: list) -> int:
+        """
+        Returns:
+            int: maps matching any of keys
+        """
+        bits = 0
+        for key in keys:
+            bits |= self.bits.get(key, 0)
+        return bits
+
+    def match(self, selected: set, skip_group: str = None) -> int:
+        """
+        Bitset of the maps matching the checked filters, OR within a group and AND across groups
+
+        Args:
+            selected (set[str]): checked filter keys
+            skip_group (str): group to leave out, used for counts
+
+        Returns:
+            int: bitset of map ids
+        """
+        groups: dict = {}
+        for key in selected:
+            groups.setdefault(key.split(":", 1)[0], []).append(key)
+        bits = self.all_bits
+        for group, keys in groups.items():
+            if group != skip_group:
+                bits &= self.group_bits(keys)
+        return bits
+
+    def matching_paths(self, selected: set) -> list:
+        """
+        Returns:
+            list[str]: paths of the maps matching the checked filters, in id order
+        """
+        bits = self.match(selected)
+        if bits == self.all_bits and len(self.ids) == len(self.paths):
+            return list(self.paths)
+        binary = bin(bits)[:1:-1] # lowest bit first
+        return [self.paths[map_id] for map_id, bit in enumerate(binary) if bit == "1"]
+
+    def counts(self, selected: set, keys: list) -> dict:
+        """
+        How many maps match each filter and the checked filters of the other groups,
+        shown next to the checkboxes
+
+        Args:
+            selected (set[str]): checked filter keys
+            keys (list[str]): filter keys to count
+
+        Returns:
+            dict: filter key -> map count
+        """
+        others: dict = {}
+        counts: dict = {}
+        for key in keys:
+            group = key.split(":", 1)[0]
+            if group not in others:
+                others[group] = self.match(selected, skip_group=group)
+            counts[key] = popcount(self.bits.get(key, 0) & others[group])
+        return counts
@@ -0,0 +1,373 @@
+# /map_grid.py
+
+import math
+import tkinter as tk
+import perf_trace
+
+OVERSCAN_ROWS: int = 1 # rows kept ready above and below the visible ones so scrolling never shows gaps
+CELL_TAG: str = "map_cell" # canvas tag of every cell image item, clicks on it go to one handler
+ERROR_COLOUR: str = "#7a2020" # fill of the cells whose image could not be decoded
+
+class MapGrid:
+    """
+    Scrollable grid of map images drawn on a canvas as image items, no widget per map. Only the rows in
+    view (plus overscan) have items, cells scrolled out of view are hidden and re-used for the rows
+    scrolled into view, so the number of items and decoded images depends on the window size, not on
+    how many maps there are. One click handler finds the clicked cell from the canvas item under the mouse.
+    """
+    def __init__(self, canvas: tk.Canvas, load_photo, on_click, cols: int, image_width: int, image_height: int, spacing_x: int, spacing_y: int, cancel_photo=None):
+        """
+        Args:
+            canvas (Canvas): canvas to draw the grid on, its yscrollcommand must call refresh
+            load_photo: function (path, width, height) -> PhotoImage, or None if the image is still being
+                decoded, a placeholder is shown until set_photo delivers it
+            on_click: function (path) called when a map image is clicked
+            cols (int): columns for images
+            image_width (int): images width
+            image_height (int): images height
+            spacing_x (int): x padding between images
+            spacing_y (int): y padding between images
+            cancel_photo: function (path, width, height) called when a cell still waiting for its image scrolls out of view
+        """
+        self.canvas = canvas
+        self.load_photo = load_photo
+        self.on_click = on_click
+        self.cancel_photo = cancel_photo
+        self.cols = cols
+        self.image_width = image_width
+        self.image_height = image_height
+        self.spacing_x = spacing_x
+        self.spacing_y = spacing_y
+        self.paths: list = []
+        self.indexes: dict = {} # path -> position in the grid
+        self.cells: dict = {} # position -> canvas image item id for materialized cells
+        self.item_indexes: dict = {} # canvas image item id -> position, for click hit-testing
+        self.photos: dict = {} # canvas image item id -> PhotoImage it shows, keeps a reference so Tk does not lose it
+        self.free_cells: list = [] # hidden image items waiting to be re-used
+        self.waiting: set = set() # positions of cells showing the placeholder
+        self.placeholders: dict = {} # (width, height) -> blank PhotoImage
+        self.error_placeholders: dict = {} # (width, height) -> PhotoImage shown for images that failed to decode
+        self.canvas.tag_bind(CELL_TAG, "<Button-1>", self.on_cell_click)
+
+    def cell_size(self) -> tuple:
+        """
+        Returns:
+            tuple: (width, height) of one grid cell including padding
+        """
+        return self.image_width + 2 * self.spacing_x, self.image_height + 2 * self.spacing_y
+
+    def cell_position(self, index: int) -> tuple:
+        """
+        Args:
+            index (int): position in the grid
+
+        Returns:
+            tuple: (x, y) canvas coordinates of the image at index
+        """
+        row, col = divmod(index, self.cols)
+        cell_width, cell_height = self.cell_size()
+        return col * cell_width + self.spacing_x, row * cell_height + self.spacing_y
+
+    def set_paths(self, paths: list, cols: int = None, image_width: int = None, image_height: int = None):
+        """
+        Show a new list of map images, replacing the current ones, at a new columns count or image size
+        if given, the cells in view are cleared and filled once
+
+        Args:
+            paths (list[str]): map image paths in display order
+            cols (int): columns for images, unchanged if not given
+            image_width (int): images width, unchanged if not given
+            image_height (int): images height, unchanged if not given
+
+        Returns:
+            None
+        """
+        with perf_trace.span("grid.layout", maps=len(paths)):
+            self.clear_cells()
+            self.cols = cols or self.cols
+            self.image_width = image_width or self.image_width
+            self.image_height = image_height or self.image_height
+            self.paths = list(paths)
+            self.indexes = {path: index for index, path in enumerate(self.paths)}
+            self.update_scroll_region()
+            self.refresh()
+
+    def append(self, path: str):
+        """
+        Add one map image to the end of the grid, does nothing if it is already shown
+
+        Args:
+            path (str): map image path
+
+        Returns:
+            None
+        """
+        if path in self.indexes:
+            return
+        self.indexes[path] = len(self.paths)
+        self.paths.append(path)
+        self.update_scroll_region()
+        self.refresh()
+
+    def insert(self, index: int, path: str):
+        """
+        Add one map image at a position of the grid, e.g. its place in the sort order, does nothing if
+        it is already shown. The maps after it move on one position in the cells that exist.
+
+        Args:
+            index (int): position in the grid
+            path (str): map image path
+
+        Returns:
+            None
+        """
+        if path in self.indexes:
+            return
+        index = min(index, len(self.paths))
+        for position in sorted((position for position in self.cells if position >= index), reverse=True):
+            item = self.cells.pop(position)
+            self.cells[position + 1] = item
+            self.item_indexes[item] = position + 1
+            self.canvas.coords(item, *self.cell_position(position + 1))
+        self.waiting = {position + 1 if position >= index else position for position in self.waiting}
+        self.paths.insert(index, path)
+        for later in range(index, len(self.paths)):
+            self.indexes[self.paths[later]] = later
+        self.update_scroll_region()
+        self.refresh()
+
+    def remove(self, path: str):
+        """
+        Take one map image out of the grid, e.g. after its file was deleted. The maps after it move
+        back one position in the cells that exist, nothing else is decoded or re-created.
+
+        Args:
+            path (str): map image path
+
+        Returns:
+            None
+        """
+        index = self.indexes.pop(path, None)
+        if index is None:
+            return
+        if index in self.cells:
+            self.recycle_cell(index)
+        del self.paths[index]
+        for later in range(index, len(self.paths)):
+            self.indexes[self.paths[later]] = later
+        later_cells = sorted(position for position in self.cells if position > index)
+        for position in later_cells:
+            item = self.cells.pop(position)
+            self.cells[position - 1] = item
+            self.item_indexes[item] = position - 1
+            self.canvas.coords(item, *self.cell_position(position - 1))
+        self.waiting = {position - 1 if position > index else position for position in self.waiting}
+        self.update_scroll_region()
+        self.refresh()
+
+    def reload(self, path: str):
+        """
+        Load the image of path again if its cell is in view, e.g. after the file changed
+
+        Args:
+            path (str): map image path
+
+        Returns:
+            None
+        """
+        index = self.indexes.get(path)
+        if index in self.cells:
+            self.recycle_cell(index)
+            self.show_cell(index)
+
+    def set_columns(self, cols: int):
+        """
+        Change the number of columns by moving the cells that exist, nothing is decoded or re-created.
+        The map at the top of the view stays at the top.
+
+        Args:
+            cols (int): columns for images
+
+        Returns:
+            None
+        """
+        if cols == self.cols:
+            return
+        with perf_trace.span("grid.layout", maps=len(self.paths), cols=cols):
+            top_index = int(self.canvas.canvasy(0) // self.cell_size()[1]) * self.cols
+            self.cols = cols
+            self.update_scroll_region()
+            for index, item in self.cells.items():
+                self.canvas.coords(item, *self.cell_position(index))
+
+            rows = math.ceil(len(self.paths) / self.cols)
+            if rows:
+                self.canvas.yview_moveto((top_index // self.cols) / rows)
+            self.refresh()
+
+    def configure(self, cols: int = None, image_width: int = None, image_height: int = None):
+        """
+        Change columns or image size, cells are re-created for the rows in view only
+
+        Returns:
+            None
+        """
+        self.set_paths(self.paths, cols, image_width, image_height)
+
+    def update_scroll_region(self):
+        """
+        Size the canvas scroll region from the number of maps, no item needs to exist for that
+
+        Returns:
+            None
+        """
+        cell_width, cell_height = self.cell_size()
+        rows = math.ceil(len(self.paths) / self.cols)
+        self.canvas.configure(scrollregion=(0, 0, self.cols * cell_width, rows * cell_height))
+
+    def visible_range(self) -> range:
+        """
+        Returns:
+            range: grid positions of the rows in view plus OVERSCAN_ROWS above and below
+        """
+        cell_height = self.cell_size()[1]
+        view_height = self.canvas.winfo_height()
+        if view_height <= 1: # not drawn yet, use the requested size
+            view_height = int(self.canvas.cget("height"))
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // cell_height) - OVERSCAN_ROWS)
+        last_row = int((top + view_height) // cell_height) + OVERSCAN_ROWS
+        return range(first_row * self.cols, min(len(self.paths), (last_row + 1) * self.cols))
+
+    def refresh(self, *args):
+        """
+        Materialize cells for the rows in view and recycle the ones scrolled out of view,
+        called whenever the canvas view changes
+
+        Returns:
+            None
+        """
+        visible = self.visible_range()
+        for index in [index for index in self.cells if index not in visible]:
+            self.recycle_cell(index)
+        for index in visible:
+            if index not in self.cells:
+                self.show_cell(index)
+
+    def show_cell(self, index: int):
+        """
+        Put the image at index into a recycled or new cell
+
+        Returns:
+            None
+        """
+        path = self.paths[index]
+        photo = self.load_photo(path, self.image_width, self.image_height)
+        if photo is None:
+            photo = self.placeholder()
+            self.waiting.add(index)
+        x, y = self.cell_position(index)
+        if self.free_cells:
+            item = self.free_cells.pop()
+            self.canvas.coords(item, x, y)
+            self.canvas.itemconfigure(item, image=photo, state="normal")
+        else:
+            with perf_trace.span("grid.create_cell"):
+                item = self.create_cell(x, y, photo)
+        self.photos[item] = photo
+        self.item_indexes[item] = index
+        self.cells[index] = item
+
+    def create_cell(self, x: int, y: int, photo) -> int:
+        """
+        Create a new cell image item at x, y, only called when no hidden item can be re-used
+
+        Returns:
+            int: canvas image item id
+        """
+        return self.canvas.create_image(x, y, image=photo, anchor=tk.NW, tags=(CELL_TAG,))
+
+    def on_cell_click(self, event):
+        """
+        Click on any cell, Tk tags the image item under the mouse "current"
+
+        Returns:
+            None
+        """
+        for item in self.canvas.find_withtag("current"):
+            index = self.item_indexes.get(item)
+            if index is not None and self.cells.get(index) == item:
+                self.on_click(self.paths[index])
+                return
+
+    def placeholder(self) -> tk.PhotoImage:
+        """
+        Returns:
+            PhotoImage: blank image of the current image size, shown while a map image is decoded
+        """
+        size = (self.image_width, self.image_height)
+        if size not in self.placeholders:
+            self.placeholders[size] = tk.PhotoImage(width=self.image_width, height=self.image_height)
+        return self.placeholders[size]
+
+    def error_placeholder(self) -> tk.PhotoImage:
+        """
+        Returns:
+            PhotoImage: filled image of the current image size, shown for a map image that could not be decoded
+        """
+        size = (self.image_width, self.image_height)
+        if size not in self.error_placeholders:
+            photo = tk.PhotoImage(width=self.image_width, height=self.image_height)
+            photo.put(ERROR_COLOUR, to=(0, 0, self.image_width, self.image_height))
+            self.error_placeholders[size] = photo
+        return self.error_placeholders[size]
+
+    def set_photo(self, path: str, width: int, height: int, photo):
+        """
+        Show a decoded image in the cell waiting for it, ignored if the cell scrolled away or the size changed
+
+        Args:
+            path (str): map image path
+            width (int): image width
+            height (int): image height
+            photo (PhotoImage): the image, None if it could not be decoded, then the error placeholder is shown
+
+        Returns:
+            None
+        """
+        index = self.indexes.get(path)
+        if index not in self.waiting or (width, height) != (self.image_width, self.image_height):
+            return
+        self.waiting.discard(index)
+        if photo is None:
+            photo = self.error_placeholder()
+        item = self.cells[index]
+        self.canvas.itemconfigure(item, image=photo)
+        self.photos[item] = photo
+
+    def recycle_cell(self, index: int):
+        """
+        Hide the cell at index and keep it for re-use
+
+        Returns:
+            None
+        """
+        item = self.cells.pop(index)
+        if index in self.waiting:
+            self.waiting.discard(index)
+            if self.cancel_photo:
+                self.cancel_photo(self.paths[index], self.image_width, self.image_height)
+        self.canvas.itemconfigure(item, image="", state="hidden")
+        del self.photos[item]
+        del self.item_indexes[item]
+        self.free_cells.append(item)
+
+    def clear_cells(self):
+        """
+        Recycle every materialized cell
+
+        Returns:
+            None
+        """
+        for index in list(self.cells):
+            self.recycle_cell(index)
@@ -0,0 +1,237 @@
+# /map_journal.py
+
+import os
+import time
+import queue
+import sqlite3
+import threading
+
+JOURNAL_FILENAME: str = "map_journal.db"
+STATUSES: tuple = ("unplayed", "unfinished", "won")
+BATCH_SIZE: int = 500 # most queued writes committed in one transaction
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS maps (
+    map_id TEXT PRIMARY KEY,
+    liked INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'unplayed',
+    notes TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS maps_liked ON maps (liked) WHERE liked;
+CREATE INDEX IF NOT EXISTS maps_status ON maps (status);
+CREATE TABLE IF NOT EXISTS plays (
+    play_id INTEGER PRIMARY KEY,
+    map_id TEXT NOT NULL,
+    played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plays_map_id ON plays (map_id, played);
+"""
+
+def journal_key(path: str) -> str:
+    """
+    Returns:
+        str: map id the journal keeps a map image under, its file name so it survives moving the folder
+    """
+    return os.path.basename(path)
+
+def new_entry() -> dict:
+    """
+    Returns:
+        dict: journal entry of a map nothing was recorded for
+    """
+    return {"liked": False, "status": "unplayed", "notes": "", "plays": 0, "last_played": None}
+
+class MapJournal:
+    """
+    Likes, played status, notes and play history of maps in a SQLite database in WAL mode.
+    Everything is read into memory once, so the GUI answers from a dict. Changes update the dict at
+    once and are queued for a writer thread, which commits whatever has queued up in one transaction,
+    so a click never waits on the disk.
+    """
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): database file path, created if missing
+        """
+        self.db_path = db_path
+        self.entries: dict = {} # map id -> journal entry
+        self.writes = queue.Queue() # (sql, params) for the writer thread, None to stop it
+        self.batches: int = 0 # transactions committed by the writer thread
+        connection = self.connect()
+        try:
+            connection.executescript(SCHEMA)
+            self.load(connection)
+        finally:
+            connection.close()
+        self.writer = threading.Thread(target=self.write_worker, daemon=True)
+        self.writer.start()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Returns:
+            Connection: new connection in WAL mode
+        """
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL") # WAL stays consistent, only the last commits can be lost on power loss
+        return connection
+
+    def load(self, connection: sqlite3.Connection):
+        """
+        Read every journal entry into memory
+
+        Returns:
+            None
+        """
+        for map_id, liked, status, notes in connection.execute("SELECT map_id, liked, status, notes FROM maps"):
+            self.entries[map_id] = dict(new_entry(), liked=bool(liked), status=status, notes=notes)
+        for map_id, plays, last_played in connection.execute("SELECT map_id, COUNT(*), MAX(played) FROM plays GROUP BY map_id"):
+            self.entries.setdefault(map_id, new_entry()).update(plays=plays, last_played=last_played)
+
+    def write_worker(self):
+        """
+        Commit queued writes in batches, runs on the writer thread which owns its own connection
+
+        Returns:
+            None
+        """
+        connection = self.connect()
+        stopping = False
+        while not stopping:
+            batch = [self.writes.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            statements = [write for write in batch if write is not None]
+            stopping = len(statements) < len(batch)
+            try:
+                with connection: # one transaction for the whole batch
+                    for sql, params in statements:
+                        connection.execute(sql, params)
+                self.batches += 1
+            except sqlite3.Error as e:
+                print(f"Error writing map journal: {e}")
+            finally:
+                for _ in batch:
+                    self.writes.task_done()
+        connection.close()
+
+    def entry(self, path: str) -> dict:
+        """
+        Returns:
+            dict: journal entry of a map image, a fresh one if nothing was recorded for it
+        """
+        return self.entries.get(journal_key(path)) or new_entry()
+
+    def update(self, path: str, **fields):
+        """
+        Change liked, status or notes of a map image
+
+        Args:
+            path (str): map image path
+            fields: e.g. liked=True, status="won", notes="..."
+
+        Returns:
+            None
+        """
+        if "status" in fields and fields["status"] not in STATUSES:
+            raise ValueError(f"Unknown map status: {fields['status']}")
+        map_id = journal_key(path)
+        entry = self.entries.setdefault(map_id, new_entry())
+        entry.update(fields)
+        columns = ", ".join(fields)
+        updates = ", ".join(f"{column}=excluded.{column}" for column in fields)
+        self.writes.put((f"INSERT INTO maps (map_id, {columns}, updated) VALUES ({', '.join('?' * (len(fields) + 2))}) "
+                         f"ON CONFLICT (map_id) DO UPDATE SET {updates}, updated=excluded.updated",
+                         (map_id, *(int(value) if isinstance(value, bool) else value for value in fields.values()), time.time())))
+
+    def set_liked(self, path: str, liked: bool):
+        """
+        Returns:
+            None
+        """
+        self.update(path, liked=liked)
+
+    def set_status(self, path: str, status: str):
+        """
+        Args:
+            status (str): one of STATUSES
+
+        Returns:
+            None
+        """
+        self.update(path, status=status)
+
+    def set_notes(self, path: str, notes: str):
+        """
+        Returns:
+            None
+        """
+        self.update(path, notes=notes)
+
+    def record_play(self, path: str, played: float = None):
+        """
+        Add a play of a map image to its history, an unplayed map becomes unfinished
+
+        Args:
+            path (str): map image path
+            played (float): time of the play, now if not given
+
+        Returns:
+            None
+        """
+        played = time.time() if played is None else played
+        map_id = journal_key(path)
+        entry = self.entries.setdefault(map_id, new_entry())
+        entry["plays"] += 1
+        entry["last_played"] = max(entry["last_played"] or played, played)
+        self.writes.put(("INSERT INTO plays (map_id, played) VALUES (?, ?)", (map_id, played)))
+        if entry["status"] == "unplayed":
+            self.set_status(path, "unfinished")
+
+    def keys_with(self, **fields) -> set:
+        """
+        Map ids whose entries have all the given values e.g. keys_with(liked=True)
+
+        Returns:
+            set[str]: map ids
+        """
+        return {map_id for map_id, entry in self.entries.items() if all(entry[field] == value for field, value in fields.items())}
+
+    def history(self, path: str) -> list:
+        """
+        Play history of a map image from the database, waits for queued writes first
+
+        Returns:
+            list[float]: play times, newest first
+        """
+        self.flush()
+        connection = self.connect()
+        try:
+            return [played for (played,) in connection.execute(
+                "SELECT played FROM plays WHERE map_id = ? ORDER BY played DESC", (journal_key(path),))]
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Wait until every queued write is committed
+
+        Returns:
+            None
+        """
+        self.writes.join()
+
+    def close(self):
+        """
+        Commit the queued writes and stop the writer thread
+
+        Returns:
+            None
+        """
+        if self.writer.is_alive():
+            self.writes.put(None)
+            self.writer.join()
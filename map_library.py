@@ -0,0 +1,282 @@
+# /map_library.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from download_images import download_images, load_manifest, MAX_WORKERS, RESOLVE_MODE
+from map_catalogue import map_name_from_filename, load_catalogue, catalogue_entry, CATALOGUE_FILENAME
+from map_filters import FilterIndex
+from map_journal import MapJournal, JOURNAL_FILENAME, STATUSES
+from map_search import SearchIndex
+from thumbnail_cache import default_cache_dir, load_thumbnail
+from map_export import export_maps
+from map_verify import verify_map_images, check_changed_images
+import perf_trace
+
+# the map folder, catalogue, filters, search and journal without any GUI, used by display_gui and map_cli
+# nothing here imports tkinter so it runs on machines without a display
+
+def list_map_paths(map_images_dir: str) -> list:
+    """
+    Map images of a folder
+
+    Args:
+        map_images_dir (str): folder path for map images
+
+    Returns:
+        list[str]: paths of the .png files, in folder order
+    """
+    paths: list = []
+    for entry in os.listdir(map_images_dir):
+        path = os.path.join(map_images_dir, entry)
+        if os.path.isfile(path) and path.endswith('.png'):
+            paths.append(path)
+    return paths
+
+class MapLibrary:
+    """
+    The maps of a map images folder with their catalogue entries and journal entries, indexed for the
+    filters and the name search. The GUI and the command line both ask it which maps to show.
+    """
+    def __init__(self, map_images_dir: str, thumbnail_cache_dir: str = None):
+        """
+        Args:
+            map_images_dir (str): folder path for map images, created if missing
+            thumbnail_cache_dir (str): folder path for cached thumbnails, next to map_images_dir if not given
+        """
+        os.makedirs(map_images_dir, exist_ok=True)
+        self.map_images_dir = map_images_dir
+        self.thumbnail_cache_dir = thumbnail_cache_dir or default_cache_dir(map_images_dir)
+        self.catalogue: dict = {}
+        self.filter_index = FilterIndex()
+        self.search_index = SearchIndex()
+        self.journal = MapJournal(os.path.join(map_images_dir, JOURNAL_FILENAME))
+
+    def load(self, verify: bool = True) -> list:
+        """
+        List the map images folder and index every map by its catalogue attributes, journal entry
+        and name, called on start, update patches in the changes after that. Broken images are
+        quarantined and duplicates deleted first, see map_verify.verify_map_images, so they never
+        reach the grid.
+
+        Args:
+            verify (bool): False to index the folder as it is, e.g. the GUI runs verify on a background
+                thread after the grid is shown and removes what it took away with update
+
+        Returns:
+            list[str]: map image paths
+        """
+        with perf_trace.span("library.load"):
+            if verify:
+                self.verify()
+            paths = list_map_paths(self.map_images_dir)
+            self.catalogue = load_catalogue(self.map_images_dir)
+            self.filter_index = FilterIndex.build(paths, self.catalogue)
+            for path in paths:
+                self.index_journal_entry(path)
+            self.search_index = SearchIndex.build(paths)
+        return paths
+
+    def verify(self, progress_callback=None) -> dict:
+        """
+        Quarantine broken map images and delete duplicates, keeping the files the rescan manifest
+        points at, see map_verify.verify_map_images
+
+        Returns:
+            dict: {"checked": files read, "quarantined": [file names], "duplicates": [deleted file names]}
+        """
+        keep = {entry.get("filename") for entry in load_manifest(self.map_images_dir)["maps"].values()}
+        return verify_map_images(self.map_images_dir, keep, progress_callback)
+
+    def check(self, changes: list) -> list:
+        """
+        Check the new and changed map images of a batch of folder changes and quarantine the broken ones,
+        see map_verify.check_changed_images. Reads the files, call it on the thread reporting the changes
+        (e.g. as the on_changes of a map_watcher.MapWatcher) and pass its result to update.
+
+        Returns:
+            list[tuple]: the (kind, path) changes, broken map images as removed
+        """
+        return check_changed_images(self.map_images_dir, changes)
+
+    def update(self, changes: list) -> list:
+        """
+        Patch the indexes for files added, modified or removed in the map images folder since load, e.g.
+        the changes from a map_watcher.MapWatcher after check, instead of loading the whole folder again.
+        Only indexes, no map image is read. A changed catalogue re-indexes the filter attributes of every map.
+
+        Args:
+            changes (list[tuple]): (kind, path), kind is "added", "modified" or "removed"
+
+        Returns:
+            list[tuple]: the (kind, path) changes of map images indexed or removed, in order
+        """
+        applied: list = []
+        with perf_trace.span("library.update", changes=len(changes)):
+            for kind, path in changes:
+                if os.path.basename(path) == CATALOGUE_FILENAME:
+                    self.reload_catalogue()
+                elif kind == "removed":
+                    if path in self.filter_index.ids:
+                        self.remove(path)
+                        applied.append((kind, path))
+                else:
+                    applied.append(("modified" if path in self.filter_index.ids else "added", path))
+                    self.add(path)
+        return applied
+
+    def reload_catalogue(self):
+        """
+        Read the catalogue again, e.g. after a rescan saved a new one, and re-index the filter attributes
+        of the maps already indexed without listing the folder
+
+        Returns:
+            None
+        """
+        self.catalogue = load_catalogue(self.map_images_dir)
+        paths = self.filter_index.matching_paths(set())
+        self.filter_index = FilterIndex.build(paths, self.catalogue)
+        for path in paths:
+            self.index_journal_entry(path)
+
+    def add(self, path: str):
+        """
+        Index one new or changed map image, e.g. one arriving during a rescan
+
+        Returns:
+            None
+        """
+        if path not in self.filter_index.ids:
+            self.search_index.add(path)
+        self.filter_index.add(path, catalogue_entry(self.catalogue, path))
+        self.index_journal_entry(path)
+
+    def remove(self, path: str):
+        """
+        Stop indexing a map image, e.g. one deleted from the folder
+
+        Returns:
+            None
+        """
+        self.filter_index.remove(path)
+        self.search_index.remove(path)
+
+    def index_journal_entry(self, path: str):
+        """
+        Set the liked and played status filter flags of a map from its journal entry
+
+        Returns:
+            None
+        """
+        entry = self.journal.entry(path)
+        self.filter_index.set_flag("liked:yes", path, entry["liked"])
+        for status in STATUSES:
+            self.filter_index.set_flag(f"status:{status}", path, entry["status"] == status)
+
+    def matches(self, path: str, selected: set) -> bool:
+        """
+        Returns:
+            bool: True when an indexed map matches the filter keys in selected
+        """
+        return not selected or bool(self.filter_index.match(selected) >> self.filter_index.ids[path] & 1)
+
+    def query(self, selected: set = None, search: str = "", similar_ranks: dict = None, sort: str = None) -> list:
+        """
+        Maps to show, answered from the indexes without reading the folder
+
+        Args:
+            selected (set[str]): filter keys, see map_filters.FILTER_KEYS
+            search (str): map name search, best match first
+            similar_ranks (dict): map image path -> rank, only ranked maps are kept, most similar first
+            sort (str): "ascending" or "descending" to order by map name
+
+        Returns:
+            list[str]: map image paths
+        """
+        paths = self.filter_index.matching_paths(selected or set())
+        if search.strip():
+            matching = set(paths)
+            paths = [path for path in self.search_index.search(search) if path in matching]
+        if similar_ranks is not None:
+            paths = sorted((path for path in paths if path in similar_ranks), key=similar_ranks.get)
+        if sort in ("ascending", "descending"):
+            paths.sort(key=lambda path: map_name_from_filename(path).lower(), reverse=sort == "descending")
+        return paths
+
+    def counts(self, selected: set, keys: list) -> dict:
+        """
+        Returns:
+            dict: filter key -> how many maps it would match with the keys in selected
+        """
+        return self.filter_index.counts(selected, keys)
+
+    def rescan(self, progress_callback=None, image_callback=None, cancel_event=None, max_workers: int = MAX_WORKERS, resolve_mode: str = RESOLVE_MODE):
+        """
+        Download new and changed map images, see download_images.download_images
+
+        Returns:
+            None
+        """
+        download_images(self.map_images_dir, progress_callback, max_workers=max_workers, resolve_mode=resolve_mode,
+                        image_callback=image_callback, cancel_event=cancel_event)
+
+    def thumbnail(self, path: str, width: int, height: int):
+        """
+        Returns:
+            Image: a map image at width x height, from the thumbnail cache when it is there
+        """
+        return load_thumbnail(path, width, height, self.thumbnail_cache_dir)
+
+    def make_thumbnails(self, sizes: list, paths: list = None, max_workers: int = None, progress_callback=None) -> int:
+        """
+        Fill the thumbnail cache ahead of time, so the grid never decodes a full map image at these sizes
+
+        Args:
+            sizes (list[int]): square thumbnail sizes
+            paths (list[str]): map images, every map if not given
+            max_workers (int): decode threads, the pool's default if not given
+            progress_callback: called with a status text after every thumbnail
+
+        Returns:
+            int: thumbnails made or found in the cache
+        """
+        paths = list_map_paths(self.map_images_dir) if paths is None else paths
+        jobs = [(path, size) for path in paths for size in sizes]
+        done: int = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.thumbnail, path, size, size) for path, size in jobs]
+            for future, (path, size) in zip(futures, jobs):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    print(f"Error making thumbnail of {path}: {e}")
+                if progress_callback:
+                    progress_callback(f"Thumbnails progress: {done}/{len(jobs)}")
+        return done
+
+    def export(self, paths: list, zip_path: str = None, sheet_path: str = None, progress_callback=None):
+        """
+        Stream maps into a zip archive with a manifest of describe entries and render a contact sheet
+        PDF from the thumbnail cache, see map_export.export_maps
+
+        Returns:
+            None
+        """
+        export_maps(paths, self.describe, self.thumbnail, zip_path, sheet_path, progress_callback)
+
+    def describe(self, path: str) -> dict:
+        """
+        Returns:
+            dict: everything known about a map, its name, file, catalogue entry and journal entry
+        """
+        return {"name": map_name_from_filename(path), "filename": os.path.basename(path),
+                "catalogue": catalogue_entry(self.catalogue, path), "journal": self.journal.entry(path)}
+
+    def close(self):
+        """
+        Commit queued journal writes
+
+        Returns:
+            None
+        """
+        self.journal.close()
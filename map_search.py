@@ -0,0 +1,176 @@
+# /map_search.py
+
+import re
+import bisect
+import unicodedata
+from map_catalogue import map_name_from_filename
+
+FUZZY_THRESHOLD: float = 0.6 # least share of the query's trigrams a name needs for a fuzzy match
+FUZZY_MIN_LENGTH: int = 3 # shorter queries only match by prefix
+
+def normalize_name(name: str) -> str:
+    """
+    Fold a map name for searching: case and accents folded, punctuation turned into spaces
+
+    Args:
+        name (str): map name e.g. Tovar's Treasure
+
+    Returns:
+        str: e.g. tovar s treasure
+    """
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(re.split(r"[^\w]+|_", name)).strip()
+
+def trigrams(text: str) -> set:
+    """
+    Returns:
+        set[str]: every 3 character slice of text padded with spaces, so short words and word starts count
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """
+    In-memory index of map names for as-you-type search. Every word of every name is kept in a sorted
+    list for prefix lookups with bisect, and every name trigram points to the maps containing it for
+    fuzzy matches. Typing more letters refines the previous prefix matches instead of searching again.
+    """
+    def __init__(self):
+        self.paths: list = [] # map id -> map image path
+        self.ids: dict = {} # map image path -> map id
+        self.names: list = [] # map id -> normalized name
+        self.words: list = [] # sorted (word, map id)
+        self.words_sorted: bool = True
+        self.trigrams: dict = {} # trigram -> set of map ids
+        self.trigram_counts: list = [] # map id -> number of trigrams in its name
+        self.last_query: str = None
+        self.last_prefix_ids: set = None
+
+    @classmethod
+    def build(cls, paths: list) -> "SearchIndex":
+        """
+        Index the names of map images
+
+        Args:
+            paths (list[str]): map image paths
+
+        Returns:
+            SearchIndex
+        """
+        index = cls()
+        for path in paths:
+            index.add(path)
+        index.words.sort()
+        index.words_sorted = True
+        return index
+
+    def add(self, path: str):
+        """
+        Index one map image by the name the GUI shows for it
+
+        Args:
+            path (str): map image path
+
+        Returns:
+            None
+        """
+        if path in self.ids:
+            return
+        map_id = len(self.paths)
+        name = normalize_name(map_name_from_filename(path))
+        self.paths.append(path)
+        self.ids[path] = map_id
+        self.names.append(name)
+        for word in set(name.split()):
+            self.words.append((word, map_id))
+        self.words_sorted = False
+        name_trigrams = trigrams(name)
+        self.trigram_counts.append(len(name_trigrams))
+        for trigram in name_trigrams:
+            self.trigrams.setdefault(trigram, set()).add(map_id)
+        self.last_query = None
+
+    def remove(self, path: str):
+        """
+        Stop finding a map image e.g. one deleted from the folder, its id is not re-used
+
+        Args:
+            path (str): map image path
+
+        Returns:
+            None
+        """
+        map_id = self.ids.pop(path, None)
+        if map_id is None:
+            return
+        name = self.names[map_id]
+        self.words = [(word, word_id) for word, word_id in self.words if word_id != map_id]
+        for trigram in trigrams(name):
+            self.trigrams[trigram].discard(map_id)
+        self.names[map_id] = "" # matches no query
+        self.last_query = None
+
+    def prefix_ids(self, query: str) -> set:
+        """
+        Maps with a word starting with the first query word whose name contains every other query word
+        as a word prefix, refined from the previous query's matches when query extends it
+
+        Returns:
+            set[int]: map ids
+        """
+        if not self.words_sorted:
+            self.words.sort()
+            self.words_sorted = True
+        query_words = query.split()
+        if self.last_query and self.last_prefix_ids is not None and query.startswith(self.last_query):
+            candidates = self.last_prefix_ids
+        else:
+            start = bisect.bisect_left(self.words, (query_words[0], -1))
+            candidates = set()
+            for word, map_id in self.words[start:]:
+                if not word.startswith(query_words[0]):
+                    break
+                candidates.add(map_id)
+            if len(query_words) == 1:
+                return candidates
+        return {map_id for map_id in candidates
+                if all(any(word.startswith(query_word) for word in self.names[map_id].split()) for query_word in query_words)}
+
+    def search(self, query: str) -> list:
+        """
+        Ranked map images matching query: exact names first, then names starting with the query,
+        then names with words starting with the query words, then fuzzy trigram matches
+
+        Args:
+            query (str): text typed in the search box
+
+        Returns:
+            list[str]: map image paths, best match first
+        """
+        query = normalize_name(query)
+        if not query:
+            self.last_query = None
+            return list(self.ids)
+
+        prefix_ids = self.prefix_ids(query)
+        self.last_query, self.last_prefix_ids = query, prefix_ids
+        scores: dict = {}
+        for map_id in prefix_ids:
+            name = self.names[map_id]
+            scores[map_id] = 3.0 if name == query else 2.0 if name.startswith(query) else 1.5
+
+        if len(query) >= FUZZY_MIN_LENGTH:
+            query_trigrams = trigrams(query)
+            shared: dict = {}
+            for trigram in query_trigrams:
+                for map_id in self.trigrams.get(trigram, ()):
+                    shared[map_id] = shared.get(map_id, 0) + 1
+            for map_id, count in shared.items():
+                if map_id in scores or count / len(query_trigrams) < FUZZY_THRESHOLD:
+                    continue
+                # share of the query found in the name, ties broken by the Dice coefficient
+                scores[map_id] = count / len(query_trigrams) * 0.9 + 0.1 * 2 * count / (len(query_trigrams) + self.trigram_counts[map_id])
+
+        ranked = sorted(scores, key=lambda map_id: (-scores[map_id], self.names[map_id]))
+        return [self.paths[map_id] for map_id in ranked]
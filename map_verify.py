@@ -0,0 +1,248 @@
+# /map_verify.py
+
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+
+PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+READ_SIZE: int = 64 * 1024 # bytes of a chunk read at a time, big chunks are never held whole in memory
+QUARANTINE_DIRNAME: str = "quarantine" # broken map images are moved here, inside the map images folder
+VERIFIED_FILENAME: str = "map_verified.json" # results of earlier checks so unchanged files are not read again
+
+verified_lock = threading.Lock() # map_verified.json is updated from the watcher, rescan and verify threads
+noted: dict = {} # (folder, file name) -> [size, mtime_ns, sha256] of files checked since map_verified.json was saved
+
+def check_png(path: str) -> tuple:
+    """
+    Check the structure of a PNG without decoding it: the signature, that it starts with IHDR and ends
+    with IEND, and the CRC of every chunk. Hashes the file on the same read.
+
+    Args:
+        path (str): file path
+
+    Returns:
+        tuple: (problem, sha256 hex digest), problem is None for a good PNG
+    """
+    digest = hashlib.sha256()
+
+    def read(f, size: int) -> bytes:
+        data = f.read(size)
+        digest.update(data)
+        return data
+
+    try:
+        with open(path, "rb") as f:
+            if read(f, len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                return "not a PNG", None
+            chunk_type: bytes = None
+            first: bool = True
+            while chunk_type != b"IEND":
+                header = read(f, 8)
+                if len(header) < 8:
+                    return "truncated", None
+                length, chunk_type = struct.unpack(">I4s", header)
+                if first and chunk_type != b"IHDR":
+                    return "missing IHDR", None
+                first = False
+                crc = zlib.crc32(chunk_type)
+                remaining = length
+                while remaining:
+                    data = read(f, min(remaining, READ_SIZE))
+                    if not data:
+                        return "truncated", None
+                    crc = zlib.crc32(data, crc)
+                    remaining -= len(data)
+                stored = read(f, 4)
+                if len(stored) < 4:
+                    return "truncated", None
+                if struct.unpack(">I", stored)[0] != crc:
+                    return f"bad CRC in {chunk_type.decode('latin-1')} chunk", None
+            for block in iter(lambda: f.read(READ_SIZE), b""):
+                digest.update(block) # trailing bytes after IEND are harmless, still part of the content hash
+    except OSError as e:
+        return f"unreadable: {str(e)}", None
+    return None, digest.hexdigest()
+
+def quarantine(path: str, map_images_dir: str, problem: str) -> str:
+    """
+    Move a broken map image out of the map images folder, the next rescan downloads it again because
+    its manifest entry no longer finds it on disk
+
+    Returns:
+        str: new path of the file
+    """
+    quarantine_dir = os.path.join(map_images_dir, QUARANTINE_DIRNAME)
+    os.makedirs(quarantine_dir, exist_ok=True)
+    target = os.path.join(quarantine_dir, os.path.basename(path))
+    os.replace(path, target)
+    print(f"Quarantined broken map image {path}: {problem}")
+    return target
+
+def load_verified(map_images_dir: str) -> dict:
+    """
+    Returns:
+        dict: file name -> [size, mtime_ns, sha256] of files that passed check_png, empty if nothing was checked yet
+    """
+    try:
+        with open(os.path.join(map_images_dir, VERIFIED_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_verified(map_images_dir: str, verified: dict):
+    """
+    Save check results, written to a temp file then renamed
+
+    Returns:
+        None
+    """
+    path = os.path.join(map_images_dir, VERIFIED_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(verified, f, separators=(",", ":"), sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def note_verified(path: str, sha256: str):
+    """
+    Remember that a file passed check_png as it is now, e.g. a download the rescan just checked, so the
+    check of the same change from the map watcher does not read it again. Saved with the next check.
+
+    Returns:
+        None
+    """
+    stat = os.stat(path)
+    with verified_lock:
+        noted[(os.path.abspath(os.path.dirname(path)), os.path.basename(path))] = [stat.st_size, stat.st_mtime_ns, sha256]
+
+def merge_noted(map_images_dir: str, verified: dict) -> bool:
+    """
+    Move the noted check results of a folder into verified, call with verified_lock held
+
+    Returns:
+        bool: True if any were moved
+    """
+    folder = os.path.abspath(map_images_dir)
+    keys = [key for key in noted if key[0] == folder]
+    for key in keys:
+        verified[key[1]] = noted.pop(key)
+    return bool(keys)
+
+def save_noted(map_images_dir: str):
+    """
+    Save the noted check results of a folder, e.g. at the end of a rescan
+
+    Returns:
+        None
+    """
+    with verified_lock:
+        verified = load_verified(map_images_dir)
+        if merge_noted(map_images_dir, verified):
+            save_verified(map_images_dir, verified)
+
+def check_changed_images(map_images_dir: str, changes: list) -> list:
+    """
+    Check the map images added or modified in a batch of folder changes, e.g. from a map_watcher.MapWatcher,
+    with check_png and quarantine the broken ones. Files that passed unchanged before are not read again.
+    Reads the files, so it runs on the watcher thread, never on the Tk thread.
+
+    Args:
+        map_images_dir (str): folder path for map images
+        changes (list[tuple]): (kind, path), kind is "added", "modified" or "removed"
+
+    Returns:
+        list[tuple]: the changes, broken or vanished map images as ("removed", path)
+    """
+    checked: list = []
+    with verified_lock:
+        verified: dict = load_verified(map_images_dir)
+        changed: bool = merge_noted(map_images_dir, verified)
+        for kind, path in changes:
+            filename = os.path.basename(path)
+            if kind == "removed" or not filename.endswith(".png"):
+                checked.append((kind, path))
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                checked.append(("removed", path))
+                continue
+            record = verified.get(filename)
+            if record and record[:2] == [stat.st_size, stat.st_mtime_ns]:
+                checked.append((kind, path))
+                continue
+            problem, sha256 = check_png(path)
+            changed = True
+            if problem:
+                if os.path.exists(path):
+                    quarantine(path, map_images_dir, problem)
+                verified.pop(filename, None)
+                checked.append(("removed", path))
+            else:
+                verified[filename] = [stat.st_size, stat.st_mtime_ns, sha256]
+                checked.append((kind, path))
+        if changed:
+            save_verified(map_images_dir, verified)
+    return checked
+
+def verify_map_images(map_images_dir: str, keep: set = None, progress_callback=None) -> dict:
+    """
+    Check every .png of the map images folder with check_png, quarantine the broken ones and delete
+    duplicates by content hash. Files unchanged since they last passed are not read again.
+
+    Of a set of identical files, the ones in keep are kept (the files the rescan manifest points at, so a
+    rescan does not download them again), or the first by name if none is.
+
+    Args:
+        map_images_dir (str): folder path for map images
+        keep (set[str]): file names to keep among duplicates
+        progress_callback: called with a status text when a file is quarantined or deleted
+
+    Returns:
+        dict: {"checked": files read, "quarantined": [file names], "duplicates": [deleted file names]}
+    """
+    keep = keep or set()
+    with verified_lock:
+        verified: dict = load_verified(map_images_dir)
+        merge_noted(map_images_dir, verified)
+    result: dict = {"checked": 0, "quarantined": [], "duplicates": []}
+    hashes: dict = {} # sha256 -> file names
+    current: dict = {}
+    for filename in sorted(os.listdir(map_images_dir)):
+        path = os.path.join(map_images_dir, filename)
+        if not filename.endswith(".png") or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        record = verified.get(filename)
+        if record and record[:2] == [stat.st_size, stat.st_mtime_ns]:
+            sha256 = record[2]
+        else:
+            problem, sha256 = check_png(path)
+            result["checked"] += 1
+            if problem:
+                quarantine(path, map_images_dir, problem)
+                result["quarantined"].append(filename)
+                if progress_callback:
+                    progress_callback(f"Quarantined broken map image {filename}: {problem}")
+                continue
+        current[filename] = [stat.st_size, stat.st_mtime_ns, sha256]
+        hashes.setdefault(sha256, []).append(filename)
+
+    for filenames in hashes.values():
+        if len(filenames) < 2:
+            continue
+        kept = [filename for filename in filenames if filename in keep] or filenames[:1]
+        for filename in filenames:
+            if filename not in kept:
+                os.remove(os.path.join(map_images_dir, filename))
+                del current[filename]
+                result["duplicates"].append(filename)
+                print(f"Deleted {filename}, same image as {kept[0]}")
+                if progress_callback:
+                    progress_callback(f"Deleted duplicate map image {filename}")
+
+    if current != verified:
+        with verified_lock:
+            save_verified(map_images_dir, current)
+    return result
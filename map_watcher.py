@@ -0,0 +1,278 @@
+# /map_watcher.py
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from map_catalogue import CATALOGUE_FILENAME
+
+POLL_SECONDS: float = 1.0 # how often the polling fallback lists the folder
+SETTLE_SECONDS: float = 0.1 # changes arriving this close together are reported as one batch
+
+# inotify masks from <sys/inotify.h>, files are reported once written and closed or renamed into place,
+# so the .part files of a download in progress and half written files never show up
+IN_CLOSE_WRITE: int = 0x008
+IN_MOVED_FROM: int = 0x040
+IN_MOVED_TO: int = 0x080
+IN_DELETE: int = 0x200
+IN_DELETE_SELF: int = 0x400
+IN_Q_OVERFLOW: int = 0x4000
+IN_IGNORED: int = 0x8000
+IN_NONBLOCK: int = 0o4000
+IN_CLOEXEC: int = 0o2000000
+EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, name length
+
+def is_map_file(filename: str) -> bool:
+    """
+    Returns:
+        bool: True for the files of a map images folder the library indexes, map images and the catalogue
+    """
+    return filename.endswith(".png") or filename == CATALOGUE_FILENAME
+
+def snapshot(directory: str, names: list = None, wanted=is_map_file) -> dict:
+    """
+    Stat the wanted files of a folder
+
+    Args:
+        directory (str): folder path
+        names (list[str]): only these file names, every wanted file of the folder if not given
+        wanted: function (file name) -> bool
+
+    Returns:
+        dict: file name -> (mtime_ns, size), files in names that are gone are left out
+    """
+    files: dict = {}
+    if names is None:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if wanted(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        files[name] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def diff_snapshots(old: dict, new: dict, names=None) -> list:
+    """
+    Compare two snapshots
+
+    Args:
+        old (dict): snapshot from before
+        new (dict): snapshot from now
+        names: file names to compare, every file of both if not given
+
+    Returns:
+        list[tuple]: (kind, file name) with kind "added", "modified" or "removed", sorted by file name
+    """
+    changes: list = []
+    for name in sorted(set(old) | set(new) if names is None else set(names)):
+        if name not in new:
+            if name in old:
+                changes.append(("removed", name))
+        elif name not in old:
+            changes.append(("added", name))
+        elif old[name] != new[name]:
+            changes.append(("modified", name))
+    return changes
+
+def load_inotify():
+    """
+    Returns:
+        CDLL: the C library when it has inotify (Linux), None otherwise
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch # raise AttributeError without inotify
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class MapWatcher:
+    """
+    Watch a map images folder on a background thread and report the map images added, modified or
+    removed, so the library and the grid are patched for the files that changed instead of listing
+    and indexing the whole folder again. Uses inotify on Linux and lists the folder every POLL_SECONDS
+    elsewhere, or if inotify is not available.
+    """
+    def __init__(self, directory: str, on_changes, poll_seconds: float = POLL_SECONDS, use_inotify: bool = True, wanted=is_map_file):
+        """
+        Args:
+            directory (str): folder path
+            on_changes: function (list of (kind, path)) called from the watcher thread with every batch of
+                changes, kind is "added", "modified" or "removed"
+            poll_seconds (float): how often the polling fallback lists the folder
+            use_inotify (bool): False to always poll
+            wanted: function (file name) -> bool, the files to watch
+        """
+        self.directory = directory
+        self.on_changes = on_changes
+        self.poll_seconds = poll_seconds
+        self.wanted = wanted
+        self.libc = load_inotify() if use_inotify else None
+        self.mode: str = "inotify" if self.libc else "polling"
+        self.files: dict = {} # file name -> (mtime_ns, size) last reported
+        self.lock = threading.Lock() # reports come from the watcher thread and from notice
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Take the starting snapshot of the folder and watch it for changes from now on
+
+        Returns:
+            None
+        """
+        fd = self.open_inotify() if self.libc else None
+        self.files = snapshot(self.directory, wanted=self.wanted)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.watch_inotify if fd is not None else self.watch_polling, args=(fd,) if fd is not None else (),
+                                       name="map watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self, wait: bool = True):
+        """
+        Stop watching
+
+        Args:
+            wait (bool): wait for the watcher thread to finish, up to poll_seconds. False when closing
+                the window, the thread is a daemon and ends by itself within poll_seconds.
+
+        Returns:
+            None
+        """
+        self.stop_event.set()
+        if self.thread is not None and wait:
+            self.thread.join()
+        self.thread = None
+
+    def open_inotify(self) -> int:
+        """
+        Returns:
+            int: inotify file descriptor watching the folder, None if it can not be set up (then the watcher polls)
+        """
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            self.mode = "polling"
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+        if self.libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+            print(f"Could not watch {self.directory}: {os.strerror(ctypes.get_errno())}, polling instead")
+            os.close(fd)
+            self.mode = "polling"
+            return None
+        return fd
+
+    def notice(self, path: str):
+        """
+        Report a file another thread of this program just wrote, e.g. a map image the rescan downloaded,
+        right away instead of when the watcher sees it, which takes up to poll_seconds when polling. The
+        watcher does not report it again.
+
+        Returns:
+            None
+        """
+        self.report([os.path.basename(path)])
+
+    def report(self, names=None):
+        """
+        Stat the changed files, or every file if names is None, and report what changed since the last report
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.report_changes(names)
+
+    def report_changes(self, names=None):
+        """
+        The work of report, called with the lock held
+
+        Returns:
+            None
+        """
+        if names is None:
+            current = snapshot(self.directory, wanted=self.wanted)
+            changes = diff_snapshots(self.files, current)
+            self.files = current
+        else:
+            current = snapshot(self.directory, sorted(names), self.wanted)
+            changes = diff_snapshots(self.files, current, names)
+            for name in names:
+                if name in current:
+                    self.files[name] = current[name]
+                else:
+                    self.files.pop(name, None)
+        if changes:
+            self.on_changes([(kind, os.path.join(self.directory, name)) for kind, name in changes])
+
+    def watch_polling(self):
+        """
+        Watcher thread without inotify, lists the folder every poll_seconds
+
+        Returns:
+            None
+        """
+        while not self.stop_event.wait(self.poll_seconds):
+            try:
+                self.report()
+            except OSError as e:
+                print(f"Could not list {self.directory}: {str(e)}")
+
+    def watch_inotify(self, fd: int):
+        """
+        Watcher thread with inotify, waits for events and reports the files they name once they settle
+
+        Returns:
+            None
+        """
+        try:
+            while not self.stop_event.is_set():
+                names: set = set()
+                rescan: bool = False
+                deadline: float = None
+                while not self.stop_event.is_set():
+                    timeout = self.poll_seconds if deadline is None else max(0.0, deadline - time.monotonic())
+                    readable, _, _ = select.select([fd], [], [], timeout)
+                    if not readable:
+                        if deadline is not None:
+                            break # settled
+                        continue
+                    try:
+                        data = os.read(fd, 64 * 1024)
+                    except OSError as e:
+                        if e.errno == errno.EAGAIN:
+                            continue
+                        raise
+                    offset = 0
+                    while offset < len(data):
+                        _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                        name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                        offset += EVENT_HEADER.size + length
+                        if mask & (IN_DELETE_SELF | IN_IGNORED):
+                            print(f"{self.directory} is gone, stopped watching it")
+                            return
+                        if mask & IN_Q_OVERFLOW:
+                            rescan = True # events were dropped, compare the whole folder
+                        elif name and self.wanted(os.fsdecode(name)):
+                            names.add(os.fsdecode(name))
+                    if (names or rescan) and deadline is None:
+                        deadline = time.monotonic() + SETTLE_SECONDS
+                if names or rescan:
+                    try:
+                        self.report(None if rescan else names)
+                    except OSError as e:
+                        print(f"Could not list {self.directory}: {str(e)}")
+        finally:
+            os.close(fd)
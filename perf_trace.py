@@ -0,0 +1,212 @@
+# /perf_trace.py
+
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+# named spans and counters of where the time goes, off unless HEROES3_TRACE is set or a --trace flag calls enable
+# spans become complete events and counters counter events of a Chrome trace-event JSON file, open it in
+# chrome://tracing or https://ui.perfetto.dev
+TRACE_ENV: str = "HEROES3_TRACE" # set to a file path to trace a run and write the trace there on exit
+MAX_EVENTS: int = 1_000_000 # events kept, later ones only update the totals
+
+class Tracer:
+    """
+    Spans and counters of one run, safe to use from any thread. Totals are kept per name for the stats
+    line, every span and counter change is also kept as a trace event.
+    """
+    def __init__(self):
+        self.enabled: bool = False
+        self.path: str = None # where the trace is written on exit, None to not write it
+        self.start: float = time.perf_counter()
+        self.events: list = []
+        self.span_totals: dict = {} # span name -> [count, total seconds]
+        self.counters: dict = {} # counter name -> value
+        self.lock = threading.Lock()
+
+    def enable(self, path: str = None):
+        """
+        Start tracing
+
+        Args:
+            path (str): trace file written when the program exits, not written if not given
+
+        Returns:
+            None
+        """
+        if path and not self.path:
+            atexit.register(self.export_on_exit)
+        self.path = path or self.path
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """
+        Time the code in a with block as a span, e.g. with tracer.span("thumbnail.decode", path=path):
+
+        Args:
+            name (str): span name, spans of the same name are totalled
+            args: values shown with the span in the trace viewer
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start, **args)
+
+    def record(self, name: str, start: float, seconds: float, **args):
+        """
+        Add a span that was timed elsewhere, e.g. an HTTP request timed by requests
+
+        Args:
+            name (str): span name
+            start (float): time.perf_counter() when it started
+            seconds (float): how long it took
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            totals = self.span_totals.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({"name": name, "ph": "X", "ts": (start - self.start) * 1e6, "dur": seconds * 1e6,
+                                    "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+    def count(self, name: str, value: int = 1):
+        """
+        Add to a counter, e.g. count("http.bytes", len(body))
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({"name": name, "ph": "C", "ts": (time.perf_counter() - self.start) * 1e6,
+                                    "pid": os.getpid(), "args": {name: self.counters[name]}})
+
+    def span_stats(self, name: str) -> tuple:
+        """
+        Returns:
+            tuple: (count, mean milliseconds) of the spans of a name
+        """
+        with self.lock:
+            count, seconds = self.span_totals.get(name, (0, 0.0))
+        return count, seconds * 1000 / count if count else 0.0
+
+    def hit_rate(self, name: str) -> float:
+        """
+        Returns:
+            float: share of "<name>.hit" in "<name>.hit" plus "<name>.miss", None before either was counted
+        """
+        hits, misses = self.counters.get(name + ".hit", 0), self.counters.get(name + ".miss", 0)
+        return hits / (hits + misses) if hits + misses else None
+
+    def stats_line(self) -> str:
+        """
+        Returns:
+            str: short summary for the progress label e.g. "HTTP 120 x 45 ms, 3.2 MB | decode 40 x 8.1 ms | thumbnails 87% cached"
+        """
+        parts: list = []
+        requests, request_ms = self.span_stats("http.request")
+        if requests:
+            parts.append(f"HTTP {requests} x {request_ms:.0f} ms, {self.counters.get('http.bytes', 0) / 1e6:.1f} MB")
+        decodes, decode_ms = self.span_stats("thumbnail.decode")
+        if decodes:
+            parts.append(f"decode {decodes} x {decode_ms:.1f} ms")
+        layouts, layout_ms = self.span_stats("grid.layout")
+        if layouts:
+            parts.append(f"layout {layout_ms:.1f} ms")
+        cells, cell_ms = self.span_stats("grid.create_cell")
+        if cells:
+            parts.append(f"{cells} widgets x {cell_ms:.2f} ms")
+        thumbnail_hits = self.hit_rate("thumbnail_cache")
+        if thumbnail_hits is not None:
+            parts.append(f"thumbnails {thumbnail_hits:.0%} cached")
+        return " | ".join(parts)
+
+    def trace(self) -> dict:
+        """
+        Returns:
+            dict: the trace in Chrome trace-event format
+        """
+        with self.lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                    "otherData": {"counters": dict(self.counters),
+                                  "spans": {name: {"count": count, "total_ms": seconds * 1000} for name, (count, seconds) in self.span_totals.items()}}}
+
+    def export(self, path: str):
+        """
+        Write the trace as Chrome trace-event JSON
+
+        Returns:
+            None
+        """
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f)
+        os.replace(path + ".tmp", path)
+
+    def export_on_exit(self):
+        """
+        atexit handler writing the trace to the path given to enable
+
+        Returns:
+            None
+        """
+        if self.enabled and self.path:
+            self.export(self.path)
+            print(f"Trace written to {self.path}")
+
+tracer = Tracer() # the program's tracer, the module functions below use it
+
+def span(name: str, **args):
+    """
+    Returns:
+        context manager timing a with block as a span of the program's tracer, see Tracer.span
+    """
+    return tracer.span(name, **args)
+
+def record(name: str, start: float, seconds: float, **args):
+    """
+    Add a span timed elsewhere to the program's tracer, see Tracer.record
+
+    Returns:
+        None
+    """
+    tracer.record(name, start, seconds, **args)
+
+def count(name: str, value: int = 1):
+    """
+    Add to a counter of the program's tracer, see Tracer.count
+
+    Returns:
+        None
+    """
+    tracer.count(name, value)
+
+def enable(path: str = None):
+    """
+    Start tracing with the program's tracer, see Tracer.enable
+
+    Returns:
+        None
+    """
+    tracer.enable(path)
+
+if os.environ.get(TRACE_ENV):
+    enable(os.environ[TRACE_ENV])
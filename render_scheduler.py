@@ -0,0 +1,91 @@
+# /render_scheduler.py
+
+import time
+import perf_trace
+
+DEBOUNCE_MS: int = 60 # quiet time after the last slider/filter event before the grid is rendered
+
+class RenderScheduler:
+    """
+    Coalesce grid render requests from sliders and filters. Every request merges its changes into
+    the pending ones (newest value wins) and pushes the render back until input has been quiet for
+    delay_ms, so dragging a slider renders once for the final value instead of once per step.
+    """
+    def __init__(self, root, render, on_stale=None, delay_ms: int = DEBOUNCE_MS, on_painted=None):
+        """
+        Args:
+            root (Tk): the GUI Window, used to schedule renders
+            render: function (changes dict) doing the render on the Tk thread
+            on_stale: function (changes dict) called at once for every request, to stop work the
+                pending render makes stale e.g. decoding images at the old size
+            delay_ms (int): debounce delay
+            on_painted: function (latency ms) called once the rendered grid is drawn, e.g. to show the latency
+        """
+        self.root = root
+        self.render = render
+        self.on_stale = on_stale
+        self.on_painted = on_painted
+        self.delay_ms = delay_ms
+        self.pending: dict = {}
+        self.after_id = None
+        self.last_input: float = None
+        self.requests: int = 0
+        self.renders: int = 0
+        self.last_latency_ms: float = None
+
+    def request(self, **changes):
+        """
+        Ask for a render with changes e.g. request(cols=3), replacing any render already waiting
+
+        Returns:
+            None
+        """
+        self.requests += 1
+        self.pending.update(changes)
+        self.last_input = time.perf_counter()
+        if self.on_stale:
+            self.on_stale(changes)
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.after_id = self.root.after(self.delay_ms, self.flush)
+
+    def flush(self):
+        """
+        Render the merged pending changes now
+
+        Returns:
+            None
+        """
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+        if not self.pending:
+            return
+        changes, self.pending = self.pending, {}
+        last_input = self.last_input
+        self.render(changes)
+        self.renders += 1
+        self.root.after_idle(lambda: self.painted(last_input)) # Tk redraws in idle time, queued ahead of this
+
+    def painted(self, last_input: float):
+        """
+        Record the time from the last input to the grid being redrawn, also as a "render.input_to_paint"
+        span of the trace
+
+        Returns:
+            None
+        """
+        seconds = time.perf_counter() - last_input
+        self.last_latency_ms = seconds * 1000
+        perf_trace.record("render.input_to_paint", last_input, seconds)
+        if self.on_painted:
+            self.on_painted(self.last_latency_ms)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: requests, renders, requests coalesced away and the last input to paint latency in ms
+        """
+        return {"requests": self.requests, "renders": self.renders,
+                "coalesced": self.requests - self.renders - (1 if self.pending else 0),
+                "latency_ms": self.last_latency_ms}
@@ -3,6 +3,43 @@ import subprocess
 import sys
 import time
 import os
+import tempfile
+import re
+import hashlib
+import io
+import json
+import urllib.parse
+import threading
+import unittest.mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import download_images
+import map_catalogue
+import map_filters
+import map_search
+import thumbnail_cache
+import image_cache
+import decode_pipeline
+import render_scheduler
+import map_journal
+import map_grid
+import map_export
+import zipfile
+import icon_atlas
+import map_library
+import map_cli
+import benchmark_corpus
+import benchmarks
+import perf_trace
+import map_verify
+import image_decode
+import map_watcher
+import queue
+import concurrent.futures
+from PIL import Image, PdfParser
+try:
+    import image_similarity
+except ImportError: # needs numpy, only the similarity tests are skipped without it
+    image_similarity = None
 
 # Check if running in a headless environment e.g. running in Githubs CI/CD headless platform
 running_headless = False
@@ -10,8 +47,10 @@ running_headless = False
 # Check for Linux headless environment
 if sys.platform.startswith('linux'):
     # Check if the display manager service is running
-    display_manager_status = subprocess.run(['systemctl', 'status', 'display-manager'], capture_output=True, text=True)
-    if 'Active: active' not in display_manager_status.stdout:
+    try:
+        display_manager_status = subprocess.run(['systemctl', 'status', 'display-manager'], capture_output=True, text=True)
+        running_headless = 'Active: active' not in display_manager_status.stdout
+    except OSError: # no systemctl e.g. in a container
         running_headless = True
 
 # pyautogui requires a os.DISPLAY variable, so if it's a headless display it wont set that variable hence it will break script
@@ -67,5 +106,1006 @@ class TestGUI(unittest.TestCase):
         # Check if the binary executed successfully (exit code 0)
         self.assertEqual(process.returncode, 0)
 
+class StubServer:
+    """
+    Local HTTP server standing in for the map website, serves a dict of path -> (status, headers, body)
+    and records every request path so tests can count round trips
+    """
+    def __init__(self, routes: dict):
+        self.routes = routes
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                route = stub.routes.get(self.path) or stub.routes.get(urllib.parse.urlsplit(self.path).path)
+                status, headers, body = route or (404, {}, b"not found")
+                if callable(body):
+                    status, headers, body = body(self)
+                if status == 200 and headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+def png_bytes(color: str = "red", size: tuple = (4, 4)) -> bytes:
+    """
+    A small valid PNG, map images failing map_verify.check_png are quarantined
+    """
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+PNG_BYTES = png_bytes()
+
+def make_map_site(map_names: list) -> dict:
+    """
+    Build stub routes for a List_of_maps page, one page per map and one image per map
+    """
+    rows = ""
+    routes = {}
+    for name in map_names:
+        slug = name.replace(" ", "_")
+        rows += f'<tr><td style="text-align:center;">icon</td><td style="text-align:center;"><a href="/index.php/{slug}" title="{name}">{name}</a></td></tr>'
+        routes[f"/index.php/{slug}"] = (200, {"Content-Type": "text/html"}, f'<img alt="" src="/images/thumb/a/ab/{slug}_map_auto.png/300px-{slug}_map_auto.png">'.encode())
+        routes[f"/images/a/ab/{slug}_map_auto.png"] = (200, {"Content-Type": "image/png", "ETag": f'"{slug}"'}, PNG_BYTES)
+    routes["/index.php/List_of_maps"] = (200, {"Content-Type": "text/html", "ETag": '"list-v1"'}, f"<table>{rows}</table>".encode())
+    routes["/api.php"] = (200, {}, image_info_api(map_names))
+    return routes
+
+def image_info_api(map_names: list):
+    """
+    Stub of the MediaWiki imageinfo query, knows the image URLs of map_names
+    """
+    def respond(request):
+        titles = urllib.parse.parse_qs(urllib.parse.urlsplit(request.path).query)["titles"][0].split("|")
+        normalized = [{"from": title, "to": title.replace("_", " ")} for title in titles]
+        pages = []
+        for title in titles:
+            slug = title[len("File:"):-len("_map_auto.png")]
+            if slug.replace("_", " ") in map_names:
+                pages.append({"title": title.replace("_", " "), "imageinfo": [{"url": f"/images/a/ab/{slug}_map_auto.png"}]})
+            else:
+                pages.append({"title": title.replace("_", " "), "missing": True})
+        return 200, {"Content-Type": "application/json"}, json.dumps({"query": {"normalized": normalized, "pages": pages}}).encode()
+    return respond
+
+class TestDownloadImages(unittest.TestCase):
+
+    def test_concurrent_download_reports_ordered_progress(self):
+        map_names = [f"Map {i}" for i in range(12)]
+        with StubServer(make_map_site(map_names)) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            progress = []
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir, progress.append, max_workers=4)
+
+            pngs = [entry for entry in os.listdir(map_images_dir) if entry.endswith(".png")]
+            self.assertEqual(sorted(pngs), sorted(f"Map_{i}_map_auto.png" for i in range(12)))
+            self.assertEqual(progress[:-1], [f"Downloading new images progress: {i}/12" for i in range(1, 13)])
+            self.assertEqual(progress[-1], "Rescanning complete!")
+
+    def test_rescan_only_transfers_changes(self):
+        routes = make_map_site(["Map A", "Map B"])
+        with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir)
+                self.assertEqual(len(stub.requests), 4)
+
+                # nothing changed, List_of_maps and the images are revalidated and all answer 304
+                stub.requests.clear()
+                download_images.download_images(map_images_dir)
+                self.assertEqual(sorted(stub.requests), ["/images/a/ab/Map_A_map_auto.png", "/images/a/ab/Map_B_map_auto.png",
+                                                         "/index.php/List_of_maps"])
+
+                # an image is uploaded again under the same name, it is picked up with List_of_maps unchanged
+                routes["/images/a/ab/Map_B_map_auto.png"] = (200, {"Content-Type": "image/png", "ETag": '"Map_B-v2"'}, png_bytes("blue"))
+                download_images.download_images(map_images_dir)
+                with open(os.path.join(map_images_dir, "Map_B_map_auto.png"), "rb") as f:
+                    self.assertEqual(f.read(), png_bytes("blue"))
+
+                # a new map is added, old images are checked with conditional requests, only the new one is downloaded
+                routes.update(make_map_site(["Map A", "Map B", "Map C"]))
+                routes["/index.php/List_of_maps"][1]["ETag"] = '"list-v2"'
+                stub.requests.clear()
+                download_images.download_images(map_images_dir)
+                self.assertEqual(sorted(urllib.parse.urlsplit(path).path for path in stub.requests),
+                                 sorted(["/index.php/List_of_maps", "/api.php", "/images/a/ab/Map_A_map_auto.png",
+                                         "/images/a/ab/Map_B_map_auto.png", "/images/a/ab/Map_C_map_auto.png"]))
+
+            manifest = download_images.load_manifest(map_images_dir)
+            self.assertEqual(sorted(manifest["maps"]), ["Map A", "Map B", "Map C"])
+            self.assertEqual(manifest["maps"]["Map C"]["size"], len(PNG_BYTES))
+
+    def test_cancelled_rescan_returns_early_with_a_consistent_manifest(self):
+        map_names = [f"Map {i}" for i in range(12)]
+        routes = make_map_site(map_names)
+
+        def slow_image(request):
+            time.sleep(0.05)
+            return 200, {"Content-Type": "image/png"}, PNG_BYTES
+
+        for name in map_names:
+            routes[f"/images/a/ab/{name.replace(' ', '_')}_map_auto.png"] = (200, {}, slow_image)
+        cancel_event = threading.Event()
+        progress = []
+
+        def on_progress(status):
+            progress.append(status)
+            cancel_event.set() # cancel once the first map is in
+
+        with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir, on_progress, max_workers=2, cancel_event=cancel_event)
+            self.assertEqual(progress[-1], "Rescanning cancelled")
+            pngs = sorted(entry for entry in os.listdir(map_images_dir) if entry.endswith(".png"))
+            self.assertLess(len(pngs), 12)
+            manifest = download_images.load_manifest(map_images_dir)
+            # every image on disk is in the manifest, including the ones still downloading when it was cancelled
+            self.assertEqual(sorted(entry["filename"] for entry in manifest["maps"].values()), pngs)
+            self.assertEqual(len(progress) - 1, len(pngs))
+
+    def test_failed_download_is_retried_and_resumed_with_the_list_unchanged(self):
+        image = png_bytes("blue", (64, 64))
+        ranges = []
+
+        def ranged_image(request):
+            match = re.match(r"bytes=(\d+)-", request.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                ranges.append(start)
+                return 206, {"Content-Type": "image/png", "Content-Range": f"bytes {start}-{len(image) - 1}/{len(image)}"}, image[start:]
+            return 200, {"Content-Type": "image/png"}, image
+
+        routes = make_map_site(["Map A", "Map B"])
+        routes["/images/a/ab/Map_B_map_auto.png"] = (500, {}, b"server error")
+        with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir)
+                self.assertEqual(sorted(download_images.load_manifest(map_images_dir)["maps"]), ["Map A"])
+                with open(os.path.join(map_images_dir, "Map_B_map_auto.png.part"), "wb") as f:
+                    f.write(image[:100]) # left behind by a dropped connection
+
+                routes["/images/a/ab/Map_B_map_auto.png"] = (200, {}, ranged_image)
+                stub.requests.clear()
+                download_images.download_images(map_images_dir)
+            self.assertIn("/index.php/List_of_maps", stub.requests) # answered 304
+            self.assertEqual(ranges, [100])
+            with open(os.path.join(map_images_dir, "Map_B_map_auto.png"), "rb") as f:
+                self.assertEqual(f.read(), image)
+            self.assertEqual(sorted(download_images.load_manifest(map_images_dir)["maps"]), ["Map A", "Map B"])
+
+    def test_batched_image_url_resolution(self):
+        map_names = [f"Map {i}" for i in range(120)]
+        routes = make_map_site(map_names)
+        routes["/api.php"] = (200, {}, image_info_api(map_names[:-1])) # the API does not know the last map
+        with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir)
+            api_requests = [path for path in stub.requests if path.startswith("/api.php")]
+            page_requests = [path for path in stub.requests if path.startswith("/index.php/Map_")]
+
+            self.assertEqual(len(api_requests), 3)
+            self.assertEqual(page_requests, ["/index.php/Map_119"]) # scraped as fallback
+            self.assertEqual(len(stub.requests), 1 + 3 + 1 + 120)
+            self.assertEqual(len([entry for entry in os.listdir(map_images_dir) if entry.endswith(".png")]), 120)
+
+            # the old scraping path still works on its own
+            with tempfile.TemporaryDirectory() as scrape_dir, unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                stub.requests.clear()
+                download_images.download_images(scrape_dir, resolve_mode="scrape")
+                self.assertEqual(len(stub.requests), 1 + 2 * 120)
+
+    def test_download_image_is_atomic_and_resumes(self):
+        image = bytes(range(256)) * 64
+
+        def ranged_image(request):
+            match = re.match(r"bytes=(\d+)-", request.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                return 206, {"Content-Type": "image/png", "Content-Range": f"bytes {start}-{len(image) - 1}/{len(image)}"}, image[start:]
+            return 200, {"Content-Type": "image/png"}, image
+
+        routes = {"/error.png": (200, {"Content-Type": "text/html"}, b"<html>Server error</html>"),
+                  "/image.png": (200, {}, ranged_image)}
+        with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            self.assertIsNone(download_images.download_image(stub.url + "/error.png", map_images_dir, "error.png"))
+            self.assertEqual(os.listdir(map_images_dir), [])
+
+            with open(os.path.join(map_images_dir, "image.png.part"), "wb") as f:
+                f.write(image[:1000]) # left behind by a dropped connection
+            entry = download_images.download_image(stub.url + "/image.png", map_images_dir, "image.png")
+
+            self.assertEqual(os.listdir(map_images_dir), ["image.png"])
+            with open(os.path.join(map_images_dir, "image.png"), "rb") as f:
+                self.assertEqual(f.read(), image)
+            self.assertEqual(entry["size"], len(image))
+            self.assertEqual(entry["sha256"], hashlib.sha256(image).hexdigest())
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_synthetic_corpus_rescans_like_the_site(self):
+        with tempfile.TemporaryDirectory() as corpus_dir, tempfile.TemporaryDirectory() as map_images_dir:
+            maps = benchmark_corpus.generate_corpus(corpus_dir, 6, seed=1)
+            self.assertEqual(maps, benchmark_corpus.corpus_maps(6, seed=1)) # same corpus for the same seed
+            for map_name, entry in maps.items():
+                with Image.open(os.path.join(corpus_dir, benchmark_corpus.image_filename(map_name))) as image:
+                    self.assertEqual(image.size, (benchmark_corpus.MAP_TILES[entry["size"]] * benchmark_corpus.TILE_PIXELS,) * 2)
+
+            with benchmark_corpus.CorpusServer(corpus_dir, maps) as server, unittest.mock.patch.object(download_images, "BASE_URL", server.url):
+                download_images.download_images(map_images_dir)
+            catalogue = map_catalogue.load_catalogue(map_images_dir)
+            for map_name, entry in maps.items():
+                self.assertEqual(dict(catalogue[map_name], page_url=None), dict(entry, page_url=None))
+                with open(os.path.join(corpus_dir, benchmark_corpus.image_filename(map_name)), "rb") as f, \
+                        open(os.path.join(map_images_dir, benchmark_corpus.image_filename(map_name)), "rb") as g:
+                    self.assertEqual(f.read(), g.read())
+
+    def test_regressions_against_a_baseline(self):
+        baseline = {"scan": [{"maps": 100, "rescan": "first", "scan_ms": 100.0, "maps_per_s": 1000.0}],
+                    "search": [{"maps": 100, "build_ms": 2.0, "keystroke_ms": 0.01}]}
+        results = {"scan": [{"maps": 100, "rescan": "first", "scan_ms": 200.0, "maps_per_s": 500.0},
+                            {"maps": 1000, "rescan": "first", "scan_ms": 900.0, "maps_per_s": 1111.0}],
+                   "search": [{"maps": 100, "build_ms": 2.2, "keystroke_ms": 0.05}]} # keystroke_ms is below the noise floor
+        regressions = benchmarks.compare_results(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("scan_ms 200.000 ms, was 100.000 ms", regressions[0])
+
+class TestMapCatalogue(unittest.TestCase):
+
+    LIST_OF_MAPS = """
+    <table class="wikitable sortable">
+    <tr><th>Size</th><th>Map</th><th>Players</th><th>Levels</th><th>Victory</th><th>Loss</th><th>Difficulty</th><th>Version</th></tr>
+    <tr><td style="text-align:center;"><img src="/images/thumb/1/1a/Sz3_xl.gif/20px-Sz3_xl.gif"></td>
+        <td style="text-align:center;"><a href="/index.php/Tovar%27s_Treasure" title="Tovar&#39;s Treasure">Tovar's Treasure</a></td>
+        <td>4/2</td><td>2</td>
+        <td><img src="/images/2/2b/Vc_artifact.gif"> <img src="/images/3/3c/Vc_standard.gif"></td>
+        <td><img src="/images/4/4d/Ls_timeexpires.gif"></td>
+        <td><img src="/images/5/5e/Dif_hard.gif"></td><td><img src="/images/6/6f/V_hota.gif"></td></tr>
+    <tr><td style="text-align:center;"><img src="/images/7/7a/Sz0_s.gif"></td>
+        <td style="text-align:center;"><a href="/index.php/Small_Map" title="Small Map">Small Map</a></td>
+        <td>2/1</td><td>1</td><td><img src="/images/8/8b/Vc_standard.gif"></td>
+        <td><img src="/images/9/9c/Ls_standard.gif"></td><td><img src="/images/0/0d/Dif_easy.gif"></td><td><img src="/images/1/1e/V_roe.gif"></td></tr>
+    </table>
+    """
+
+    def test_parse_catalogue(self):
+        catalogue = map_catalogue.parse_catalogue(self.LIST_OF_MAPS, "https://heroes.thelazy.net")
+
+        self.assertEqual(sorted(catalogue), ["Small Map", "Tovar's Treasure"])
+        self.assertEqual(catalogue["Tovar's Treasure"], {
+            "page_url": "https://heroes.thelazy.net/index.php/Tovar%27s_Treasure", "size": "XL", "expansion": "hota",
+            "difficulty": "hard", "victory": ["artifact", "standard"], "loss": ["timeexpires"], "players": "4/2",
+            "subterranean": True})
+        self.assertFalse(catalogue["Small Map"]["subterranean"])
+
+        # keyed by the same name the GUI shows for the downloaded image
+        self.assertIs(map_catalogue.catalogue_entry(catalogue, "assets/map_images/Tovar%27s_Treasure_map_auto.png"),
+                      catalogue["Tovar's Treasure"])
+
+class TestMapFilters(unittest.TestCase):
+
+    def test_filters_or_within_groups_and_across_groups(self):
+        catalogue = {
+            "Arrogance": {"size": "L", "expansion": "roe", "difficulty": "hard", "victory": ["standard"], "loss": ["standard"]},
+            "Dragon Orb": {"size": "XL", "expansion": "sod", "difficulty": "hard", "victory": ["artifact"], "loss": ["standard"], "subterranean": True},
+            "Pandora": {"size": "XL", "expansion": "roe", "difficulty": "easy", "victory": ["standard", "survivetime"], "loss": ["timeexpires"]},
+        }
+        paths = [f"maps/{name.replace(' ', '_')}_map_auto.png" for name in catalogue] + ["maps/Unknown_map_auto.png"]
+        index = map_filters.FilterIndex.build(paths, catalogue)
+        name = lambda selected: [map_catalogue.map_name_from_filename(path) for path in index.matching_paths(selected)]
+
+        self.assertEqual(len(name(set())), 4)
+        self.assertEqual(name({"size:XL"}), ["Dragon Orb", "Pandora"])
+        self.assertEqual(name({"size:L", "size:XL", "difficulty:hard"}), ["Arrogance", "Dragon Orb"])
+        self.assertEqual(name({"victory:standard", "expansion:roe", "loss:timeexpires"}), ["Pandora"])
+        self.assertEqual(name({"subterranean:yes"}), ["Dragon Orb"])
+
+        counts = index.counts({"size:XL"}, ["size:L", "size:XL", "difficulty:hard", "difficulty:easy"])
+        self.assertEqual(counts, {"size:L": 1, "size:XL": 2, "difficulty:hard": 1, "difficulty:easy": 1})
+
+        index.set_flag("liked:yes", paths[0], True)
+        self.assertEqual(name({"liked:yes"}), ["Arrogance"])
+        index.set_flag("liked:yes", paths[0], False)
+        self.assertEqual(name({"liked:yes"}), [])
+
+class TestMapSearch(unittest.TestCase):
+
+    def test_ranked_prefix_and_fuzzy_search(self):
+        names = ["Tovar%27s_Treasure", "Treasure_Hunt", "Cl%C3%A9ment_Isle", "Titans_Winter", "Hunter_Treasure_Isle"]
+        index = map_search.SearchIndex.build([f"maps/{name}_map_auto.png" for name in names])
+        search = lambda query: [map_catalogue.map_name_from_filename(path) for path in index.search(query)]
+
+        self.assertEqual(search("treasure"), ["Treasure Hunt", "Hunter Treasure Isle", "Tovar's Treasure"])
+        self.assertEqual(search("TOVAR'S"), ["Tovar's Treasure"])
+        self.assertEqual(search("clement"), ["Clément Isle"]) # accents folded
+        self.assertEqual(search("hunt isle")[0], "Hunter Treasure Isle") # every word as a prefix, ahead of fuzzy matches
+        self.assertEqual(search("tresure")[0], "Treasure Hunt") # typo, fuzzy match
+        self.assertEqual(len(search("")), 5)
+
+        # typing on refines the previous matches
+        search("t")
+        self.assertEqual(index.last_query, "t")
+        self.assertEqual(search("ti"), ["Titans Winter"])
+
+class TestMapJournal(unittest.TestCase):
+
+    def test_journal_persists_in_batches(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, map_journal.JOURNAL_FILENAME)
+            journal = map_journal.MapJournal(db_path)
+            paths = [f"maps/map{i}_map_auto.png" for i in range(2000)]
+            for path in paths:
+                journal.set_liked(path, True)
+            journal.set_liked(paths[1], False)
+            journal.set_notes(paths[0], "Tough start, rush the grail")
+            journal.record_play(paths[0], played=100.0)
+            journal.record_play(paths[0], played=200.0)
+            journal.set_status(paths[2], "won")
+            self.assertTrue(journal.entry(paths[0])["liked"]) # answered from memory before anything is written
+            with self.assertRaises(ValueError):
+                journal.set_status(paths[0], "lost")
+            journal.close()
+            self.assertLess(journal.batches, 2010) # writes were committed together, not one transaction each
+
+            journal = map_journal.MapJournal(db_path)
+            self.assertEqual(len(journal.keys_with(liked=True)), 1999)
+            self.assertEqual(journal.entry(paths[0]), {"liked": True, "status": "unfinished", "notes": "Tough start, rush the grail",
+                                                       "plays": 2, "last_played": 200.0})
+            self.assertEqual(journal.entry(paths[2])["status"], "won")
+            self.assertEqual(journal.entry("other/map9999_map_auto.png")["status"], "unplayed")
+            self.assertEqual(journal.history(paths[0]), [200.0, 100.0])
+            connection = journal.connect()
+            self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            connection.close()
+            journal.close()
+
+class TestIconAtlas(unittest.TestCase):
+
+    def test_icons_come_from_the_atlas_on_first_use(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            Image.new("RGB", (512, 512), "red").save(os.path.join(temp_dir, "star.png"))
+            Image.new("RGB", (29, 21), "blue").save(os.path.join(temp_dir, "vc_hero.gif"))
+            Image.new("RGB", (204, 327), "white").save(os.path.join(temp_dir, "page.png")) # background, not an icon
+            made = []
+            icons = icon_atlas.IconAtlas(temp_dir, make_photo=lambda image: made.append(image) or image)
+
+            self.assertEqual(sorted(icons.names()), ["star", "vc_hero"])
+            self.assertEqual(made, []) # nothing decoded until an icon is used
+            self.assertEqual(icons["star"].size, (32, 32))
+            self.assertEqual(icons["star"].getpixel((16, 16)), (255, 0, 0, 255))
+            self.assertIs(icons["star"], made[0])
+            self.assertEqual(len(made), 1)
+            self.assertNotIn("page", icons)
+            with self.assertRaises(KeyError):
+                icons["page"]
+
+            # a new icon in the folder rebuilds the atlas
+            Image.new("RGB", (31, 25), "green").save(os.path.join(temp_dir, "sz0_s.gif"))
+            self.assertEqual(icon_atlas.IconAtlas(temp_dir, make_photo=lambda image: image)["sz0_s"].getpixel((0, 0)), (0, 128, 0, 255))
+
+class TestMapLibrary(unittest.TestCase):
+
+    def test_cli_indexes_thumbnails_and_exports_without_a_display(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            maps_dir = os.path.join(temp_dir, "map_images")
+            os.makedirs(maps_dir)
+            for name, colour in (("Arrogance", "green"), ("Dragon_Orb", "blue"), ("Pandora", "red")):
+                Image.new("RGB", (64, 64), colour).save(os.path.join(maps_dir, f"{name}_map_auto.png"))
+            map_catalogue.save_catalogue(maps_dir, {
+                "Arrogance": {"size": "L", "difficulty": "hard"},
+                "Dragon Orb": {"size": "XL", "difficulty": "hard"},
+                "Pandora": {"size": "XL", "difficulty": "easy"}})
+            library = map_library.MapLibrary(maps_dir)
+            library.load()
+            library.journal.set_liked(os.path.join(maps_dir, "Pandora_map_auto.png"), True)
+            library.close()
+
+            with unittest.mock.patch("sys.stdout"):
+                self.assertEqual(map_cli.main(["--maps", maps_dir, "index", "--no-similarity"]), 0)
+                self.assertEqual(map_cli.main(["--maps", maps_dir, "thumbs", "--sizes", "16", "32"]), 0)
+                self.assertEqual(map_cli.main(["--maps", maps_dir, "export", "--filter", "size:XL", "--filter", "difficulty:hard",
+                                               "--filter", "difficulty:easy", "--sort", "descending", "-o", os.path.join(temp_dir, "maps.json")]), 0)
+            with open(os.path.join(temp_dir, "maps.json")) as f:
+                exported = json.load(f)
+            self.assertEqual([entry["name"] for entry in exported], ["Pandora", "Dragon Orb"])
+            self.assertTrue(exported[0]["journal"]["liked"])
+            self.assertEqual(exported[1]["catalogue"]["size"], "XL")
+
+            cache_dir = thumbnail_cache.default_cache_dir(maps_dir)
+            self.assertEqual(sum(len(files) for _, _, files in os.walk(cache_dir)), 6)
+
+            library = map_library.MapLibrary(maps_dir)
+            library.load()
+            self.assertEqual([map_catalogue.map_name_from_filename(path) for path in library.query({"liked:yes"})], ["Pandora"])
+            self.assertEqual([map_catalogue.map_name_from_filename(path) for path in library.query(search="drag")], ["Dragon Orb"])
+            library.close()
+
+class TestMapExport(unittest.TestCase):
+
+    def test_maps_stream_into_a_zip_and_a_paged_contact_sheet(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for i in range(30):
+                paths.append(os.path.join(temp_dir, f"Map_{i}_map_auto.png"))
+                Image.new("RGB", (80, 60), (i * 8, 0, 0)).save(paths[-1])
+            progress = []
+            loaded = []
+            load_tile = lambda path, width, height: loaded.append(path) or Image.open(path).resize((width, height))
+            with unittest.mock.patch("builtins.print"), \
+                    unittest.mock.patch.object(map_export.zipfile.ZipFile, "write", side_effect=AssertionError("whole file write")):
+                map_export.export_maps(paths, lambda path: {"name": map_catalogue.map_name_from_filename(path)}, load_tile,
+                                       os.path.join(temp_dir, "maps.zip"), os.path.join(temp_dir, "maps.pdf"), progress.append, max_workers=3)
+
+            with zipfile.ZipFile(os.path.join(temp_dir, "maps.zip")) as archive:
+                manifest = json.loads(archive.read(map_export.MANIFEST_NAME))["maps"]
+                self.assertEqual(len(manifest), 30)
+                self.assertEqual(manifest[3]["name"], "Map 3")
+                with open(paths[3], "rb") as f:
+                    data = f.read()
+                self.assertEqual(archive.read(manifest[3]["file"]), data)
+                self.assertEqual(manifest[3]["sha256"], hashlib.sha256(data).hexdigest())
+
+            tile_size, cols, rows = map_export.sheet_layout()
+            pages = -(-30 // (cols * rows))
+            self.assertGreater(pages, 1)
+            self.assertEqual(len(PdfParser.PdfParser(os.path.join(temp_dir, "maps.pdf")).pages), pages)
+            self.assertEqual(sorted(loaded), sorted(paths))
+            self.assertEqual(progress[-1], "Export complete!")
+            self.assertIn("Export archive progress: 30/30", progress)
+            self.assertIn(f"Contact sheet progress: page {pages}/{pages}", progress)
+            self.assertFalse([name for name in os.listdir(temp_dir) if name.endswith(".part")])
+
+class TestPerfTrace(unittest.TestCase):
+
+    def test_spans_and_counters_export_as_chrome_trace(self):
+        tracer = perf_trace.Tracer()
+        with unittest.mock.patch.object(perf_trace, "tracer", tracer):
+            with perf_trace.span("thumbnail.decode"):
+                pass
+            self.assertEqual(tracer.events, []) # off until enabled
+
+            perf_trace.enable()
+            routes = make_map_site(["Map A", "Map B"])
+            with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir, \
+                    unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir)
+                Image.new("RGB", (64, 64), "green").save(os.path.join(map_images_dir, "Map_C_map_auto.png"))
+                for _ in range(2):
+                    thumbnail_cache.load_thumbnail(os.path.join(map_images_dir, "Map_C_map_auto.png"), 16, 16, os.path.join(map_images_dir, "cache"))
+
+            self.assertEqual(tracer.span_stats("http.request")[0], 4) # list page, API and two images
+            self.assertGreater(tracer.counters["http.bytes"], len(routes["/index.php/List_of_maps"][2]) + 2 * len(PNG_BYTES)) # and the API answer
+            self.assertEqual(tracer.span_stats("thumbnail.decode")[0], 1)
+            self.assertEqual(tracer.hit_rate("thumbnail_cache"), 0.5)
+            self.assertIn("HTTP 4 x", tracer.stats_line())
+            self.assertIn("thumbnails 50% cached", tracer.stats_line())
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                tracer.export(os.path.join(temp_dir, "trace.json"))
+                with open(os.path.join(temp_dir, "trace.json")) as f:
+                    events = json.load(f)["traceEvents"]
+            self.assertEqual({event["ph"] for event in events}, {"X", "C"})
+            self.assertTrue(all(event["dur"] >= 0 for event in events if event["ph"] == "X"))
+
+class TestMapVerify(unittest.TestCase):
+
+    def test_broken_images_are_quarantined_and_duplicates_deleted(self):
+        with tempfile.TemporaryDirectory() as maps_dir:
+            good = png_bytes("green")
+            files = {"Good_map_auto.png": good, "Tovar%27s_map_auto.png": good, "Tovar's_map_auto.png": good,
+                     "Truncated_map_auto.png": good[:-10], "Bad_crc_map_auto.png": good[:45] + bytes([good[45] ^ 1]) + good[46:],
+                     "Html_map_auto.png": b"<html>not found</html>", "Other_map_auto.png": png_bytes("blue")}
+            for filename, data in files.items():
+                with open(os.path.join(maps_dir, filename), "wb") as f:
+                    f.write(data)
+            download_images.save_manifest(maps_dir, {"list_page": {}, "maps": {"Tovar's": {"filename": "Tovar's_map_auto.png"}}})
+
+            library = map_library.MapLibrary(maps_dir)
+            paths = library.load()
+            library.close()
+            self.assertEqual(sorted(os.path.basename(path) for path in paths), ["Other_map_auto.png", "Tovar's_map_auto.png"])
+            self.assertEqual(sorted(os.listdir(os.path.join(maps_dir, map_verify.QUARANTINE_DIRNAME))),
+                             ["Bad_crc_map_auto.png", "Html_map_auto.png", "Truncated_map_auto.png"])
+            self.assertEqual(map_verify.check_png(os.path.join(maps_dir, "Other_map_auto.png")),
+                             (None, hashlib.sha256(files["Other_map_auto.png"]).hexdigest()))
+
+            self.assertEqual(map_verify.check_png(os.path.join(maps_dir, map_verify.QUARANTINE_DIRNAME, "Bad_crc_map_auto.png")),
+                             ("bad CRC in IDAT chunk", None))
+
+            # unchanged files are not read again
+            result = map_verify.verify_map_images(maps_dir)
+            self.assertEqual(result, {"checked": 0, "quarantined": [], "duplicates": []})
+
+    def test_load_shows_the_folder_first_and_verify_patches_it_after(self):
+        with tempfile.TemporaryDirectory() as maps_dir:
+            files = {"Good_map_auto.png": png_bytes("green"), "Other_copy_map_auto.png": png_bytes("green"), "Broken_map_auto.png": b"<html></html>"}
+            for filename, data in files.items():
+                with open(os.path.join(maps_dir, filename), "wb") as f:
+                    f.write(data)
+            library = map_library.MapLibrary(maps_dir)
+            with unittest.mock.patch.object(map_verify, "check_png") as check_png:
+                self.assertEqual(len(library.load(verify=False)), 3)
+                check_png.assert_not_called()
+
+            result = library.verify() # on a background thread in the GUI
+            gone = [("removed", os.path.join(maps_dir, filename)) for filename in result["quarantined"] + result["duplicates"]]
+            self.assertEqual(library.update(gone), gone)
+            library.close()
+            self.assertEqual(library.query(), [os.path.join(maps_dir, "Good_map_auto.png")])
+
+    def test_rescan_quarantines_a_broken_download(self):
+        routes = make_map_site(["Map A", "Map B"])
+        routes["/images/a/ab/Map_B_map_auto.png"] = (200, {"Content-Type": "image/png"}, PNG_BYTES[:-10])
+        with StubServer(routes) as stub, tempfile.TemporaryDirectory() as map_images_dir:
+            added = []
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir, image_callback=added.append)
+                self.assertEqual([os.path.basename(path) for path in added], ["Map_A_map_auto.png"])
+                self.assertEqual(sorted(download_images.load_manifest(map_images_dir)["maps"]), ["Map A"])
+                self.assertFalse(os.path.exists(os.path.join(map_images_dir, "Map_B_map_auto.png")))
+
+                # the next rescan downloads it again, with List_of_maps unchanged
+                routes["/images/a/ab/Map_B_map_auto.png"] = (200, {"Content-Type": "image/png"}, PNG_BYTES)
+                download_images.download_images(map_images_dir, image_callback=added.append)
+            self.assertEqual([os.path.basename(path) for path in added], ["Map_A_map_auto.png", "Map_B_map_auto.png"])
+            self.assertEqual(sorted(download_images.load_manifest(map_images_dir)["maps"]), ["Map A", "Map B"])
+            with open(os.path.join(map_images_dir, "Map_B_map_auto.png"), "rb") as f:
+                self.assertEqual(f.read(), PNG_BYTES)
+            map_b = os.path.join(map_images_dir, "Map_B_map_auto.png")
+            with unittest.mock.patch.object(map_verify, "check_png") as check_png: # the rescan checked its downloads
+                self.assertEqual(map_verify.check_changed_images(map_images_dir, [("added", map_b)]), [("added", map_b)])
+                check_png.assert_not_called()
+
+            # a file quarantined on load keeps its manifest entry, the rescan still sees it is gone
+            with open(os.path.join(map_images_dir, "Map_A_map_auto.png"), "r+b") as f:
+                f.seek(-10, os.SEEK_END)
+                f.write(b"\x00" * 10)
+            library = map_library.MapLibrary(map_images_dir)
+            self.assertEqual(library.verify()["quarantined"], ["Map_A_map_auto.png"])
+            library.close()
+            with unittest.mock.patch.object(download_images, "BASE_URL", stub.url):
+                download_images.download_images(map_images_dir)
+            with open(os.path.join(map_images_dir, "Map_A_map_auto.png"), "rb") as f:
+                self.assertEqual(f.read(), PNG_BYTES)
+
+class TestImageDecode(unittest.TestCase):
+
+    def test_decodes_within_the_memory_budget_and_closes_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for i, mode in enumerate(("RGB", "P", "RGBA", "L")):
+                path = os.path.join(temp_dir, f"Map_{i}_map_auto.png")
+                Image.new("RGB", (400, 300), "red").convert(mode).save(path)
+                paths.append(path)
+            budget = image_decode.MemoryBudget(400 * 300 * 5)
+            open_files = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+            with unittest.mock.patch.object(image_decode, "budget", budget), \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                thumbnails = list(executor.map(lambda path: image_decode.decode_resized(path, 40, 30), paths * 4))
+            self.assertLessEqual(budget.peak, budget.limit)
+            self.assertEqual(budget.used, 0)
+            self.assertEqual({thumbnail.size for thumbnail in thumbnails}, {(40, 30)})
+            self.assertEqual(thumbnails[1].mode, "RGB") # palette images are reduced in RGB
+            self.assertEqual(thumbnails[1].getpixel((20, 15)), (255, 0, 0))
+            if open_files is not None:
+                self.assertEqual(len(os.listdir("/proc/self/fd")), open_files)
+            self.assertEqual(image_decode.reduce_factor((4000, 2000), (300, 300)), (6, 3))
+
+class TestMapWatcher(unittest.TestCase):
+
+    def wait_for(self, changes: queue.Queue, expected: list):
+        reported = []
+        deadline = time.monotonic() + 5
+        while sorted(reported) != sorted(expected) and time.monotonic() < deadline:
+            try:
+                reported += changes.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.assertEqual(sorted(reported), sorted(expected))
+
+    def test_reports_added_modified_and_removed_map_images(self):
+        for use_inotify in (True, False):
+            with self.subTest(use_inotify=use_inotify), tempfile.TemporaryDirectory() as maps_dir:
+                old = os.path.join(maps_dir, "Old_map_auto.png")
+                with open(old, "wb") as f:
+                    f.write(png_bytes("red"))
+                changes = queue.Queue()
+                watcher = map_watcher.MapWatcher(maps_dir, changes.put, poll_seconds=0.05, use_inotify=use_inotify)
+                watcher.start()
+                try:
+                    new = os.path.join(maps_dir, "New_map_auto.png")
+                    with open(new + ".part", "wb") as f: # downloads are renamed into place
+                        f.write(png_bytes("blue"))
+                    os.replace(new + ".part", new)
+                    with open(os.path.join(maps_dir, "notes.txt"), "w") as f:
+                        f.write("not a map")
+                    self.wait_for(changes, [("added", new)])
+
+                    with open(old, "wb") as f:
+                        f.write(png_bytes("green", (8, 8)))
+                    os.remove(new)
+                    self.wait_for(changes, [("modified", old), ("removed", new)])
+                finally:
+                    watcher.stop()
+
+    def test_a_failed_listing_does_not_stop_the_watcher(self):
+        for use_inotify in (True, False):
+            with self.subTest(use_inotify=use_inotify), tempfile.TemporaryDirectory() as maps_dir:
+                watcher = map_watcher.MapWatcher(maps_dir, print, poll_seconds=0.05, use_inotify=use_inotify)
+                errors = [OSError("busy")]
+                def report_changes(names=None):
+                    if errors:
+                        raise errors.pop()
+                watcher.report_changes = unittest.mock.Mock(side_effect=report_changes)
+                watcher.start()
+                try:
+                    for name in ("First", "Second"):
+                        with open(os.path.join(maps_dir, f"{name}_map_auto.png"), "wb") as f:
+                            f.write(png_bytes("red"))
+                        time.sleep(0.3)
+                    self.assertGreaterEqual(watcher.report_changes.call_count, 2) # reported again after the error
+                    self.assertTrue(watcher.thread.is_alive())
+                finally:
+                    watcher.stop()
+
+    def test_files_written_by_the_rescan_are_reported_at_once_and_only_once(self):
+        with tempfile.TemporaryDirectory() as maps_dir:
+            changes = queue.Queue()
+            watcher = map_watcher.MapWatcher(maps_dir, changes.put, poll_seconds=60, use_inotify=False)
+            watcher.start()
+            try:
+                new = os.path.join(maps_dir, "New_map_auto.png")
+                with open(new, "wb") as f:
+                    f.write(png_bytes("blue"))
+                watcher.notice(new) # from the rescan thread
+                self.assertEqual(changes.get_nowait(), [("added", new)])
+                watcher.report() # what the next poll does
+                self.assertTrue(changes.empty())
+            finally:
+                watcher.stop(wait=False)
+
+    def test_library_and_grid_are_patched_for_changed_files(self):
+        with tempfile.TemporaryDirectory() as maps_dir:
+            paths = [os.path.join(maps_dir, f"{name}_map_auto.png") for name in ("Arrogance", "Dragon_Orb", "Pandora")]
+            for path, colour in zip(paths, ("green", "blue", "red")):
+                with open(path, "wb") as f:
+                    f.write(png_bytes(colour))
+            map_catalogue.save_catalogue(maps_dir, {"Arrogance": {"size": "L"}, "Dragon Orb": {"size": "XL"}, "Pandora": {"size": "XL"}})
+            library = map_library.MapLibrary(maps_dir)
+            grid = map_grid.MapGrid(benchmarks.HeadlessCanvas(), lambda path, width, height: path, print, 2, 100, 100, 10, 10)
+            grid.set_paths(library.load())
+
+            broken = os.path.join(maps_dir, "Broken_map_auto.png")
+            with open(broken, "wb") as f:
+                f.write(b"<html>not found</html>")
+            new = os.path.join(maps_dir, "Zebra_map_auto.png")
+            with open(new, "wb") as f:
+                f.write(png_bytes("white"))
+            map_catalogue.save_catalogue(maps_dir, {"Arrogance": {"size": "XL"}, "Dragon Orb": {"size": "XL"}, "Pandora": {"size": "XL"}})
+            os.remove(paths[1])
+            changes = library.check([("added", broken), ("added", new), ("removed", paths[1]), ("modified", paths[0]),
+                                     ("modified", os.path.join(maps_dir, map_catalogue.CATALOGUE_FILENAME))])
+            self.assertTrue(os.path.exists(os.path.join(maps_dir, map_verify.QUARANTINE_DIRNAME, "Broken_map_auto.png")))
+            with unittest.mock.patch.object(map_verify, "check_png") as check_png:
+                self.assertEqual(library.check(changes), changes) # files that passed are not read again
+                check_png.assert_not_called()
+                applied = library.update(changes) # only indexes
+                check_png.assert_not_called()
+            library.close()
+            self.assertEqual(applied, [("added", new), ("removed", paths[1]), ("modified", paths[0])])
+            self.assertEqual(library.query({"size:XL"}), [paths[0], paths[2]])
+            self.assertEqual(library.query(search="dragon"), [])
+            self.assertEqual(library.query(search="zeb"), [new])
+
+            for kind, path in applied:
+                if kind == "removed":
+                    grid.remove(path)
+                else:
+                    grid.append(path)
+            self.assertEqual(grid.paths, [paths[0], paths[2], new])
+            self.assertEqual({index: grid.canvas.positions[item] for index, item in grid.cells.items()},
+                             {index: grid.cell_position(index) for index in range(3)})
+
+            # a map inserted at its place in the sort order moves the cells after it on
+            zebra_item = grid.cells[2]
+            grid.insert(1, os.path.join(maps_dir, "Banshee_map_auto.png"))
+            self.assertEqual([os.path.basename(path) for path in grid.paths],
+                             ["Arrogance_map_auto.png", "Banshee_map_auto.png", "Pandora_map_auto.png", "Zebra_map_auto.png"])
+            self.assertEqual(grid.cells[3], zebra_item)
+            self.assertEqual({index: grid.canvas.positions[item] for index, item in grid.cells.items()},
+                             {index: grid.cell_position(index) for index in range(4)})
+            self.assertEqual(grid.indexes[new], 3)
+
+class TestThumbnailCache(unittest.TestCase):
+
+    def test_thumbnails_are_cached_and_invalidated(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            map_path = os.path.join(temp_dir, "Map_map_auto.png")
+            cache_dir = os.path.join(temp_dir, "thumbnail_cache")
+            Image.new("RGB", (288, 288), "green").save(map_path)
+
+            thumbnail = thumbnail_cache.load_thumbnail(map_path, 100, 100, cache_dir)
+            self.assertEqual(thumbnail.size, (100, 100))
+            cached_path = thumbnail_cache.thumbnail_path(map_path, 100, 100, cache_dir)
+            self.assertTrue(os.path.isfile(cached_path))
+
+            with unittest.mock.patch.object(Image.Image, "resize") as resize:
+                self.assertEqual(thumbnail_cache.load_thumbnail(map_path, 100, 100, cache_dir).getpixel((0, 0)), (0, 128, 0))
+                resize.assert_not_called() # served from the cache without decoding the source
+
+            Image.new("RGB", (288, 288), "red").save(map_path)
+            os.utime(map_path, ns=(0, os.stat(map_path).st_mtime_ns + 1_000_000_000))
+            self.assertEqual(thumbnail_cache.load_thumbnail(map_path, 100, 100, cache_dir).getpixel((0, 0)), (255, 0, 0))
+            self.assertFalse(os.path.exists(cached_path)) # the stale thumbnail is removed
+            self.assertEqual(len(os.listdir(os.path.dirname(cached_path))), 1)
+
+class TestImageCache(unittest.TestCase):
+
+    def test_least_recently_used_images_are_evicted_over_budget(self):
+        cache = image_cache.ImageCache(max_bytes=3 * 100 * 100 * 4)
+        loads = []
+        load = lambda path, width, height: loads.append((path, width)) or f"{path}@{width}"
+
+        for path in ["a", "b", "c"]:
+            cache.get_or_load(path, 100, 100, load)
+        cache.get_or_load("a", 100, 100, load) # a is now the most recently used
+        cache.get_or_load("d", 100, 100, load) # evicts b
+
+        self.assertEqual([key[0] for key in cache.entries], ["c", "a", "d"])
+        self.assertEqual(cache.get_or_load("a", 100, 100, load), "a@100")
+        self.assertEqual(len(loads), 4)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+        cache.get_or_load("a", 300, 300, load) # bigger than the whole budget, keeps only itself
+        self.assertEqual(list(cache.entries), [("a", 300, 300)])
+        cache.invalidate("a")
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+class FakeRoot:
+    """
+    Stands in for the Tk root, runs root.after callbacks when the test calls run_pending
+    """
+    def __init__(self):
+        self.callbacks = {}
+        self.next_id = 0
+
+    def after(self, ms, callback):
+        self.next_id += 1
+        self.callbacks[self.next_id] = callback
+        return self.next_id
+
+    def after_idle(self, callback):
+        return self.after(0, callback)
+
+    def after_cancel(self, after_id):
+        self.callbacks.pop(after_id, None)
+
+    def run_pending(self):
+        callbacks, self.callbacks = self.callbacks, {}
+        for callback in callbacks.values():
+            callback()
+        return len(callbacks)
+
+class TestDecodePipeline(unittest.TestCase):
+
+    def test_images_arrive_in_small_batches_on_the_tk_thread(self):
+        root = FakeRoot()
+        ready = []
+        decode = lambda path, width, height: Image.new("RGB", (width, height))
+        pipeline = decode_pipeline.DecodePipeline(root, decode, lambda *args: ready.append((args, threading.current_thread())), max_workers=4)
+        with unittest.mock.patch.object(decode_pipeline.ImageTk, "PhotoImage", lambda image: image.size):
+            for i in range(20):
+                pipeline.request(f"map{i}.png", 30, 20)
+            pipeline.request("map0.png", 30, 20) # already on its way
+            batches = []
+            while root.callbacks:
+                before = len(ready)
+                root.run_pending()
+                batches.append(len(ready) - before)
+                time.sleep(0.001)
+        pipeline.shutdown()
+
+        self.assertEqual(sorted(args[0] for args, _ in ready), sorted(f"map{i}.png" for i in range(20)))
+        self.assertTrue(all(args[1:] == (30, 20, (30, 20)) for args, _ in ready))
+        self.assertTrue(all(thread is threading.main_thread() for _, thread in ready))
+        self.assertLessEqual(max(batches), decode_pipeline.BATCH_SIZE)
+        self.assertEqual(pipeline.pending, {})
+
+    def test_failed_decode_is_delivered_as_none(self):
+        root = FakeRoot()
+        ready = []
+        def decode(path, width, height):
+            if path == "broken.png":
+                raise OSError("image file is truncated")
+            return Image.new("RGB", (width, height))
+        pipeline = decode_pipeline.DecodePipeline(root, decode, lambda *args: ready.append(args), max_workers=2)
+        with unittest.mock.patch.object(decode_pipeline.ImageTk, "PhotoImage", lambda image: image.size):
+            pipeline.request("broken.png", 30, 20)
+            pipeline.request("map.png", 30, 20)
+            while root.callbacks:
+                root.run_pending()
+                time.sleep(0.001)
+        pipeline.shutdown()
+
+        self.assertEqual(sorted(ready), [("broken.png", 30, 20, None), ("map.png", 30, 20, (30, 20))])
+        self.assertEqual(pipeline.pending, {})
+
+class FakePhotoImage:
+
+    def __init__(self, width: int, height: int):
+        self.size = (width, height)
+        self.fill = None
+
+    def put(self, colour: str, to: tuple):
+        self.fill = colour
+
+class TestMapGrid(unittest.TestCase):
+
+    def test_failed_image_shows_the_error_placeholder_and_loads_again_when_scrolled_back(self):
+        canvas = benchmarks.HeadlessCanvas(width=1100, height=720)
+        loaded = []
+        grid = map_grid.MapGrid(canvas, lambda path, width, height: loaded.append(path), print, 5, 100, 100, 10, 10)
+        with unittest.mock.patch.object(map_grid.tk, "PhotoImage", FakePhotoImage):
+            grid.set_paths([f"map{i}.png" for i in range(1000)])
+            grid.set_photo("map0.png", 100, 100, None)
+            grid.set_photo("map1.png", 100, 100, "photo")
+        self.assertEqual(grid.photos[grid.cells[0]].fill, map_grid.ERROR_COLOUR)
+        self.assertEqual(grid.photos[grid.cells[1]], "photo")
+        self.assertNotIn(0, grid.waiting) # no longer looks like it is loading
+        self.assertIs(grid.photos[grid.cells[2]], grid.placeholder())
+
+        canvas.yview_moveto(0.5)
+        grid.refresh()
+        canvas.yview_moveto(0)
+        grid.refresh()
+        self.assertEqual(loaded.count("map0.png"), 2) # decoded again once back in view
+
+    def test_new_paths_at_a_new_size_fill_the_view_once(self):
+        canvas = benchmarks.HeadlessCanvas(width=1100, height=720)
+        loaded, cancelled = [], []
+        grid = map_grid.MapGrid(canvas, lambda path, width, height: loaded.append((path, width)), print, 5, 100, 100, 10, 10,
+                                cancel_photo=lambda *args: cancelled.append(args))
+        with unittest.mock.patch.object(map_grid.tk, "PhotoImage", FakePhotoImage):
+            grid.set_paths([f"map{i}.png" for i in range(1000)])
+            loaded.clear()
+            cancelled.clear()
+            grid.set_paths([f"other{i}.png" for i in range(1000)], 4, 140, 140)
+        self.assertEqual(len(cancelled), 5 * (720 // 120 + 2)) # the old cells still waiting, nothing else
+        self.assertEqual(len(loaded), len(grid.cells))
+        self.assertTrue(all(path.startswith("other") and width == 140 for path, width in loaded))
+
+    def test_cells_are_canvas_items_moved_on_relayout_and_hit_tested_on_click(self):
+        canvas = benchmarks.HeadlessCanvas(width=1100, height=720)
+        clicked = []
+        grid = map_grid.MapGrid(canvas, lambda path, width, height: path, clicked.append, 2, 100, 100, 10, 10)
+        grid.set_paths([f"map{i}.png" for i in range(1000)])
+        self.assertEqual(len(grid.cells), 2 * (720 // 120 + 2)) # only the rows in view plus overscan
+        self.assertEqual(len(canvas.bindings), 1) # one click handler for every cell
+
+        canvas.click(grid.cells[5])
+        self.assertEqual(clicked, ["map5.png"])
+
+        grid.set_columns(4)
+        self.assertEqual(canvas.positions[grid.cells[5]], grid.cell_position(5)) # moved, not re-created
+        self.assertEqual(canvas.items, len(grid.cells) + len(grid.free_cells))
+
+        canvas.yview_moveto(0.5)
+        grid.refresh()
+        items = canvas.items
+        canvas.yview_moveto(0.7) # scrolled cells re-use their items for other maps
+        grid.refresh()
+        self.assertEqual(canvas.items, items)
+        index = min(grid.cells)
+        canvas.click(grid.cells[index])
+        self.assertEqual(clicked[-1], f"map{index}.png")
+
+    def test_only_rows_in_view_get_items_and_scrolling_recycles_them(self):
+        canvas = benchmarks.HeadlessCanvas(width=1100, height=720)
+        loaded = []
+        grid = map_grid.MapGrid(canvas, lambda path, width, height: loaded.append(path) or path, print, 5, 100, 100, 10, 10)
+        grid.set_paths([f"map{i}.png" for i in range(10000)])
+        in_view = 5 * (720 // 120 + 2) # the rows in view plus overscan below, nothing above the first row
+        self.assertEqual(len(grid.cells), in_view)
+        self.assertEqual(len(loaded), in_view)
+
+        for step in range(1, 101): # scroll through the whole grid
+            canvas.yview_moveto(step / 100)
+            grid.refresh()
+            self.assertLessEqual(len(grid.cells), 5 * (720 // 120 + 3))
+            self.assertEqual(sorted(grid.cells), list(grid.visible_range()))
+        self.assertLessEqual(canvas.items, 5 * (720 // 120 + 3)) # items were re-used, not created per map
+        self.assertEqual(len(grid.cells) + len(grid.free_cells), canvas.items)
+        self.assertLessEqual(len(loaded), 101 * 5 * (720 // 120 + 3)) # only the rows in view at each step were loaded
+        self.assertLess(len(set(loaded)), 10000 // 2)
+
+    def test_column_change_moves_existing_items_without_loading_them_again(self):
+        canvas = benchmarks.HeadlessCanvas(width=1100, height=720)
+        loaded = []
+        grid = map_grid.MapGrid(canvas, lambda path, width, height: loaded.append(path) or path, print, 4, 100, 100, 10, 10)
+        grid.set_paths([f"map{i}.png" for i in range(1000)])
+        items = dict(grid.cells)
+        loaded.clear()
+        moves = canvas.moves
+
+        grid.set_columns(2)
+        for index, item in grid.cells.items():
+            if index in items:
+                self.assertEqual(item, items[index]) # the same item, moved
+            self.assertEqual(canvas.positions[item], grid.cell_position(index))
+        self.assertGreaterEqual(canvas.moves - moves, len(items))
+        self.assertEqual(loaded, []) # fewer maps fit in 2 columns, every one already had its image
+        self.assertEqual(canvas.items, len(items)) # no new item
+
+class TestRenderScheduler(unittest.TestCase):
+
+    def test_slider_drag_renders_once_with_the_newest_state(self):
+        root = FakeRoot()
+        renders, stale, painted = [], [], []
+        scheduler = render_scheduler.RenderScheduler(root, renders.append, stale.append, on_painted=painted.append)
+        tracer = perf_trace.Tracer()
+        tracer.enable()
+
+        for size in range(100, 1001, 10): # dragging the image size slider
+            scheduler.request(image_size=size)
+        scheduler.request(cols=3)
+        self.assertEqual(renders, [])
+        self.assertEqual(len(stale), 92) # work for older sizes can be stopped at once
+
+        with unittest.mock.patch.object(perf_trace, "tracer", tracer):
+            while root.run_pending():
+                pass
+        self.assertEqual(renders, [{"image_size": 1000, "cols": 3}])
+        self.assertEqual(scheduler.stats()["coalesced"], 91)
+        self.assertEqual(painted, [scheduler.stats()["latency_ms"]])
+        self.assertEqual(tracer.span_stats("render.input_to_paint")[0], 1)
+
+@unittest.skipUnless(image_similarity, "image_similarity needs numpy")
+class TestImageSimilarity(unittest.TestCase):
+
+    def test_similar_maps_and_terrain_queries(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            def save_map(name, terrain, island_terrain, island):
+                image = Image.new("RGB", (288, 288), image_similarity.TERRAIN_COLOURS[terrain])
+                image.paste(image_similarity.TERRAIN_COLOURS[island_terrain], island)
+                image.save(os.path.join(temp_dir, f"{name}_map_auto.png"))
+            save_map("Islands", "water", "grass", (40, 40, 140, 140))
+            save_map("More_Islands", "water", "grass", (50, 50, 150, 150))
+            save_map("Volcano", "lava", "water", (0, 0, 100, 200))
+            save_map("Meadow", "grass", "sand", (100, 100, 250, 250))
+
+            index = image_similarity.FeatureIndex(temp_dir)
+            self.assertEqual(index.update(), 4)
+            self.assertEqual(index.similar_to("Islands_map_auto.png", 2), ["Islands_map_auto.png", "More_Islands_map_auto.png"])
+            self.assertEqual(index.terrain_query({"lava": 1}, 1), ["Volcano_map_auto.png"])
+            self.assertGreater(index.ratios("Islands_map_auto.png")["water"], 0.8)
+
+            # saved features are re-used, only changed and deleted maps are looked at again
+            os.remove(os.path.join(temp_dir, "Meadow_map_auto.png"))
+            index = image_similarity.FeatureIndex(temp_dir)
+            with unittest.mock.patch.object(image_similarity, "image_features") as image_features:
+                self.assertEqual(index.update(), 0)
+                image_features.assert_not_called()
+            self.assertEqual(sorted(index.filenames), ["Islands_map_auto.png", "More_Islands_map_auto.png", "Volcano_map_auto.png"])
+
 if __name__ == '__main__':
     unittest.main()
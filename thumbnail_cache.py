@@ -0,0 +1,92 @@
+# /thumbnail_cache.py
+
+import os
+import hashlib
+from PIL import Image
+from image_decode import decode_resized
+import perf_trace
+
+THUMBNAIL_CACHE_DIRNAME: str = "thumbnail_cache"
+
+def default_cache_dir(map_images_dir: str) -> str:
+    """
+    Thumbnail cache folder, kept next to the map images folder e.g. assets/thumbnail_cache
+
+    Args:
+        map_images_dir (str): folder path for map images
+
+    Returns:
+        str: folder path for cached thumbnails
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(map_images_dir)), THUMBNAIL_CACHE_DIRNAME)
+
+def thumbnail_path(path: str, width: int, height: int, cache_dir: str) -> str:
+    """
+    Where the thumbnail of an image is cached. Every source image gets its own folder and every
+    thumbnail name holds the source's mtime and size, so a changed source never matches an old thumbnail
+
+    Args:
+        path (str): source image path
+        width (int): thumbnail width
+        height (int): thumbnail height
+        cache_dir (str): folder path for cached thumbnails
+
+    Returns:
+        str: thumbnail path
+    """
+    stat = os.stat(path)
+    source_key: str = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    version_key: str = hashlib.sha1(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, source_key, f"{width}x{height}_{version_key}.png")
+
+def load_thumbnail(path: str, width: int, height: int, cache_dir: str) -> Image.Image:
+    """
+    Load an image resized to width x height, decoding the small cached thumbnail when there is one and
+    otherwise decoding the full image once, within the decode memory budget, and caching its thumbnail for next time
+
+    Args:
+        path (str): source image path
+        width (int): thumbnail width
+        height (int): thumbnail height
+        cache_dir (str): folder path for cached thumbnails
+
+    Returns:
+        Image: the resized image
+    """
+    cached_path: str = thumbnail_path(path, width, height, cache_dir)
+    try:
+        with Image.open(cached_path) as cached:
+            cached.load()
+            perf_trace.count("thumbnail_cache.hit")
+            return cached
+    except (OSError, ValueError):
+        pass # not cached yet or unreadable, make it again
+
+    perf_trace.count("thumbnail_cache.miss")
+    with perf_trace.span("thumbnail.decode", path=os.path.basename(path), width=width, height=height):
+        thumbnail = decode_resized(path, width, height)
+    save_thumbnail(thumbnail, cached_path)
+    return thumbnail
+
+def save_thumbnail(thumbnail: Image.Image, cached_path: str):
+    """
+    Write a thumbnail to the cache and remove thumbnails of older versions of the same source at the same size
+
+    Args:
+        thumbnail (Image): resized image
+        cached_path (str): path from thumbnail_path
+
+    Returns:
+        None
+    """
+    source_dir, filename = os.path.split(cached_path)
+    size_prefix: str = filename.split("_")[0] + "_"
+    try:
+        os.makedirs(source_dir, exist_ok=True)
+        for stale in os.listdir(source_dir):
+            if stale.startswith(size_prefix) and stale != filename:
+                os.remove(os.path.join(source_dir, stale))
+        thumbnail.save(cached_path + ".tmp", format="PNG", compress_level=1) # fast to write and to decode
+        os.replace(cached_path + ".tmp", cached_path)
+    except OSError as e:
+        print(f"Could not cache thumbnail {cached_path}: {str(e)}")